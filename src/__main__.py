@@ -1,18 +1,46 @@
 import asyncio
+import functools
 import logging
+import signal
+from multiprocessing.connection import Connection
+from typing import List, Optional, Set
 
 import asyncpg
 from aiogram import Bot, Dispatcher
 from aiogram.types import BotCommand, BotCommandScopeChat
 
-from src.config import BOT_TOKEN, DB_CONFIG
-from src.database import init_db
+from src.config import (
+    DB_CONFIG, DB_POOL_MAX_SIZE, DB_POOL_MIN_SIZE, FSM_MAX_ENTRIES, FSM_TTL, HEALTH_HOST,
+    HEALTH_PORT, NOTIFY_DIGEST_INTERVAL, NOTIFY_RATE_LIMIT, PROFILE_DIR, PROFILE_SECONDS,
+    RECORD_UPDATES_FILE, REPLICA_DB_CONFIG, REQUESTS_PARTITIONS_AHEAD, REQUESTS_RETENTION_DROP,
+    REQUESTS_RETENTION_MONTHS, ROLLUP_INTERVAL, SLOW_UPDATE_THRESHOLD, TRACING_FILE, TRACING_SAMPLE_RATE,
+    WORKER_QUEUE_SIZE, WORKERS
+)
+from src.bots import load_bot_profiles
+from src.broadcasts import BroadcastScheduler
+from src.database import create_unnotified_index, get_admin_ids, get_replica_status, init_db, set_replica_pool
+from src.health import HealthMonitor
+from src.dispatcher import setup_dispatcher
 from src.handlers.admin_handlers import router as admin_router
 from src.handlers.user_handlers import router as user_router
-from src.middlewares.db_pool_middleware import DbPoolMiddleware
-from src.middlewares.db_connection_middleware import DbConnectionMiddleware
-from src.middlewares.error_handler import ErrorHandlingMiddleware
-from aiogram.utils.callback_answer import CallbackAnswerMiddleware
+from src.middlewares.bot_context_middleware import BotContextMiddleware
+from src.middlewares.health_middleware import HealthMiddleware, HealthRequestMiddleware
+from src.middlewares.recorder_middleware import RecorderMiddleware, record_raw_update
+from src.middlewares.slow_update_middleware import SlowUpdateMiddleware, SlowUpdateRequestMiddleware
+from src.middlewares.tracing_middleware import (
+    TracingHandlerMiddleware, TracingMiddleware, TracingRequestMiddleware
+)
+from src.notifications import AdminNotifier
+from src.partitions import run_partition_maintenance, setup_request_partitions
+from src.rollups import run_rollups
+from src.utils.fsm_storage import BoundedMemoryStorage
+from src.utils.profiling import SamplingProfiler, record_query
+from src.utils.recording import UpdateRecorder
+from src.utils.tracing import Tracer
+from src.workers import (
+    MERGED_SECTIONS, WorkerPool, consume_updates, poll_updates, report_stats, run_bot_worker, worker_path,
+    worker_pool_size
+)
 
 
 logging.basicConfig(
@@ -22,57 +50,304 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher()
+# Все боты работают в одном цикле событий с общим пулом БД и общими роутерами
+bot_profiles = {profile.bot_id: profile for profile in load_bot_profiles()}
+bots = [Bot(token=profile.token) for profile in bot_profiles.values()]
+fsm_storage = BoundedMemoryStorage(ttl=FSM_TTL, max_entries=FSM_MAX_ENTRIES)
+dp = Dispatcher(storage=fsm_storage)
+tracer = Tracer(TRACING_FILE, TRACING_SAMPLE_RATE)
+profiler = SamplingProfiler(PROFILE_DIR)
+dp["profiler"] = profiler
+PARTITION_SETTINGS = (REQUESTS_PARTITIONS_AHEAD, REQUESTS_RETENTION_MONTHS, REQUESTS_RETENTION_DROP)
 
 
-async def main():
-    """Основная функция запуска бота"""
-    try:
-        pool = await asyncpg.create_pool(**DB_CONFIG)
-        logger.info("Подключение к базе данных установлено")
-        
-        # Подключаем middleware для передачи пула
-        dp.update.middleware(DbPoolMiddleware(pool))
-        dp.update.middleware(DbConnectionMiddleware(pool))
-        dp.update.middleware(ErrorHandlingMiddleware())
-        dp.callback_query.middleware(CallbackAnswerMiddleware())
+async def _init_connection(conn: asyncpg.Connection):
+    """Настройка нового соединения пула"""
+    if tracer.enabled:
+        conn.add_query_logger(tracer.query_logger)
+    if SLOW_UPDATE_THRESHOLD > 0:
+        conn.add_query_logger(record_query)
 
-        dp.include_router(user_router)
-        dp.include_router(admin_router)
 
-        async with pool.acquire() as conn:
-            await init_db(conn)
+async def _prepare_database(pool: asyncpg.Pool) -> Set[int]:
+    """Схема БД, партиции заявок и команды ботов (один раз при запуске); возвращает ID админов"""
+    async with pool.acquire() as conn:
+        # Данные, сохранённые до перехода на несколько ботов, достаются первому боту
+        await init_db(conn, bots[0].id)
+        await setup_request_partitions(conn, *PARTITION_SETTINGS)
+        await create_unnotified_index(conn)
+        admin_ids = await conn.fetch("SELECT user_id FROM admins")
+        all_admin_ids = await get_admin_ids(conn)
 
+    for bot in bots:
         # Устанавливаем команды только для обычных пользователей
         await bot.set_my_commands([
             BotCommand(command="start", description="Запустить бота")
         ])
-        
+
         # Устанавливаем команды для админов
-        async with pool.acquire() as conn:
-            admin_ids = await conn.fetch("SELECT user_id FROM admins")
-            for admin_row in admin_ids:
-                try:
-                    await bot.set_my_commands([
-                        BotCommand(command="start", description="Запустить бота"),
-                        BotCommand(command="admin", description="Админка")
-                    ], scope=BotCommandScopeChat(chat_id=admin_row['user_id']))
-                except Exception as e:
-                    logger.warning(f"Не удалось установить команды для админа {admin_row['user_id']}: {e}")
-        logger.info("Бот запущен и готов к работе")
-
-        await dp.start_polling(bot)
+        for admin_row in admin_ids:
+            try:
+                await bot.set_my_commands([
+                    BotCommand(command="start", description="Запустить бота"),
+                    BotCommand(command="admin", description="Админка")
+                ], scope=BotCommandScopeChat(chat_id=admin_row['user_id']))
+            except Exception as e:
+                logger.warning(f"Не удалось установить команды для админа {admin_row['user_id']}: {e}")
+    return all_admin_ids
+
+
+def _start_maintenance(pool: asyncpg.Pool, health: HealthMonitor) -> List[asyncio.Task]:
+    """Фоновое обслуживание БД: почасовая аналитика и партиции заявок"""
+    rollups_task = asyncio.create_task(run_rollups(pool, ROLLUP_INTERVAL))
+    partitions_task = asyncio.create_task(run_partition_maintenance(pool, *PARTITION_SETTINGS))
+    health.register_task("rollups", rollups_task)
+    health.register_task("partitions", partitions_task)
+    return [rollups_task, partitions_task]
+
+
+async def main(worker_index: Optional[int] = None, updates: Optional[Connection] = None,
+               reports: Optional[Connection] = None):
+    """Основная функция запуска бота.
+
+    С `updates` процесс работает обработчиком в многопроцессном режиме:
+    апдейты приходят от процесса приёма (см. intake), а подготовку БД,
+    фоновое обслуживание, журнал апдейтов и эндпоинт здоровья берёт на себя он;
+    свои метрики обработчик отправляет ему в `reports`.
+    """
+    is_worker = updates is not None
+    # Общий предел соединений делится между обработчиками
+    pool_max_size = worker_pool_size(DB_POOL_MAX_SIZE, WORKERS) if is_worker else DB_POOL_MAX_SIZE
+    try:
+        pool = await asyncpg.create_pool(
+            **DB_CONFIG, min_size=min(DB_POOL_MIN_SIZE, pool_max_size), max_size=pool_max_size,
+            init=_init_connection
+        )
+        logger.info("Подключение к базе данных установлено")
+
+        if REPLICA_DB_CONFIG:
+            # min_size=0: недоступная при старте реплика не мешает запуску
+            replica_pool = await asyncpg.create_pool(
+                **REPLICA_DB_CONFIG, min_size=0, max_size=pool_max_size, init=_init_connection
+            )
+            set_replica_pool(replica_pool)
+            logger.info(f"Чтения для отчётов направляются на реплику {REPLICA_DB_CONFIG['host']}")
+
+        if not is_worker:
+            admin_ids = await _prepare_database(pool)
+
+        if RECORD_UPDATES_FILE and not is_worker:
+            # Первой: в журнал попадают все апдейты, включая отброшенные при перегрузке
+            recorder = UpdateRecorder(RECORD_UPDATES_FILE)
+            dp.update.middleware(RecorderMiddleware(recorder, admin_ids))
+            logger.info(f"Запись апдейтов включена: {RECORD_UPDATES_FILE}")
+
+        if tracer.enabled:
+            dp.update.middleware(TracingMiddleware(tracer))
+            dp.message.middleware(TracingHandlerMiddleware(tracer))
+            dp.callback_query.middleware(TracingHandlerMiddleware(tracer))
+            for bot in bots:
+                bot.session.middleware(TracingRequestMiddleware(tracer))
+            logger.info(f"Трейсинг включён: {tracer.path}, доля апдейтов {TRACING_SAMPLE_RATE}")
+
+        if SLOW_UPDATE_THRESHOLD > 0:
+            slow_update_middleware = SlowUpdateMiddleware(SLOW_UPDATE_THRESHOLD)
+            dp.update.middleware(slow_update_middleware)
+            dp.message.middleware(slow_update_middleware)
+            dp.callback_query.middleware(slow_update_middleware)
+            for bot in bots:
+                bot.session.middleware(SlowUpdateRequestMiddleware())
+
+        # SIGUSR1 включает профилирование без участия админа
+        if hasattr(signal, "SIGUSR1"):
+            asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, profiler.start, PROFILE_SECONDS)
+
+        # Проверка готовности идёт через отдельное соединение, в обработчиках её выполняет процесс приёма
+        probe_pool = await asyncpg.create_pool(**DB_CONFIG, min_size=1, max_size=1) if not is_worker else None
+        health = HealthMonitor(pool, probe_pool=probe_pool)
+        dp["health"] = health
+        scheduler = BroadcastScheduler(bots, pool, health)
+        dp["scheduler"] = scheduler
+        # Лимит Telegram действует на чат админов целиком, поэтому обработчики делят его между собой
+        notify_rate_limit = max(1, NOTIFY_RATE_LIMIT // WORKERS) if is_worker else NOTIFY_RATE_LIMIT
+        # Неотправленные уведомления ищет в БД тот обработчик, которому достаются апдейты чата заявителя
+        notifiers = {
+            bot.id: AdminNotifier(
+                bot, bot_profiles[bot.id].admin_chat_id, notify_rate_limit, NOTIFY_DIGEST_INTERVAL, pool=pool,
+                shard=worker_index or 0, shards=WORKERS if is_worker else 1
+            )
+            for bot in bots
+        }
+        dp.update.middleware(HealthMiddleware(health))
+        if not is_worker:
+            for bot in bots:
+                bot.session.middleware(HealthRequestMiddleware(health))
+
+        bot_context = BotContextMiddleware(bot_profiles, notifiers)
+        chat_queue = setup_dispatcher(dp, pool, bot_context, tracer if tracer.enabled else None)
+        health.add_stats_provider("updates", chat_queue.stats)
+        health.add_stats_provider("replica", get_replica_status)
+        health.add_stats_provider("fsm", fsm_storage.stats)
+        health.add_stats_provider("bots", bot_context.stats)
+
+        if not is_worker:
+            maintenance_tasks = _start_maintenance(pool, health)
+        # Расписания захватываются через SKIP LOCKED, поэтому планировщик работает в каждом обработчике
+        scheduler_task = asyncio.create_task(scheduler.run())
+        health.register_task("scheduler", scheduler_task)
+        # Уведомления, не отправленные до остановки или падения; дальше их ищет rescan
+        for notifier in notifiers.values():
+            await notifier.restore()
+        notifier_tasks = {bot_id: asyncio.create_task(notifier.run()) for bot_id, notifier in notifiers.items()}
+        for bot_id, notifier_task in notifier_tasks.items():
+            health.register_task(f"notifier_{bot_id}", notifier_task)
+        rescan_tasks = {bot_id: asyncio.create_task(notifier.rescan()) for bot_id, notifier in notifiers.items()}
+        for bot_id, rescan_task in rescan_tasks.items():
+            health.register_task(f"notifier_rescan_{bot_id}", rescan_task)
+
+        if is_worker:
+            report_task = asyncio.create_task(report_stats(health.snapshot, reports))
+            logger.info(f"Обработчик апдейтов {worker_index} готов к работе")
+            await consume_updates(dp, {bot.id: bot for bot in bots}, updates)
+            return
+
+        if HEALTH_PORT:
+            health_runner = await health.start_server(HEALTH_HOST, HEALTH_PORT)
+        logger.info(f"Боты запущены и готовы к работе: {', '.join(str(bot.id) for bot in bots)}")
+
+        await dp.start_polling(*bots)
+    except Exception as e:
+        logger.error(f"Критическая ошибка при запуске бота: {e}")
+        raise
+    finally:
+        for task in locals().get('maintenance_tasks', []):
+            task.cancel()
+        if 'scheduler_task' in locals():
+            scheduler_task.cancel()
+        if 'report_task' in locals():
+            report_task.cancel()
+        for rescan_task in locals().get('rescan_tasks', {}).values():
+            rescan_task.cancel()
+        if 'notifier_tasks' in locals():
+            # Неотправленные уведомления о заявках уходят сводками до закрытия сессий
+            for notifier_task in notifier_tasks.values():
+                notifier_task.cancel()
+            await asyncio.gather(*notifier_tasks.values(), return_exceptions=True)
+            for notifier in notifiers.values():
+                await notifier.flush()
+        if 'health_runner' in locals():
+            await health_runner.cleanup()
+        if 'replica_pool' in locals():
+            set_replica_pool(None)
+            await replica_pool.close()
+        if locals().get('probe_pool'):
+            await probe_pool.close()
+        if 'pool' in locals():
+            await pool.close()
+            logger.info("Соединение с базой данных закрыто")
+        if 'recorder' in locals():
+            recorder.close()
+        for bot in bots:
+            await bot.session.close()
+        logger.info("Сессии ботов закрыты")
+        tracer.close()
+
+
+def run_worker(index: int, updates: Connection, reports: Connection):
+    """Процесс-обработчик многопроцессного режима (запускается через src.workers.run_bot_worker)"""
+    global tracer
+    # Остановкой управляет процесс приёма: Ctrl+C и SIGTERM от systemd получает вся группа процессов,
+    # а обработчик должен сначала доработать переданные ему апдейты
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    tracer = Tracer(worker_path(TRACING_FILE, index), TRACING_SAMPLE_RATE)
+    asyncio.run(main(index, updates, reports))
+
+
+async def intake():
+    """Многопроцессный режим: приём апдейтов и раздача их WORKERS процессам-обработчикам.
+
+    Процесс приёма только читает getUpdates и распределяет сырые апдейты по
+    chat_id, поэтому разбор и обработка масштабируются на ядра. Здесь же
+    подготовка БД, фоновое обслуживание, журнал апдейтов и эндпоинт здоровья;
+    рассылки и уведомления отправляют обработчики.
+    """
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    try:
+        # Небольшой пул: подготовка БД и фоновое обслуживание; для проверки готовности — свой
+        pool = await asyncpg.create_pool(**DB_CONFIG, min_size=1, max_size=3)
+        probe_pool = await asyncpg.create_pool(**DB_CONFIG, min_size=1, max_size=1)
+        logger.info("Подключение к базе данных установлено")
+        health = HealthMonitor(pool, probe_pool=probe_pool)
+        admin_ids = await _prepare_database(pool)
+        maintenance_tasks = _start_maintenance(pool, health)
+
+        workers = WorkerPool(WORKERS, run_bot_worker, queue_size=WORKER_QUEUE_SIZE)
+        workers.start()
+        supervisor_task = asyncio.create_task(workers.supervise())
+        health.register_task("supervisor", supervisor_task)
+        health.add_stats_provider("workers", workers.stats)
+        # Метрики ботов, очередей, FSM и рассылок живут в обработчиках и приходят оттуда отчётами
+        for section in MERGED_SECTIONS:
+            health.add_stats_provider(section, functools.partial(workers.merged_section, section))
+        health.add_readiness_check("workers", lambda: workers.alive() > 0)
+        # SIGUSR1 включает профилирование во всех обработчиках
+        if hasattr(signal, "SIGUSR1"):
+            loop.add_signal_handler(signal.SIGUSR1, workers.signal, signal.SIGUSR1)
+
+        recorder = UpdateRecorder(RECORD_UPDATES_FILE) if RECORD_UPDATES_FILE else None
+        if recorder:
+            logger.info(f"Запись апдейтов включена: {RECORD_UPDATES_FILE}")
+
+        def on_update(update: dict):
+            health.mark_update()
+            if recorder:
+                record_raw_update(recorder, update, admin_ids)
+
+        allowed_updates = sorted(
+            set(user_router.resolve_used_update_types()) | set(admin_router.resolve_used_update_types())
+        )
+        polling_tasks = [
+            asyncio.create_task(poll_updates(bot, workers, allowed_updates, on_update, health.mark_polling))
+            for bot in bots
+        ]
+        for bot, polling_task in zip(bots, polling_tasks):
+            health.register_task(f"polling_{bot.id}", polling_task)
+        if HEALTH_PORT:
+            health_runner = await health.start_server(HEALTH_HOST, HEALTH_PORT)
+        logger.info(f"Боты запущены: {', '.join(str(bot.id) for bot in bots)}, обработчиков апдейтов: {WORKERS}")
+
+        await stop.wait()
+        logger.info("Остановка: прекращаем приём апдейтов")
     except Exception as e:
         logger.error(f"Критическая ошибка при запуске бота: {e}")
         raise
     finally:
+        for task in locals().get('polling_tasks', []):
+            task.cancel()
+        await asyncio.gather(*locals().get('polling_tasks', []), return_exceptions=True)
+        if 'workers' in locals():
+            # Обработчики дорабатывают полученные апдейты и отправляют уведомления из очереди
+            await workers.stop()
+            supervisor_task.cancel()
+        for task in locals().get('maintenance_tasks', []):
+            task.cancel()
+        if 'health_runner' in locals():
+            await health_runner.cleanup()
+        if locals().get('probe_pool'):
+            await probe_pool.close()
         if 'pool' in locals():
             await pool.close()
             logger.info("Соединение с базой данных закрыто")
-        await bot.session.close()
-        logger.info("Сессия бота закрыта")
+        if locals().get('recorder'):
+            recorder.close()
+        for bot in bots:
+            await bot.session.close()
+        logger.info("Сессии ботов закрыты")
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(intake() if WORKERS > 0 else main())
\ No newline at end of file
@@ -0,0 +1,55 @@
+import json
+from typing import List, Optional
+
+from src.config import ADMIN_CHAT_ID, BOT_TOKEN, BOTS_FILE, COMPANY_INFO, COMPANY_LOGO, CONTACTS_INFO
+
+
+class BotProfile:
+    """Настройки одного бота: токен, чат админов и тексты «О нас» и «Контакты»"""
+
+    __slots__ = ("token", "admin_chat_id", "company_info", "contacts_info", "logo")
+
+    def __init__(self, token: str, admin_chat_id: Optional[int], company_info: str, contacts_info: str,
+                 logo: Optional[str]):
+        self.token = token
+        self.admin_chat_id = admin_chat_id
+        self.company_info = company_info
+        self.contacts_info = contacts_info
+        self.logo = logo
+
+    @property
+    def bot_id(self) -> int:
+        """ID бота — часть токена до двоеточия (совпадает с Bot.id)"""
+        return int(self.token.split(":", 1)[0])
+
+
+def load_bot_profiles(path: Optional[str] = BOTS_FILE) -> List[BotProfile]:
+    """Профили ботов из JSON-файла `path` или один бот из переменных окружения.
+
+    Незаданные в файле тексты и логотип берутся из src.config; `logo: null`
+    отключает логотип.
+    """
+    if not path:
+        return [BotProfile(BOT_TOKEN, ADMIN_CHAT_ID, COMPANY_INFO, CONTACTS_INFO, COMPANY_LOGO)]
+
+    with open(path, encoding="utf-8") as f:
+        items = json.load(f)
+    if not isinstance(items, list) or not items:
+        raise ValueError(f"{path}: ожидается непустой список ботов")
+
+    profiles = []
+    for index, item in enumerate(items):
+        if not item.get("token"):
+            raise ValueError(f"{path}: у бота №{index + 1} не указан token")
+        admin_chat_id = item.get("admin_chat_id")
+        profiles.append(BotProfile(
+            token=item["token"],
+            admin_chat_id=int(admin_chat_id) if admin_chat_id is not None else None,
+            company_info=item.get("company_info", COMPANY_INFO),
+            contacts_info=item.get("contacts_info", CONTACTS_INFO),
+            logo=item.get("logo", COMPANY_LOGO),
+        ))
+    bot_ids = [profile.bot_id for profile in profiles]
+    if len(set(bot_ids)) != len(bot_ids):
+        raise ValueError(f"{path}: токены ботов повторяются")
+    return profiles
@@ -0,0 +1,213 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple, Union
+
+import asyncpg
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+from src.database import (
+    claim_due_schedule, create_broadcast, deactivate_users, finish_schedule_run, get_active_user_ids,
+    get_delivered_user_ids, get_next_schedule_time, save_deliveries, touch_schedule_run
+)
+from src.health import HealthMonitor
+
+
+logger = logging.getLogger(__name__)
+
+# Сколько результатов доставки копить перед записью в БД
+DELIVERIES_BATCH_SIZE = 100
+# Сколько раз повторять отправку пользователю после 429
+RETRY_AFTER_ATTEMPTS = 5
+
+
+async def _copy_broadcast(bot: Bot, user_id: int, broadcast_data: dict):
+    """Копирование сообщения (или альбома) рассылки пользователю"""
+    if len(broadcast_data["message_ids"]) > 1:
+        await bot.copy_messages(
+            chat_id=user_id,
+            from_chat_id=broadcast_data["from_chat_id"],
+            message_ids=broadcast_data["message_ids"]
+        )
+    else:
+        await bot.copy_message(
+            chat_id=user_id,
+            from_chat_id=broadcast_data["from_chat_id"],
+            message_id=broadcast_data["message_ids"][0]
+        )
+
+
+async def _deliver_broadcast(bot: Bot, user_id: int, broadcast_data: dict) -> Tuple[str, Optional[str]]:
+    """Доставка рассылки одному пользователю, возвращает (статус, ошибка).
+
+    На 429 ждёт retry_after и повторяет отправку тому же пользователю.
+    """
+    for attempt in range(1, RETRY_AFTER_ATTEMPTS + 1):
+        try:
+            await _copy_broadcast(bot, user_id, broadcast_data)
+            return "delivered", None
+        except TelegramRetryAfter as e:
+            if attempt == RETRY_AFTER_ATTEMPTS:
+                logger.error(f"Broadcast error to {user_id}: {e}")
+                return "failed", str(e)
+            logger.warning(f"Лимит Telegram при рассылке пользователю {user_id}, повтор через {e.retry_after} с")
+            await asyncio.sleep(e.retry_after)
+        except TelegramForbiddenError as e:
+            return "blocked", str(e)
+        except TelegramBadRequest as e:
+            if "chat not found" in str(e).lower():
+                return "blocked", str(e)
+            logger.error(f"Broadcast error to {user_id}: {e}")
+            return "failed", str(e)
+        except Exception as e:
+            logger.error(f"Broadcast error to {user_id}: {e}")
+            return "failed", str(e)
+
+
+async def send_broadcast(bot: Bot, conn: Union[asyncpg.Connection, asyncpg.Pool], admin_id: int,
+                         broadcast_data: dict, health: Optional[HealthMonitor] = None,
+                         broadcast_id: Optional[int] = None) -> Tuple[Dict[str, int], int]:
+    """Рассылка всем активным пользователям бота с записью результатов доставки.
+
+    `conn` может быть пулом: тогда соединение занимается только на время
+    запросов, а не на всю рассылку. С `broadcast_id` рассылка продолжается:
+    пользователи, результат доставки которым уже записан, пропускаются.
+    Возвращает счётчики delivered/blocked/failed и число получателей.
+    """
+    counts = {"delivered": 0, "blocked": 0, "failed": 0}
+    if broadcast_id is None:
+        broadcast_id = await create_broadcast(conn, bot.id, admin_id)
+        done = set()
+    else:
+        done = await get_delivered_user_ids(conn, broadcast_id)
+    try:
+        user_ids = [user_id for user_id in await get_active_user_ids(conn, bot.id) if user_id not in done]
+        deliveries, blocked_ids = [], []
+        if health:
+            health.broadcast_progress(broadcast_id, total=len(user_ids), **counts)
+        for user_id in user_ids:
+            status, error = await _deliver_broadcast(bot, user_id, broadcast_data)
+            counts[status] += 1
+            if health:
+                health.broadcast_progress(broadcast_id, **counts)
+            deliveries.append((user_id, status, error))
+            if status == "blocked":
+                blocked_ids.append(user_id)
+            if len(deliveries) >= DELIVERIES_BATCH_SIZE:
+                await save_deliveries(conn, broadcast_id, deliveries)
+                await deactivate_users(conn, bot.id, blocked_ids)
+                deliveries, blocked_ids = [], []
+        await save_deliveries(conn, broadcast_id, deliveries)
+        await deactivate_users(conn, bot.id, blocked_ids)
+        return counts, len(user_ids)
+    finally:
+        if health:
+            health.broadcast_finished(broadcast_id)
+
+
+def format_broadcast_result(counts: Dict[str, int], total: int) -> str:
+    """Итог рассылки для админа (Markdown)"""
+    return (
+        f"✅ *Рассылка завершена!*\n"
+        f"📤 Доставлено: {counts['delivered']}/{total}\n"
+        f"🚫 Заблокировали бота: {counts['blocked']}\n"
+        f"⚠️ Ошибки: {counts['failed']}"
+    )
+
+
+class BroadcastScheduler:
+    """Исполнитель запланированных рассылок.
+
+    Спит до ближайшего `next_run_at` (но не дольше `max_sleep`) и просыпается
+    раньше, если админ создал новое расписание. Запуск захватывается через
+    SELECT ... FOR UPDATE SKIP LOCKED (см. claim_due_schedule), поэтому
+    несколько копий бота не начнут его дважды. Пока рассылка идёт, захват
+    обновляется; если процесс упал, через `stale_after` запуск захватывает
+    другая копия и досылает рассылку тем, чья доставка ещё не записана.
+    Обслуживаются только расписания ботов из `bots`, рассылка уходит от
+    того бота, в котором её создали.
+    """
+
+    def __init__(self, bots: List[Bot], pool: asyncpg.Pool, health: Optional[HealthMonitor] = None,
+                 max_sleep: float = 300, stale_after: float = 600):
+        self.bots = {bot.id: bot for bot in bots}
+        self.pool = pool
+        self.health = health
+        self.max_sleep = max_sleep
+        self.stale_after = timedelta(seconds=stale_after)
+        self._wakeup = asyncio.Event()
+
+    def wake(self):
+        """Пересчитать время сна (после создания или удаления расписания)"""
+        self._wakeup.set()
+
+    async def run(self):
+        while True:
+            try:
+                while await self._run_due():
+                    pass
+                async with self.pool.acquire() as conn:
+                    next_run_at = await get_next_schedule_time(conn, list(self.bots), self.stale_after)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка планировщика рассылок: {e}")
+                next_run_at = None
+
+            delay = self.max_sleep
+            if next_run_at is not None:
+                delay = min(max((next_run_at - datetime.now()).total_seconds(), 0), self.max_sleep)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _heartbeat(self, schedule_id: int):
+        """Обновление захвата, пока идёт рассылка"""
+        while True:
+            await asyncio.sleep(self.stale_after.total_seconds() / 4)
+            try:
+                async with self.pool.acquire() as conn:
+                    await touch_schedule_run(conn, schedule_id, datetime.now())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Не удалось обновить захват расписания {schedule_id}: {e}")
+
+    async def _run_due(self) -> bool:
+        """Выполнение одного наступившего или брошенного запуска; False — выполнять нечего"""
+        now = datetime.now()
+        async with self.pool.acquire() as conn:
+            schedule = await claim_due_schedule(conn, now, list(self.bots), now - self.stale_after)
+        if schedule is None:
+            return False
+
+        bot = self.bots[schedule["bot_id"]]
+        action = "Продолжение" if schedule["resumed"] else "Запуск"
+        logger.info(f"{action} запланированной рассылки {schedule['id']} бота {bot.id}")
+        broadcast_data = {
+            "from_chat_id": schedule["from_chat_id"],
+            "message_ids": list(schedule["message_ids"]),
+        }
+        heartbeat = asyncio.create_task(self._heartbeat(schedule["id"]))
+        try:
+            # Пул вместо соединения: соединение не занято, пока идёт отправка
+            counts, total = await send_broadcast(
+                bot, self.pool, schedule["admin_id"], broadcast_data, self.health, schedule["broadcast_id"]
+            )
+        finally:
+            heartbeat.cancel()
+        async with self.pool.acquire() as conn:
+            await finish_schedule_run(conn, schedule["id"], datetime.now())
+
+        try:
+            await bot.send_message(
+                schedule["admin_id"],
+                f"🕒 Запланированная рассылка №{schedule['id']}\n\n{format_broadcast_result(counts, total)}",
+                parse_mode="Markdown"
+            )
+        except Exception as e:
+            logger.error(f"Не удалось отправить итог рассылки админу {schedule['admin_id']}: {e}")
+        return True
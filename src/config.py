@@ -6,7 +6,13 @@ from dotenv import load_dotenv
 load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
-if not BOT_TOKEN:
+
+# Несколько ботов в одном процессе: путь к JSON-файлу со списком ботов
+# (token, admin_chat_id, company_info, contacts_info, logo). Если не задан,
+# запускается один бот с BOT_TOKEN, ADMIN_CHAT_ID и текстами ниже
+BOTS_FILE = os.getenv("BOTS_FILE", "").strip() or None
+
+if not BOT_TOKEN and not BOTS_FILE:
     raise ValueError("BOT_TOKEN не найден в переменных окружения")
 
 DB_CONFIG = {
@@ -21,6 +27,62 @@ DB_CONFIG = {
 if not all([DB_CONFIG["database"], DB_CONFIG["user"], DB_CONFIG["password"]]):
     raise ValueError("Не все обязательные параметры БД указаны в переменных окружения")
 
+# Необязательная реплика для тяжёлых чтений (статистика, списки пользователей, рассылки).
+# Имя БД, пользователь и пароль по умолчанию совпадают с основной БД
+_replica_host = os.getenv("DB_REPLICA_HOST", "").strip()
+REPLICA_DB_CONFIG = {
+    "host": _replica_host,
+    "port": int(os.getenv("DB_REPLICA_PORT", "5432")),
+    "database": os.getenv("DB_REPLICA_NAME") or DB_CONFIG["database"],
+    "user": os.getenv("DB_REPLICA_USER") or DB_CONFIG["user"],
+    "password": os.getenv("DB_REPLICA_PASSWORD") or DB_CONFIG["password"]
+} if _replica_host else None
+
+# Размер пула соединений и ограничение одновременно обрабатываемых апдейтов
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+UPDATES_PER_CONNECTION = int(os.getenv("UPDATES_PER_CONNECTION", "2"))
+UPDATE_WAIT_TIMEOUT = float(os.getenv("UPDATE_WAIT_TIMEOUT", "5"))
+
+# Многопроцессный режим: WORKERS процессов-обработчиков (0 — всё в одном процессе).
+# Апдейты распределяются по процессам по chat_id, в очереди процесса не больше WORKER_QUEUE_SIZE
+WORKERS = int(os.getenv("WORKERS", "0"))
+WORKER_QUEUE_SIZE = int(os.getenv("WORKER_QUEUE_SIZE", "1000"))
+
+# FSM-хранилище в памяти: время жизни незавершённого диалога (секунды) и предел числа записей
+FSM_TTL = float(os.getenv("FSM_TTL", "86400"))
+FSM_MAX_ENTRIES = int(os.getenv("FSM_MAX_ENTRIES", "100000"))
+
+# Трейсинг апдейтов (OTLP/JSON в файл); пустой TRACING_FILE отключает трейсинг
+TRACING_FILE = os.getenv("TRACING_FILE", "").strip() or None
+TRACING_SAMPLE_RATE = float(os.getenv("TRACING_SAMPLE_RATE", "0.1"))
+
+# Порог медленного апдейта в секундах (0 — отключено) и каталог для профилей
+SLOW_UPDATE_THRESHOLD = float(os.getenv("SLOW_UPDATE_THRESHOLD", "2"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_SECONDS = int(os.getenv("PROFILE_SECONDS", "30"))
+
+# Период обновления почасовой аналитики заявок, секунды
+ROLLUP_INTERVAL = float(os.getenv("ROLLUP_INTERVAL", "60"))
+
+# Помесячные партиции requests: сколько месяцев создавать заранее и сколько полных
+# месяцев хранить (0 — бессрочно); устаревшие партиции отсоединяются или удаляются
+REQUESTS_PARTITIONS_AHEAD = int(os.getenv("REQUESTS_PARTITIONS_AHEAD", "3"))
+REQUESTS_RETENTION_MONTHS = int(os.getenv("REQUESTS_RETENTION_MONTHS", "0"))
+REQUESTS_RETENTION_DROP = os.getenv("REQUESTS_RETENTION_DROP", "false").lower() in ("1", "true", "yes")
+
+# HTTP-эндпоинт здоровья (/health/live, /health/ready); HEALTH_PORT=0 отключает
+HEALTH_HOST = os.getenv("HEALTH_HOST", "0.0.0.0")
+HEALTH_PORT = int(os.getenv("HEALTH_PORT", "8080"))
+
+# Запись входящих апдейтов (обезличенных) для повтора через `python -m src.replay`; пусто — отключено
+RECORD_UPDATES_FILE = os.getenv("RECORD_UPDATES_FILE", "").strip() or None
+
+# Уведомления о заявках: выше NOTIFY_RATE_LIMIT сообщений в минуту они объединяются
+# в сводки, отправляемые раз в NOTIFY_DIGEST_INTERVAL секунд
+NOTIFY_RATE_LIMIT = int(os.getenv("NOTIFY_RATE_LIMIT", "15"))
+NOTIFY_DIGEST_INTERVAL = float(os.getenv("NOTIFY_DIGEST_INTERVAL", "30"))
+
 _admin_chat_id_raw = os.getenv("ADMIN_CHAT_ID")
 ADMIN_CHAT_ID = int(_admin_chat_id_raw) if _admin_chat_id_raw else None
 
@@ -35,6 +97,13 @@ else:
     ADMIN_IDS = set()
 
 # Текстовые константы
+OPTION_NAMES = {
+    "equipment": "Оборудование",
+    "it": "IT-поддержка",
+    "cleaning": "Уборка",
+    "coffee": "Кофе"
+}
+
 COMPANY_INFO = """🌟 *О нас* 🌟
 
 Мы - *HOLIDAY Company*! 🚀
@@ -58,3 +127,5 @@ CONTACTS_INFO = """📞 *Наши контакты*
 🏢 *Адрес*: г. Казань, ул. Товарищеская, д. 31Б
 
 👇 Наш сайт:"""
+
+COMPANY_LOGO = "images/company_logo2.jpg"
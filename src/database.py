@@ -1,32 +1,269 @@
+import asyncio
+import functools
 import logging
-from typing import List, Optional, Tuple
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional, Set, Tuple
 
+import asyncpg
 from asyncpg import Connection
 from src.config import ADMIN_IDS
+from src.utils.cron import next_cron_time
 
 
 logger = logging.getLogger(__name__)
 
+# Пул реплики для тяжёлых чтений (None — все запросы идут в основную БД)
+_replica_pool: Optional[asyncpg.Pool] = None
+_replica_down_until = 0.0
+REPLICA_ACQUIRE_TIMEOUT = 2.0
+REPLICA_RETRY_AFTER = 30.0
 
-async def init_db(conn: Connection):
-    """Инициализация всех таблиц в БД"""
+_REPLICA_CONNECTION_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.exceptions.PostgresConnectionError,
+    asyncpg.exceptions.InterfaceError,
+)
+
+
+def set_replica_pool(pool: Optional[asyncpg.Pool]):
+    """Подключение пула реплики для функций, помеченных @replica_read"""
+    global _replica_pool
+    _replica_pool = pool
+
+
+def get_replica_status() -> dict:
+    """Состояние реплики для эндпоинта здоровья"""
+    down_for = max(_replica_down_until - time.monotonic(), 0)
+    return {"configured": _replica_pool is not None, "available": down_for == 0, "retry_in": round(down_for)}
+
+
+def replica_read(func):
+    """Выполнять запрос на реплике, если она настроена и доступна.
+
+    Переданное соединение основной БД используется как запасной вариант: при
+    ошибке подключения к реплике запрос повторяется на нём, а реплика
+    пропускается следующие REPLICA_RETRY_AFTER секунд. Помечать так можно
+    только чтения, которым не нужны только что сделанные записи.
+    """
+    @functools.wraps(func)
+    async def wrapper(conn: Connection, *args, **kwargs):
+        global _replica_down_until
+        if _replica_pool is None or time.monotonic() < _replica_down_until:
+            return await func(conn, *args, **kwargs)
+        try:
+            async with _replica_pool.acquire(timeout=REPLICA_ACQUIRE_TIMEOUT) as replica_conn:
+                return await func(replica_conn, *args, **kwargs)
+        except _REPLICA_CONNECTION_ERRORS as e:
+            _replica_down_until = time.monotonic() + REPLICA_RETRY_AFTER
+            logger.warning(f"Реплика недоступна, чтение {func.__name__} выполняется на основной БД: {e}")
+            return await func(conn, *args, **kwargs)
+    return wrapper
+
+
+async def create_index_concurrently(conn: Connection, name: str, table: str, columns: str, unique: bool = False):
+    """CREATE INDEX CONCURRENTLY, устойчивый к прерванной сборке.
+
+    Прерванная сборка оставляет индекс с indisvalid = false, который
+    IF NOT EXISTS молча принял бы за готовый: такой индекс удаляется и
+    строится заново. Вызывать вне транзакции.
+    """
+    valid = await conn.fetchval("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass($1)", name)
+    if valid:
+        return
+    if valid is not None:
+        logger.warning(f"Индекс {name} невалиден после прерванной сборки, строим заново")
+        await conn.execute(f"DROP INDEX CONCURRENTLY {name}")
+    await conn.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX CONCURRENTLY {name} ON {table} {columns}")
+
+
+# Таблицы, данные которых разделены по ботам (админы общие для всех ботов)
+BOT_SCOPED_TABLES = ("users", "requests", "broadcasts", "broadcast_schedules", "request_rollups")
+
+
+async def _primary_key(conn: Connection, table: str) -> Optional[str]:
+    return await conn.fetchval(
+        "SELECT pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = $1::regclass AND contype = 'p'", table
+    )
+
+
+async def _replace_primary_key(conn: Connection, table: str, columns: str):
+    """Новый первичный ключ `columns`: индекс строится CONCURRENTLY, замена ключа меняет только метаданные"""
+    if await _primary_key(conn, table) == f"PRIMARY KEY {columns}":
+        return
+    new_key = f"{table}_new_pkey"
+    await create_index_concurrently(conn, new_key, table, columns, unique=True)
+    async with conn.transaction():
+        await conn.execute(
+            f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {table}_pkey, "
+            f"ADD CONSTRAINT {new_key} PRIMARY KEY USING INDEX {new_key}"
+        )
+        await conn.execute(f"ALTER TABLE {table} RENAME CONSTRAINT {new_key} TO {table}_pkey")
+
+
+async def create_partitioned_index_concurrently(conn: Connection, name: str, table: str, columns: str):
+    """Индекс на секционированной таблице без блокировки записи.
+
+    Индекс создаётся на самой таблице (ON ONLY, мгновенно), на каждой
+    партиции строится CONCURRENTLY и присоединяется; индекс таблицы
+    становится валидным, когда присоединены все партиции. Индексы партиций
+    называются `<партиция>_<name без имени таблицы>`.
+    """
+    if await conn.fetchval("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass($1)", name):
+        return
+    await conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON ONLY {table} {columns}")
+    suffix = name[len(table) + 1:] if name.startswith(f"{table}_") else name
+    partitions = await conn.fetch('''
+        SELECT c.relname AS name, EXISTS (
+            SELECT 1 FROM pg_inherits ii
+            JOIN pg_index x ON x.indexrelid = ii.inhrelid
+            WHERE ii.inhparent = to_regclass($2) AND x.indrelid = c.oid
+        ) AS attached
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = $1::regclass
+    ''', table, name)
+    for partition in partitions:
+        if partition["attached"]:
+            continue
+        partition_index = f"{partition['name']}_{suffix}"
+        await create_index_concurrently(conn, partition_index, partition["name"], columns)
+        await conn.execute(f"ALTER INDEX {name} ATTACH PARTITION {partition_index}")
+
+
+async def _add_requests_user_fkey(conn: Connection, partitioned: bool):
+    """Внешний ключ requests (bot_id, user_id) -> users без блокировки записи.
+
+    Проверка ключа читает каждую строку requests (и ищет её в индексе users),
+    поэтому на большой таблице занимает время; VALIDATE CONSTRAINT при этом
+    держит SHARE UPDATE EXCLUSIVE, и запись в requests продолжается. На
+    секционированной таблице ключ добавляется и проверяется по партициям,
+    а ключ самой таблицы присоединяет уже проверенные без повторного чтения.
+    """
+    definition = "FOREIGN KEY (bot_id, user_id) REFERENCES users (bot_id, user_id)"
+    has_key = "SELECT EXISTS (SELECT 1 FROM pg_constraint WHERE conrelid = $1::regclass AND conname = $2)"
+    if await conn.fetchval(has_key, "requests", "requests_bot_id_user_id_fkey"):
+        return
+    tables = ["requests"]
+    if partitioned:
+        tables = [row["name"] for row in await conn.fetch(
+            "SELECT inhrelid::regclass::text AS name FROM pg_inherits WHERE inhparent = 'requests'::regclass"
+        )]
+    for table in tables:
+        constraint = f"{table}_bot_id_user_id_fkey"
+        if not await conn.fetchval(has_key, table, constraint):
+            await conn.execute(f"ALTER TABLE {table} ADD CONSTRAINT {constraint} {definition} NOT VALID")
+        await conn.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {constraint}")
+    if partitioned:
+        await conn.execute(f"ALTER TABLE requests ADD CONSTRAINT requests_bot_id_user_id_fkey {definition}")
+
+
+async def migrate_to_bot_ids(conn: Connection, default_bot_id: int):
+    """Перевод установки с одним ботом на схему с колонкой bot_id.
+
+    Существующие строки достаются боту `default_bot_id`. Колонка добавляется
+    с DEFAULT (без перезаписи таблиц), после чего DEFAULT снимается. Ключи
+    users и request_rollups, внешний ключ requests -> users и индекс заявок
+    пользователя становятся составными с bot_id; индексы строятся
+    CONCURRENTLY, ключи ставятся на готовые индексы, внешний ключ
+    проверяется без блокировки записи (см. _add_requests_user_fkey). Каждый
+    шаг проверяет, выполнен ли он, поэтому прерванная миграция продолжается
+    при следующем запуске. Вызывать вне транзакции.
+    """
+    if not await conn.fetchval("SELECT to_regclass('users') IS NOT NULL"):
+        return
+    migrated = await conn.fetchval('''
+        SELECT EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = 'users' AND column_name = 'bot_id'
+        ) AND EXISTS (
+            SELECT 1 FROM pg_constraint
+            WHERE conrelid = to_regclass('requests') AND conname = 'requests_bot_id_user_id_fkey'
+        )
+    ''')
+    if migrated:
+        return
+
+    logger.info(f"Добавление bot_id в таблицы, существующие данные относятся к боту {default_bot_id}")
+    async with conn.transaction():
+        for table in BOT_SCOPED_TABLES:
+            has_column = await conn.fetchval('''
+                SELECT EXISTS (
+                    SELECT 1 FROM information_schema.columns
+                    WHERE table_schema = current_schema() AND table_name = $1 AND column_name = 'bot_id'
+                )
+            ''', table)
+            if await conn.fetchval("SELECT to_regclass($1) IS NOT NULL", table) and not has_column:
+                await conn.execute(f"ALTER TABLE {table} ADD COLUMN bot_id BIGINT NOT NULL DEFAULT {int(default_bot_id)}")
+                await conn.execute(f"ALTER TABLE {table} ALTER COLUMN bot_id DROP DEFAULT")
+        # Старый внешний ключ опирается на первичный ключ users (user_id)
+        await conn.execute("ALTER TABLE requests DROP CONSTRAINT IF EXISTS requests_user_id_fkey")
+
+    await _replace_primary_key(conn, "users", "(bot_id, user_id)")
+    if await conn.fetchval("SELECT to_regclass('request_rollups') IS NOT NULL"):
+        await _replace_primary_key(conn, "request_rollups", "(bot_id, hour, request_type, option)")
+
+    partitioned = await conn.fetchval("SELECT relkind = 'p' FROM pg_class WHERE oid = 'requests'::regclass")
+    columns = "(bot_id, user_id, created_at DESC, id DESC)"
+    if partitioned:
+        await create_partitioned_index_concurrently(conn, "requests_bot_user_created_idx", "requests", columns)
+        await conn.execute("DROP INDEX IF EXISTS requests_user_created_idx")
+    else:
+        await create_index_concurrently(conn, "requests_bot_user_created_idx", "requests", columns)
+        await conn.execute("DROP INDEX CONCURRENTLY IF EXISTS requests_user_created_idx")
+    await _add_requests_user_fkey(conn, partitioned)
+    logger.info("Таблицы переведены на разделение данных по ботам")
+
+
+async def init_db(conn: Connection, default_bot_id: int):
+    """Инициализация всех таблиц в БД.
+
+    `default_bot_id` — бот, которому достаются данные установки, созданной
+    до появления колонки bot_id.
+    """
     try:
+        await migrate_to_bot_ids(conn, default_bot_id)
         await conn.execute('''
             CREATE TABLE IF NOT EXISTS users (
-                user_id BIGINT PRIMARY KEY,
+                bot_id BIGINT NOT NULL,
+                user_id BIGINT NOT NULL,
                 full_name TEXT NOT NULL,
                 birth_date DATE NOT NULL,
-                phone_number TEXT NOT NULL
+                phone_number TEXT NOT NULL,
+                PRIMARY KEY (bot_id, user_id)
             )
         ''')
+        await conn.execute('ALTER TABLE users ADD COLUMN IF NOT EXISTS is_active BOOLEAN NOT NULL DEFAULT TRUE')
+        # Старые установки с обычной таблицей requests переводит на партиции src/partitions.py
+        await conn.execute('CREATE SEQUENCE IF NOT EXISTS requests_id_seq')
+        await create_requests_table(conn)
+        if not await conn.fetchval('''
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = 'requests' AND column_name = 'notified_at'
+        '''):
+            # Заявки, созданные до появления колонки, считаются отправленными ('epoch'):
+            # константный DEFAULT не переписывает таблицу, а новые заявки получают NULL
+            async with conn.transaction():
+                await conn.execute("ALTER TABLE requests ADD COLUMN notified_at TIMESTAMP DEFAULT 'epoch'")
+                await conn.execute("ALTER TABLE requests ALTER COLUMN notified_at DROP DEFAULT")
+        # Все фото заявки-альбома по порядку (в requests.screenshot_file_id — только первое).
+        # Без внешнего ключа: requests секционирована, и партиции отсоединяются по сроку хранения
         await conn.execute('''
-            CREATE TABLE IF NOT EXISTS requests (
-                id SERIAL PRIMARY KEY,
-                user_id BIGINT REFERENCES users(user_id),
-                request_type TEXT NOT NULL,
-                screenshot_file_id TEXT,
-                options TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT NOW()
+            CREATE TABLE IF NOT EXISTS request_screenshots (
+                request_id INTEGER NOT NULL,
+                position SMALLINT NOT NULL,
+                file_id TEXT NOT NULL,
+                PRIMARY KEY (request_id, position)
+            )
+        ''')
+        # Ключи идемпотентности черновиков заявок. Отдельной таблицей: уникальный индекс
+        # на секционированной requests обязан включать created_at и дубль бы не поймал
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS request_keys (
+                key TEXT PRIMARY KEY,
+                request_id INTEGER,
+                created_at TIMESTAMP NOT NULL DEFAULT NOW()
             )
         ''')
         await conn.execute('''
@@ -34,63 +271,510 @@ async def init_db(conn: Connection):
                 user_id BIGINT PRIMARY KEY
             )
         ''')
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS broadcasts (
+                id SERIAL PRIMARY KEY,
+                bot_id BIGINT NOT NULL,
+                admin_id BIGINT NOT NULL,
+                created_at TIMESTAMP DEFAULT NOW()
+            )
+        ''')
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS deliveries (
+                broadcast_id INTEGER REFERENCES broadcasts(id) ON DELETE CASCADE,
+                user_id BIGINT NOT NULL,
+                status TEXT NOT NULL,
+                error TEXT,
+                created_at TIMESTAMP DEFAULT NOW(),
+                PRIMARY KEY (broadcast_id, user_id)
+            )
+        ''')
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS request_rollups (
+                bot_id BIGINT NOT NULL,
+                hour TIMESTAMP NOT NULL,
+                request_type TEXT NOT NULL,
+                option TEXT NOT NULL,
+                requests_count INTEGER NOT NULL,
+                PRIMARY KEY (bot_id, hour, request_type, option)
+            )
+        ''')
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS rollup_watermarks (
+                name TEXT PRIMARY KEY,
+                last_id BIGINT NOT NULL
+            )
+        ''')
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS broadcast_schedules (
+                id SERIAL PRIMARY KEY,
+                bot_id BIGINT NOT NULL,
+                admin_id BIGINT NOT NULL,
+                from_chat_id BIGINT NOT NULL,
+                message_ids BIGINT[] NOT NULL,
+                cron TEXT,
+                next_run_at TIMESTAMP,
+                last_run_at TIMESTAMP,
+                created_at TIMESTAMP DEFAULT NOW()
+            )
+        ''')
+        # Состояние текущего запуска: рассылка, время захвата (обновляется, пока рассылка идёт) и завершения
+        await conn.execute('''
+            ALTER TABLE broadcast_schedules
+            ADD COLUMN IF NOT EXISTS broadcast_id INTEGER,
+            ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMP,
+            ADD COLUMN IF NOT EXISTS finished_at TIMESTAMP
+        ''')
+        await conn.execute('''
+            CREATE INDEX IF NOT EXISTS broadcast_schedules_next_run_idx
+            ON broadcast_schedules (next_run_at) WHERE next_run_at IS NOT NULL
+        ''')
         logger.info("База данных успешно инициализирована")
     except Exception as e:
         logger.error(f"Ошибка при инициализации БД: {e}")
         raise
 
 
-async def register_user(conn: Connection, user_id: int, full_name: str, birth_date: str, phone_number: str):
+async def create_requests_table(conn: Connection):
+    """Создание секционированной по месяцам (created_at) таблицы requests"""
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS requests (
+            id INTEGER NOT NULL DEFAULT nextval('requests_id_seq'),
+            bot_id BIGINT NOT NULL,
+            user_id BIGINT,
+            request_type TEXT NOT NULL,
+            screenshot_file_id TEXT,
+            options TEXT NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            notified_at TIMESTAMP,
+            PRIMARY KEY (id, created_at),
+            FOREIGN KEY (bot_id, user_id) REFERENCES users (bot_id, user_id)
+        ) PARTITION BY RANGE (created_at)
+    ''')
+    await conn.execute('ALTER SEQUENCE requests_id_seq OWNED BY requests.id')
+    await conn.execute(
+        'CREATE INDEX IF NOT EXISTS requests_bot_user_created_idx '
+        'ON requests (bot_id, user_id, created_at DESC, id DESC)'
+    )
+
+
+async def register_user(conn: Connection, bot_id: int, user_id: int, full_name: str, birth_date: str,
+                        phone_number: str):
     """Регистрация пользователя"""
     try:
         await conn.execute('''
-            INSERT INTO users (user_id, full_name, birth_date, phone_number)
-            VALUES ($1, $2, $3, $4)
-            ON CONFLICT (user_id) DO NOTHING
-        ''', user_id, full_name, birth_date, phone_number)
+            INSERT INTO users (bot_id, user_id, full_name, birth_date, phone_number)
+            VALUES ($1, $2, $3, $4, $5)
+            ON CONFLICT (bot_id, user_id) DO NOTHING
+        ''', bot_id, user_id, full_name, birth_date, phone_number)
         logger.info(f"Пользователь {user_id} успешно зарегистрирован")
     except Exception as e:
         logger.error(f"Ошибка при регистрации пользователя {user_id}: {e}")
         raise
 
 
-async def save_request(conn: Connection, user_id: int, request_type: str, screenshot_file_id: Optional[str], options: List[str]) -> Optional[int]:
-    """Сохранение заявки и возврат ID"""
+async def save_request(conn: Connection, bot_id: int, user_id: int, request_type: str, screenshots: List[str],
+                       options: List[str], idempotency_key: Optional[str] = None) -> Tuple[int, bool]:
+    """Сохранение заявки. Возвращает (ID, создана ли заявка сейчас).
+
+    Повтор с тем же `idempotency_key` новую заявку не создаёт, а возвращает ID
+    уже сохранённой с признаком False. Ключ занимается первым запросом
+    транзакции, поэтому параллельный повтор дождётся её завершения. Фото
+    альбома (больше одного) пишутся в request_screenshots.
+    """
     try:
-        row = await conn.fetchrow('''
-            INSERT INTO requests (user_id, request_type, screenshot_file_id, options)
-            VALUES ($1, $2, $3, $4)
-            RETURNING id
-        ''', user_id, request_type, screenshot_file_id, ", ".join(options))
-        request_id = row["id"] if row else None
+        async with conn.transaction():
+            if idempotency_key is not None:
+                claimed = await conn.fetchval(
+                    "INSERT INTO request_keys (key) VALUES ($1) ON CONFLICT (key) DO NOTHING RETURNING key",
+                    idempotency_key
+                )
+                if claimed is None:
+                    request_id = await conn.fetchval(
+                        "SELECT request_id FROM request_keys WHERE key = $1", idempotency_key
+                    )
+                    logger.info(f"Повторное подтверждение заявки {request_id} пользователем {user_id}")
+                    return request_id, False
+
+            request_id = await conn.fetchval('''
+                INSERT INTO requests (bot_id, user_id, request_type, screenshot_file_id, options)
+                VALUES ($1, $2, $3, $4, $5)
+                RETURNING id
+            ''', bot_id, user_id, request_type, screenshots[0] if screenshots else None, ", ".join(options))
+            if len(screenshots) > 1:
+                await conn.execute('''
+                    INSERT INTO request_screenshots (request_id, position, file_id)
+                    SELECT $1, position, file_id
+                    FROM unnest($2::text[]) WITH ORDINALITY AS s(file_id, position)
+                ''', request_id, screenshots)
+            if idempotency_key is not None:
+                await conn.execute("UPDATE request_keys SET request_id = $2 WHERE key = $1", idempotency_key, request_id)
         logger.info(f"Заявка {request_id} успешно сохранена для пользователя {user_id}")
-        return request_id
+        return request_id, True
     except Exception as e:
         logger.error(f"Ошибка при сохранении заявки для пользователя {user_id}: {e}")
         raise
 
 
-async def get_statistics(conn: Connection) -> Tuple[int, int]:
-    """Получение статистики по пользователям и заявкам"""
+async def purge_request_keys(conn: Connection, days: int = 7):
+    """Удаление ключей идемпотентности старше `days` дней (черновики столько не живут)"""
+    try:
+        await conn.execute("DELETE FROM request_keys WHERE created_at < NOW() - make_interval(days => $1)", days)
+    except Exception as e:
+        logger.error(f"Ошибка при очистке ключей идемпотентности заявок: {e}")
+        raise
+
+
+async def purge_orphan_screenshots(conn: Connection):
+    """Удаление фото альбомов заявок, отсоединённых или удалённых по сроку хранения.
+
+    Партиции уходят от старых к новым, а ID заявок растут со временем,
+    поэтому всё, что меньше самого старого оставшегося ID, — сироты.
+    Удаление идёт по началу первичного ключа и не читает всю таблицу.
+    """
+    try:
+        await conn.execute(
+            "DELETE FROM request_screenshots WHERE request_id < (SELECT MIN(id) FROM requests)"
+        )
+    except Exception as e:
+        logger.error(f"Ошибка при очистке фото удалённых заявок: {e}")
+        raise
+
+
+async def get_user_requests(conn: Connection, bot_id: int, user_id: int, limit: int,
+                            cursor: Optional[Tuple[datetime, int]] = None, newer: bool = False):
+    """Страница заявок пользователя от новых к старым (keyset-пагинация).
+
+    Без курсора возвращает самые новые заявки. С курсором (created_at, id) —
+    заявки старше (или новее при `newer=True`) курсора. Явное условие на
+    created_at позволяет отсечь лишние партиции. Возвращает до `limit + 1`
+    строк, чтобы вызывающий код мог понять, есть ли следующая страница.
+    """
     try:
-        users_count = await conn.fetchval("SELECT COUNT(*) FROM users")
-        requests_count = await conn.fetchval("SELECT COUNT(*) FROM requests")
+        if cursor is None:
+            return await conn.fetch('''
+                SELECT id, request_type, options, created_at FROM requests
+                WHERE bot_id = $1 AND user_id = $2
+                ORDER BY created_at DESC, id DESC
+                LIMIT $3
+            ''', bot_id, user_id, limit + 1)
+        if newer:
+            rows = await conn.fetch('''
+                SELECT id, request_type, options, created_at FROM requests
+                WHERE bot_id = $1 AND user_id = $2 AND created_at >= $3 AND (created_at, id) > ($3, $4)
+                ORDER BY created_at ASC, id ASC
+                LIMIT $5
+            ''', bot_id, user_id, *cursor, limit + 1)
+            return list(reversed(rows))
+        return await conn.fetch('''
+            SELECT id, request_type, options, created_at FROM requests
+            WHERE bot_id = $1 AND user_id = $2 AND created_at <= $3 AND (created_at, id) < ($3, $4)
+            ORDER BY created_at DESC, id DESC
+            LIMIT $5
+        ''', bot_id, user_id, *cursor, limit + 1)
+    except Exception as e:
+        logger.error(f"Ошибка при получении заявок пользователя {user_id}: {e}")
+        raise
+
+
+@replica_read
+async def get_statistics(conn: Connection, bot_id: int) -> Tuple[int, int]:
+    """Получение статистики бота по пользователям и заявкам"""
+    try:
+        users_count = await conn.fetchval("SELECT COUNT(*) FROM users WHERE bot_id = $1", bot_id)
+        requests_count = await conn.fetchval("SELECT COUNT(*) FROM requests WHERE bot_id = $1", bot_id)
         return users_count, requests_count
     except Exception as e:
         logger.error(f"Ошибка при получении статистики: {e}")
         raise
 
 
-async def get_all_user_ids(conn: Connection) -> List[int]:
-    """Получение списка всех user_id"""
+# Строка с option = '*' хранит число заявок данного типа, остальные — число выборов опции
+ROLLUP_ALL_OPTIONS = "*"
+ROLLUP_LAG = "30 seconds"
+
+
+async def update_request_rollups(conn: Connection, batch_size: int = 50000) -> int:
+    """Инкрементальное обновление почасовой аналитики по заявкам после водяного знака.
+
+    Обрабатывает не больше `batch_size` заявок и только старше ROLLUP_LAG, чтобы
+    не пропустить заявки, чьи транзакции с меньшим id фиксируются позже.
+    Возвращает, на сколько продвинулся водяной знак (0 — обрабатывать нечего).
+    """
     try:
-        rows = await conn.fetch("SELECT user_id FROM users")
+        async with conn.transaction():
+            await conn.execute(
+                "INSERT INTO rollup_watermarks (name, last_id) VALUES ('requests', 0) ON CONFLICT (name) DO NOTHING"
+            )
+            last_id = await conn.fetchval(
+                "SELECT last_id FROM rollup_watermarks WHERE name = 'requests' FOR UPDATE"
+            )
+            upper_id = await conn.fetchval(f'''
+                SELECT MAX(id) FROM (
+                    SELECT id FROM requests
+                    WHERE id > $1 AND created_at < NOW() - INTERVAL '{ROLLUP_LAG}'
+                    ORDER BY id
+                    LIMIT $2
+                ) AS batch
+            ''', last_id, batch_size)
+            if upper_id is None:
+                return 0
+
+            await conn.execute('''
+                INSERT INTO request_rollups (bot_id, hour, request_type, option, requests_count)
+                SELECT bot_id, date_trunc('hour', created_at), request_type, $3, COUNT(*)
+                FROM requests
+                WHERE id > $1 AND id <= $2
+                GROUP BY 1, 2, 3
+                UNION ALL
+                SELECT bot_id, date_trunc('hour', created_at), request_type, trim(opt), COUNT(*)
+                FROM requests, unnest(string_to_array(options, ',')) AS opt
+                WHERE id > $1 AND id <= $2
+                GROUP BY 1, 2, 3, 4
+                ON CONFLICT (bot_id, hour, request_type, option) DO UPDATE
+                SET requests_count = request_rollups.requests_count + EXCLUDED.requests_count
+            ''', last_id, upper_id, ROLLUP_ALL_OPTIONS)
+            await conn.execute(
+                "UPDATE rollup_watermarks SET last_id = $1 WHERE name = 'requests'", upper_id
+            )
+            return upper_id - last_id
+    except Exception as e:
+        logger.error(f"Ошибка при обновлении аналитики заявок: {e}")
+        raise
+
+
+async def reset_request_rollups(conn: Connection):
+    """Очистка аналитики и водяного знака перед пересчётом истории"""
+    try:
+        async with conn.transaction():
+            await conn.execute("TRUNCATE request_rollups")
+            await conn.execute("DELETE FROM rollup_watermarks WHERE name = 'requests'")
+    except Exception as e:
+        logger.error(f"Ошибка при сбросе аналитики заявок: {e}")
+        raise
+
+
+@replica_read
+async def get_request_rollups(conn: Connection, bot_id: int, days: int):
+    """Почасовые агрегаты заявок бота за последние `days` дней"""
+    try:
+        return await conn.fetch('''
+            SELECT hour, request_type, option, requests_count FROM request_rollups
+            WHERE bot_id = $1 AND hour >= date_trunc('hour', NOW()::timestamp) - make_interval(days => $2)
+            ORDER BY hour
+        ''', bot_id, days)
+    except Exception as e:
+        logger.error(f"Ошибка при получении аналитики заявок: {e}")
+        raise
+
+
+@replica_read
+async def get_all_user_ids(conn: Connection, bot_id: int) -> List[int]:
+    """Получение списка всех user_id бота"""
+    try:
+        rows = await conn.fetch("SELECT user_id FROM users WHERE bot_id = $1", bot_id)
         return [row["user_id"] for row in rows]
     except Exception as e:
         logger.error(f"Ошибка при получении списка пользователей: {e}")
         raise
 
 
+@replica_read
+async def get_active_user_ids(conn: Connection, bot_id: int) -> List[int]:
+    """Получение списка user_id пользователей бота, которым можно доставить сообщение"""
+    try:
+        rows = await conn.fetch("SELECT user_id FROM users WHERE bot_id = $1 AND is_active", bot_id)
+        return [row["user_id"] for row in rows]
+    except Exception as e:
+        logger.error(f"Ошибка при получении списка активных пользователей: {e}")
+        raise
+
+
+async def deactivate_users(conn: Connection, bot_id: int, user_ids: List[int]):
+    """Пометка пользователей, заблокировавших бота или удаливших аккаунт"""
+    if not user_ids:
+        return
+    try:
+        await conn.execute(
+            "UPDATE users SET is_active = FALSE WHERE bot_id = $1 AND user_id = ANY($2)", bot_id, user_ids
+        )
+        logger.info(f"Помечено неактивными пользователей: {len(user_ids)}")
+    except Exception as e:
+        logger.error(f"Ошибка при деактивации пользователей: {e}")
+        raise
+
+
+async def reactivate_user(conn: Connection, bot_id: int, user_id: int):
+    """Возврат пользователя в рассылки после повторного /start"""
+    try:
+        await conn.execute(
+            "UPDATE users SET is_active = TRUE WHERE bot_id = $1 AND user_id = $2 AND NOT is_active", bot_id, user_id
+        )
+    except Exception as e:
+        logger.error(f"Ошибка при активации пользователя {user_id}: {e}")
+        raise
+
+
+async def create_broadcast(conn: Connection, bot_id: int, admin_id: int) -> int:
+    """Создание записи о рассылке и возврат её ID"""
+    try:
+        return await conn.fetchval(
+            "INSERT INTO broadcasts (bot_id, admin_id) VALUES ($1, $2) RETURNING id", bot_id, admin_id
+        )
+    except Exception as e:
+        logger.error(f"Ошибка при создании рассылки: {e}")
+        raise
+
+
+async def save_deliveries(conn: Connection, broadcast_id: int, deliveries: List[Tuple[int, str, Optional[str]]]):
+    """Пакетная запись результатов доставки: (user_id, status, error)"""
+    if not deliveries:
+        return
+    try:
+        user_ids, statuses, errors = zip(*deliveries)
+        await conn.execute('''
+            INSERT INTO deliveries (broadcast_id, user_id, status, error)
+            SELECT $1, * FROM unnest($2::BIGINT[], $3::TEXT[], $4::TEXT[])
+            ON CONFLICT (broadcast_id, user_id) DO UPDATE
+            SET status = EXCLUDED.status, error = EXCLUDED.error
+        ''', broadcast_id, list(user_ids), list(statuses), list(errors))
+    except Exception as e:
+        logger.error(f"Ошибка при сохранении доставок рассылки {broadcast_id}: {e}")
+        raise
+
+
+async def get_delivered_user_ids(conn: Connection, broadcast_id: int) -> Set[int]:
+    """Пользователи, результат доставки рассылки которым уже записан"""
+    try:
+        rows = await conn.fetch("SELECT user_id FROM deliveries WHERE broadcast_id = $1", broadcast_id)
+        return {row["user_id"] for row in rows}
+    except Exception as e:
+        logger.error(f"Ошибка при получении доставок рассылки {broadcast_id}: {e}")
+        raise
+
+
+async def create_schedule(conn: Connection, bot_id: int, admin_id: int, from_chat_id: int, message_ids: List[int],
+                          next_run_at: datetime, cron: Optional[str] = None) -> int:
+    """Создание запланированной (разовой или повторяющейся по cron) рассылки"""
+    try:
+        return await conn.fetchval('''
+            INSERT INTO broadcast_schedules (bot_id, admin_id, from_chat_id, message_ids, cron, next_run_at)
+            VALUES ($1, $2, $3, $4, $5, $6)
+            RETURNING id
+        ''', bot_id, admin_id, from_chat_id, message_ids, cron, next_run_at)
+    except Exception as e:
+        logger.error(f"Ошибка при создании расписания рассылки: {e}")
+        raise
+
+
+async def get_next_schedule_time(conn: Connection, bot_ids: List[int], stale_after: timedelta) -> Optional[datetime]:
+    """Время ближайшего запуска среди расписаний ботов `bot_ids`.
+
+    Для расписания, рассылка которого ещё идёт, — момент, когда её можно будет
+    считать брошенной (захват не обновлялся `stale_after`).
+    """
+    try:
+        return await conn.fetchval('''
+            SELECT LEAST(
+                MIN(next_run_at) FILTER (WHERE claimed_at IS NULL OR finished_at IS NOT NULL),
+                MIN(claimed_at + $2::INTERVAL) FILTER (WHERE claimed_at IS NOT NULL AND finished_at IS NULL)
+            )
+            FROM broadcast_schedules
+            WHERE bot_id = ANY($1) AND (next_run_at IS NOT NULL OR finished_at IS NULL AND claimed_at IS NOT NULL)
+        ''', bot_ids, stale_after)
+    except Exception as e:
+        logger.error(f"Ошибка при получении ближайшего расписания: {e}")
+        raise
+
+
+async def claim_due_schedule(conn: Connection, now: datetime, bot_ids: List[int], stale_before: datetime):
+    """Захват одного наступившего или брошенного запуска расписания ботов `bot_ids`.
+
+    В одной транзакции с блокировкой строки (SKIP LOCKED) создаёт рассылку,
+    запоминает её в расписании (broadcast_id, claimed_at) и переносит
+    next_run_at на следующий запуск по cron или обнуляет его для разовых
+    рассылок. Пока запуск не завершён (finished_at), следующий не начинается.
+    Запуск, захват которого не обновлялся с `stale_before` (процесс упал
+    посреди рассылки), захватывается снова с той же рассылкой — `resumed`.
+    """
+    try:
+        async with conn.transaction():
+            row = await conn.fetchrow('''
+                SELECT id, bot_id, admin_id, from_chat_id, message_ids, cron, broadcast_id,
+                       claimed_at IS NOT NULL AND finished_at IS NULL AS resumed
+                FROM broadcast_schedules
+                WHERE bot_id = ANY($2) AND (
+                    next_run_at <= $1 AND (claimed_at IS NULL OR finished_at IS NOT NULL)
+                    OR claimed_at < $3 AND finished_at IS NULL
+                )
+                ORDER BY next_run_at NULLS FIRST
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            ''', now, bot_ids, stale_before)
+            if row is None:
+                return None
+            schedule = dict(row)
+            if schedule["resumed"]:
+                await conn.execute("UPDATE broadcast_schedules SET claimed_at = $2 WHERE id = $1", row["id"], now)
+                return schedule
+            schedule["broadcast_id"] = await create_broadcast(conn, row["bot_id"], row["admin_id"])
+            next_run_at = next_cron_time(row["cron"], now) if row["cron"] else None
+            await conn.execute('''
+                UPDATE broadcast_schedules
+                SET next_run_at = $2, last_run_at = $3, broadcast_id = $4, claimed_at = $3, finished_at = NULL
+                WHERE id = $1
+            ''', row["id"], next_run_at, now, schedule["broadcast_id"])
+            return schedule
+    except Exception as e:
+        logger.error(f"Ошибка при захвате расписания рассылки: {e}")
+        raise
+
+
+async def touch_schedule_run(conn: Connection, schedule_id: int, now: datetime):
+    """Отметка, что рассылка запуска расписания ещё идёт"""
+    await conn.execute(
+        "UPDATE broadcast_schedules SET claimed_at = $2 WHERE id = $1 AND finished_at IS NULL", schedule_id, now
+    )
+
+
+async def finish_schedule_run(conn: Connection, schedule_id: int, now: datetime):
+    """Завершение запуска расписания: следующий запуск может быть захвачен"""
+    try:
+        await conn.execute("UPDATE broadcast_schedules SET finished_at = $2 WHERE id = $1", schedule_id, now)
+    except Exception as e:
+        logger.error(f"Ошибка при завершении запуска расписания {schedule_id}: {e}")
+        raise
+
+
+async def get_active_schedules(conn: Connection, bot_id: int):
+    """Расписания бота, у которых ещё есть будущие запуски"""
+    try:
+        return await conn.fetch('''
+            SELECT id, cron, next_run_at FROM broadcast_schedules
+            WHERE bot_id = $1 AND next_run_at IS NOT NULL
+            ORDER BY next_run_at
+        ''', bot_id)
+    except Exception as e:
+        logger.error(f"Ошибка при получении расписаний рассылок: {e}")
+        raise
+
+
+async def delete_schedule(conn: Connection, bot_id: int, schedule_id: int):
+    """Удаление расписания рассылки"""
+    try:
+        await conn.execute("DELETE FROM broadcast_schedules WHERE id = $1 AND bot_id = $2", schedule_id, bot_id)
+    except Exception as e:
+        logger.error(f"Ошибка при удалении расписания {schedule_id}: {e}")
+        raise
+
+
+async def get_admin_ids(conn: Connection) -> Set[int]:
+    """ID админов по тем же правилам, что и is_admin: ADMIN_IDS, а без него — таблица admins"""
+    if ADMIN_IDS:
+        return set(ADMIN_IDS)
+    return {row["user_id"] for row in await conn.fetch("SELECT user_id FROM admins")}
+
+
 async def is_admin(conn: Connection, user_id: int) -> bool:
     """Проверка, является ли пользователь админом"""
     try:
@@ -102,24 +786,92 @@ async def is_admin(conn: Connection, user_id: int) -> bool:
         raise
 
 
-async def get_user_by_id(conn: Connection, user_id: int):
+# Заявка с данными пользователя и всеми фото (screenshots — по порядку)
+_REQUEST_SELECT = '''
+    SELECT r.id, r.user_id, r.request_type, r.options, r.created_at,
+           u.full_name, u.phone_number,
+           COALESCE(
+               NULLIF(ARRAY(
+                   SELECT s.file_id FROM request_screenshots s
+                   WHERE s.request_id = r.id ORDER BY s.position
+               ), '{}'),
+               ARRAY_REMOVE(ARRAY[r.screenshot_file_id], NULL)
+           ) AS screenshots
+    FROM requests r
+    LEFT JOIN users u ON u.bot_id = r.bot_id AND u.user_id = r.user_id
+'''
+
+
+async def get_request(conn: Connection, bot_id: int, request_id: int):
+    """Заявка бота с данными пользователя и всеми фото (screenshots — по порядку)"""
+    try:
+        return await conn.fetchrow(_REQUEST_SELECT + "WHERE r.id = $2 AND r.bot_id = $1", bot_id, request_id)
+    except Exception as e:
+        logger.error(f"Ошибка при получении заявки {request_id}: {e}")
+        raise
+
+
+async def get_unnotified_requests(conn: Connection, bot_id: int, shard: int = 0, shards: int = 1,
+                                  min_age: float = 0, days: int = 7):
+    """Заявки бота за последние `days` дней, уведомление о которых админам не отправлено.
+
+    Только заявки пользователей с `user_id % shards = shard` (их апдейты
+    обрабатывает этот процесс) и не моложе `min_age` секунд.
+    """
+    try:
+        return await conn.fetch(
+            _REQUEST_SELECT + '''
+            WHERE r.bot_id = $1 AND r.notified_at IS NULL
+              AND r.created_at > NOW() - make_interval(days => $2)
+              AND r.created_at <= NOW() - make_interval(secs => $3)
+              AND r.user_id % $5 = $4
+            ORDER BY r.id
+            ''', bot_id, days, min_age, shard, shards
+        )
+    except Exception as e:
+        logger.error(f"Ошибка при получении неотправленных уведомлений о заявках: {e}")
+        raise
+
+
+async def create_unnotified_index(conn: Connection):
+    """Частичный индекс по заявкам без отправленного уведомления (для get_unnotified_requests).
+
+    Строится после перевода requests на партиции: у обычной таблицы его
+    пришлось бы переименовывать при миграции. Вызывать вне транзакции.
+    """
+    await create_partitioned_index_concurrently(
+        conn, "requests_unnotified_idx", "requests", "(bot_id, created_at) WHERE notified_at IS NULL"
+    )
+
+
+async def mark_requests_notified(conn: Connection, bot_id: int, request_ids: List[int]):
+    """Отметка об отправке уведомления о заявках админам"""
+    await conn.execute(
+        "UPDATE requests SET notified_at = NOW() WHERE bot_id = $1 AND id = ANY($2::INTEGER[]) AND notified_at IS NULL",
+        bot_id, request_ids
+    )
+
+
+@replica_read
+async def get_user_by_id(conn: Connection, bot_id: int, user_id: int):
     """Получение пользователя по ID"""
     try:
         return await conn.fetchrow(
-            "SELECT user_id, full_name, birth_date, phone_number FROM users WHERE user_id = $1", 
-            user_id
+            "SELECT user_id, full_name, birth_date, phone_number FROM users WHERE bot_id = $1 AND user_id = $2",
+            bot_id, user_id
         )
     except Exception as e:
         logger.error(f"Ошибка при получении пользователя {user_id}: {e}")
         raise
 
 
-async def get_users_by_ids(conn: Connection, user_ids: List[int]):
+@replica_read
+async def get_users_by_ids(conn: Connection, bot_id: int, user_ids: List[int]):
     """Получение пользователей по списку ID"""
     try:
         return await conn.fetch(
-            "SELECT user_id, full_name FROM users WHERE user_id = ANY($1)", 
-            user_ids
+            "SELECT user_id, full_name FROM users WHERE bot_id = $1 AND user_id = ANY($2)",
+            bot_id, user_ids
         )
     except Exception as e:
         logger.error(f"Ошибка при получении пользователей: {e}")
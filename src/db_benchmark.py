@@ -0,0 +1,352 @@
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import random
+import statistics
+import subprocess
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import asyncpg
+from asyncpg import Connection
+
+from src.config import DB_CONFIG
+from src.database import (
+    claim_due_schedule, create_broadcast, create_schedule, create_unnotified_index, deactivate_users,
+    delete_schedule, finish_schedule_run, get_active_schedules, get_active_user_ids, get_admin_ids,
+    get_all_user_ids, get_delivered_user_ids, get_next_schedule_time, get_request, get_request_rollups,
+    get_statistics, get_unnotified_requests, get_user_by_id, get_user_requests, get_users_by_ids, init_db,
+    is_admin, mark_requests_notified, purge_orphan_screenshots, purge_request_keys, reactivate_user,
+    register_user, save_deliveries, save_request, touch_schedule_run, update_request_rollups
+)
+from src.partitions import _month_start, maintain_request_partitions
+
+
+logger = logging.getLogger(__name__)
+
+# Синтетические данные живут в отдельной схеме, рабочие таблицы той же БД не затрагиваются
+BENCH_SCHEMA = "bench"
+BENCH_BOT_ID = 42
+FIRST_USER_ID = 1_000_000
+REQUEST_TYPES = ["🚗 Транспорт", "🏢 Офис", "📦 Доставка", "❓ Другое"]
+OPTIONS = ["equipment", "it", "cleaning", "coffee"]
+
+
+async def seed(conn: Connection, users: int, requests: int, months: int):
+    """Заполнение схемы синтетическими данными (детерминированно за счёт setseed)"""
+    await conn.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE")
+    await conn.execute(f"CREATE SCHEMA {BENCH_SCHEMA}")
+    await init_db(conn, BENCH_BOT_ID)
+
+    # Помесячные партиции за весь период данных; дальше их досоздаёт обычное обслуживание
+    today = date.today()
+    for shift in range(-months, 1):
+        month = _month_start(today, shift)
+        await conn.execute(
+            f"CREATE TABLE requests_p{month:%Y%m} PARTITION OF requests "
+            f"FOR VALUES FROM ('{month}') TO ('{_month_start(month, 1)}')"
+        )
+    # Без advisory lock рабочего бота (setup_request_partitions): схема bench своя, миграция ей не нужна
+    await maintain_request_partitions(conn, 3, 0, False)
+    await create_unnotified_index(conn)
+
+    started = time.monotonic()
+    await conn.execute("SELECT setseed(0.42)")
+    await conn.execute('''
+        INSERT INTO users (bot_id, user_id, full_name, birth_date, phone_number, is_active)
+        SELECT $3, $1 + g, 'Пользователь ' || g, DATE '1960-01-01' + (g % 15000),
+               '+7' || lpad(g::text, 10, '0'), g % 20 <> 0
+        FROM generate_series(0, $2 - 1) AS g
+    ''', FIRST_USER_ID, users, BENCH_BOT_ID)
+    await conn.execute('''
+        INSERT INTO requests (bot_id, user_id, request_type, screenshot_file_id, options, created_at)
+        SELECT $7, $1 + floor(random() * $2)::bigint,
+               ($3::text[])[1 + floor(random() * 4)::int],
+               CASE WHEN g % 3 = 0 THEN 'file_' || g END,
+               ($4::text[])[1 + floor(random() * 4)::int],
+               NOW() - random() * (NOW() - (date_trunc('month', NOW()) - make_interval(months => $5)))
+        FROM generate_series(1, $6) AS g
+    ''', FIRST_USER_ID, users, REQUEST_TYPES, OPTIONS, months, requests, BENCH_BOT_ID)
+    # Каждая десятая заявка со скриншотом — альбом из трёх фото
+    await conn.execute('''
+        INSERT INTO request_screenshots (request_id, position, file_id)
+        SELECT id, p, 'file_' || id || '_' || p
+        FROM requests, generate_series(1, 3) AS p
+        WHERE id % 30 = 0
+    ''')
+    await conn.execute("INSERT INTO admins (user_id) SELECT $1 + g FROM generate_series(0, 9) AS g", FIRST_USER_ID)
+    broadcast_id = await create_broadcast(conn, BENCH_BOT_ID, FIRST_USER_ID)
+    await conn.execute('''
+        INSERT INTO deliveries (broadcast_id, user_id, status)
+        SELECT $1, user_id, 'delivered' FROM users
+    ''', broadcast_id)
+    await conn.execute('''
+        INSERT INTO broadcast_schedules (bot_id, admin_id, from_chat_id, message_ids, cron, next_run_at)
+        SELECT $2, $1, $1, ARRAY[g], '0 9 * * *', NOW() + g * INTERVAL '1 hour'
+        FROM generate_series(1, 50) AS g
+    ''', FIRST_USER_ID, BENCH_BOT_ID)
+    while await update_request_rollups(conn):
+        pass
+    await conn.execute("ANALYZE")
+    await conn.execute(
+        "CREATE TABLE bench_meta AS SELECT $1::bigint AS users, $2::bigint AS requests, $3::int AS months",
+        users, requests, months
+    )
+    logger.warning(f"Данные созданы за {time.monotonic() - started:.1f} с")
+
+
+async def _get_seeded_size(conn: Connection) -> Optional[Tuple[int, int, int]]:
+    exists = await conn.fetchval("SELECT to_regclass($1) IS NOT NULL", f"{BENCH_SCHEMA}.bench_meta")
+    if not exists:
+        return None
+    row = await conn.fetchrow("SELECT users, requests, months FROM bench_meta")
+    return row["users"], row["requests"], row["months"]
+
+
+class Case:
+    """Замеряемый вызов: `call(conn, rnd)` выполняется внутри транзакции, которая откатывается"""
+
+    def __init__(self, name: str, call: Callable[[Connection, random.Random], Awaitable[Any]], heavy: bool = False):
+        self.name = name
+        self.call = call
+        # Тяжёлые запросы (полные выборки) повторяются не больше 5 раз
+        self.heavy = heavy
+
+
+def build_cases(users: int, requests: int) -> List[Case]:
+    def user_id(rnd: random.Random) -> int:
+        return FIRST_USER_ID + rnd.randrange(users)
+
+    async def older_page(conn: Connection, rnd: random.Random):
+        uid = user_id(rnd)
+        rows = await get_user_requests(conn, BENCH_BOT_ID, uid, 5)
+        if rows:
+            await get_user_requests(conn, BENCH_BOT_ID, uid, 5, (rows[-1]["created_at"], rows[-1]["id"]))
+
+    return [
+        Case("register_user", lambda conn, rnd: register_user(
+            conn, BENCH_BOT_ID, FIRST_USER_ID + users + rnd.randrange(10 ** 6), "Новый Пользователь",
+            date(1990, 1, 1), "+70000000000"
+        )),
+        Case("save_request", lambda conn, rnd: save_request(
+            conn, BENCH_BOT_ID, user_id(rnd), rnd.choice(REQUEST_TYPES), [], rnd.sample(OPTIONS, 2)
+        )),
+        Case("save_request_album", lambda conn, rnd: save_request(
+            conn, BENCH_BOT_ID, user_id(rnd), rnd.choice(REQUEST_TYPES), ["a", "b", "c"], rnd.sample(OPTIONS, 2)
+        )),
+        Case("save_request_idempotent", lambda conn, rnd: save_request(
+            conn, BENCH_BOT_ID, user_id(rnd), rnd.choice(REQUEST_TYPES), [], rnd.sample(OPTIONS, 2),
+            idempotency_key=f"bench-{rnd.getrandbits(64):x}"
+        )),
+        Case("purge_request_keys", lambda conn, rnd: purge_request_keys(conn)),
+        Case("purge_orphan_screenshots", lambda conn, rnd: purge_orphan_screenshots(conn)),
+        Case("get_user_requests", lambda conn, rnd: get_user_requests(conn, BENCH_BOT_ID, user_id(rnd), 5)),
+        Case("get_user_requests_older_page", older_page),
+        Case("get_statistics", lambda conn, rnd: get_statistics(conn, BENCH_BOT_ID), heavy=True),
+        Case("update_request_rollups", lambda conn, rnd: update_request_rollups(conn)),
+        Case("get_request_rollups", lambda conn, rnd: get_request_rollups(conn, BENCH_BOT_ID, 7)),
+        Case("get_all_user_ids", lambda conn, rnd: get_all_user_ids(conn, BENCH_BOT_ID), heavy=True),
+        Case("get_active_user_ids", lambda conn, rnd: get_active_user_ids(conn, BENCH_BOT_ID), heavy=True),
+        Case("deactivate_users", lambda conn, rnd: deactivate_users(
+            conn, BENCH_BOT_ID, [user_id(rnd) for _ in range(100)]
+        )),
+        Case("reactivate_user", lambda conn, rnd: reactivate_user(conn, BENCH_BOT_ID, user_id(rnd))),
+        Case("create_broadcast", lambda conn, rnd: create_broadcast(conn, BENCH_BOT_ID, FIRST_USER_ID)),
+        Case("save_deliveries", lambda conn, rnd: save_deliveries(
+            conn, 1, [(user_id(rnd), "delivered", None) for _ in range(100)]
+        )),
+        Case("create_schedule", lambda conn, rnd: create_schedule(
+            conn, BENCH_BOT_ID, FIRST_USER_ID, FIRST_USER_ID, [1], datetime.now() + timedelta(days=1), "0 9 * * *"
+        )),
+        Case("get_next_schedule_time", lambda conn, rnd: get_next_schedule_time(
+            conn, [BENCH_BOT_ID], timedelta(minutes=10)
+        )),
+        Case("claim_due_schedule", lambda conn, rnd: claim_due_schedule(
+            conn, datetime.now() + timedelta(days=3), [BENCH_BOT_ID], datetime.now() - timedelta(minutes=10)
+        )),
+        Case("touch_schedule_run", lambda conn, rnd: touch_schedule_run(conn, rnd.randint(1, 50), datetime.now())),
+        Case("finish_schedule_run", lambda conn, rnd: finish_schedule_run(conn, rnd.randint(1, 50), datetime.now())),
+        Case("get_delivered_user_ids", lambda conn, rnd: get_delivered_user_ids(conn, 1)),
+        Case("get_active_schedules", lambda conn, rnd: get_active_schedules(conn, BENCH_BOT_ID)),
+        Case("delete_schedule", lambda conn, rnd: delete_schedule(conn, BENCH_BOT_ID, rnd.randint(1, 50))),
+        Case("is_admin", lambda conn, rnd: is_admin(conn, user_id(rnd))),
+        Case("get_admin_ids", lambda conn, rnd: get_admin_ids(conn)),
+        Case("get_unnotified_requests", lambda conn, rnd: get_unnotified_requests(conn, BENCH_BOT_ID, min_age=60)),
+        Case("mark_requests_notified", lambda conn, rnd: mark_requests_notified(
+            conn, BENCH_BOT_ID, [rnd.randint(1, requests) for _ in range(20)]
+        )),
+        Case("get_request", lambda conn, rnd: get_request(conn, BENCH_BOT_ID, rnd.randint(1, requests))),
+        Case("get_user_by_id", lambda conn, rnd: get_user_by_id(conn, BENCH_BOT_ID, user_id(rnd))),
+        Case("get_users_by_ids", lambda conn, rnd: get_users_by_ids(
+            conn, BENCH_BOT_ID, [user_id(rnd) for _ in range(10)]
+        )),
+        # Запросы, написанные прямо в user_handlers.py
+        Case("handlers.start_user_check", lambda conn, rnd: conn.fetchrow(
+            "SELECT user_id, is_active FROM users WHERE bot_id=$1 AND user_id=$2", BENCH_BOT_ID, user_id(rnd)
+        )),
+        Case("handlers.registration_check", lambda conn, rnd: conn.fetchval(
+            "SELECT EXISTS (SELECT 1 FROM users WHERE bot_id=$1 AND user_id=$2)", BENCH_BOT_ID, user_id(rnd)
+        )),
+        Case("handlers.request_user_info", lambda conn, rnd: conn.fetchrow(
+            "SELECT full_name, phone_number FROM users WHERE bot_id = $1 AND user_id = $2", BENCH_BOT_ID, user_id(rnd)
+        )),
+    ]
+
+
+def _is_explainable(query: str) -> bool:
+    return query.lstrip().split(None, 1)[0].upper() in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+
+async def run_case(conn: Connection, case: Case, iterations: int, rnd: random.Random) -> Dict[str, Any]:
+    """Замер времени вызова и планы (EXPLAIN ANALYZE, BUFFERS) всех его SQL-запросов"""
+    timings = []
+    for _ in range(min(iterations, 5) if case.heavy else iterations):
+        transaction = conn.transaction()
+        await transaction.start()
+        try:
+            started = time.perf_counter()
+            await case.call(conn, rnd)
+            timings.append((time.perf_counter() - started) * 1000)
+        finally:
+            await transaction.rollback()
+
+    # Повторный вызов с перехватом запросов, затем EXPLAIN каждого с теми же параметрами
+    queries: List[Tuple[str, tuple]] = []
+
+    def logger_callback(record):
+        queries.append((record.query, record.args))
+
+    transaction = conn.transaction()
+    await transaction.start()
+    try:
+        conn.add_query_logger(logger_callback)
+        try:
+            await case.call(conn, rnd)
+            # Логгер запросов вызывается через call_soon
+            await asyncio.sleep(0)
+        finally:
+            conn.remove_query_logger(logger_callback)
+        await transaction.rollback()
+        transaction = conn.transaction()
+        await transaction.start()
+
+        plans = []
+        for query, args in queries:
+            if not _is_explainable(query):
+                continue
+            try:
+                # Точка сохранения: ошибка одного EXPLAIN не прерывает транзакцию для остальных
+                async with conn.transaction():
+                    explain = await conn.fetchval(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query}", *args)
+            except asyncpg.PostgresError as e:
+                plans.append({"query": " ".join(query.split()), "error": f"{type(e).__name__}: {e}"})
+                continue
+            plan = json.loads(explain)[0]
+            top = plan["Plan"]
+            plans.append({
+                "query": " ".join(query.split()),
+                "execution_ms": plan.get("Execution Time"),
+                "planning_ms": plan.get("Planning Time"),
+                "shared_hit_blocks": top.get("Shared Hit Blocks"),
+                "shared_read_blocks": top.get("Shared Read Blocks"),
+                "plan": plan,
+            })
+    finally:
+        await transaction.rollback()
+
+    timings.sort()
+    return {
+        "iterations": len(timings),
+        "timing_ms": {
+            "min": round(timings[0], 3),
+            "p50": round(statistics.median(timings), 3),
+            "p95": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+            "mean": round(statistics.fmean(timings), 3),
+            "max": round(timings[-1], 3),
+        },
+        "queries": plans,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(users: int, requests: int, months: int, iterations: int, reseed: bool, only: Optional[str]) -> Dict[str, Any]:
+    conn = await asyncpg.connect(**DB_CONFIG, server_settings={"search_path": BENCH_SCHEMA})
+    try:
+        await conn.execute(f"CREATE SCHEMA IF NOT EXISTS {BENCH_SCHEMA}")
+        if reseed or await _get_seeded_size(conn) != (users, requests, months):
+            logger.warning(f"Заполнение схемы {BENCH_SCHEMA}: {users} пользователей, {requests} заявок")
+            await seed(conn, users, requests, months)
+
+        rnd = random.Random(42)
+        results = {}
+        for case in build_cases(users, requests):
+            if only and only not in case.name:
+                continue
+            logger.warning(f"Замер {case.name}")
+            results[case.name] = await run_case(conn, case, iterations, rnd)
+
+        return {
+            "meta": {
+                "commit": _git_commit(),
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "postgres": await conn.fetchval("SHOW server_version"),
+                "python": platform.python_version(),
+                "users": users,
+                "requests": requests,
+                "months": months,
+                "iterations": iterations,
+            },
+            "results": results,
+        }
+    finally:
+        await conn.close()
+
+
+def compare(old_path: str, new_path: str):
+    """Сравнение двух отчётов по медиане времени вызова"""
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+    print(f"{'вызов':<34}{old['meta']['commit'] or 'old':>12}{new['meta']['commit'] or 'new':>12}{'изм.':>9}")
+    for name, result in new["results"].items():
+        before = old["results"].get(name, {}).get("timing_ms", {}).get("p50")
+        after = result["timing_ms"]["p50"]
+        change = f"{(after - before) / before * 100:+.0f}%" if before else "—"
+        print(f"{name:<34}{before if before is not None else '—':>12}{after:>12}{change:>9}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(
+        description=f"Бенчмарк функций src/database.py на синтетических данных (схема {BENCH_SCHEMA} в БД из .env)"
+    )
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--requests", type=int, default=10_000)
+    parser.add_argument("--months", type=int, default=12, help="за сколько месяцев распределить заявки")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--reseed", action="store_true", help="пересоздать данные, даже если размеры совпадают")
+    parser.add_argument("--only", help="замерять только вызовы, в имени которых есть эта подстрока")
+    parser.add_argument("--output", help="файл для JSON-отчёта (по умолчанию — stdout)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="сравнить два отчёта")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+    else:
+        report = asyncio.run(run(args.users, args.requests, args.months, args.iterations, args.reseed, args.only))
+        output = json.dumps(report, ensure_ascii=False, indent=2, default=str)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                f.write(output)
+        else:
+            print(output)
@@ -0,0 +1,51 @@
+from typing import Optional
+
+import asyncpg
+from aiogram import Dispatcher
+from aiogram.utils.callback_answer import CallbackAnswerMiddleware
+
+from src.config import UPDATE_WAIT_TIMEOUT, UPDATES_PER_CONNECTION
+from src.handlers.admin_handlers import router as admin_router
+from src.handlers.user_handlers import router as user_router
+from src.middlewares.bot_context_middleware import BotContextMiddleware
+from src.middlewares.chat_queue_middleware import ChatQueueMiddleware
+from src.middlewares.db_connection_middleware import DbConnectionMiddleware
+from src.middlewares.db_pool_middleware import DbPoolMiddleware
+from src.middlewares.error_handler import ErrorHandlingMiddleware
+from src.middlewares.fsm_cache_middleware import FSMCacheMiddleware
+from src.utils.tracing import Tracer
+
+
+def setup_dispatcher(dp: Dispatcher, pool: asyncpg.Pool, bot_context: BotContextMiddleware,
+                     tracer: Optional[Tracer] = None) -> ChatQueueMiddleware:
+    """Основная цепочка middleware и роутеры бота.
+
+    Общая для запуска бота и для повтора записанного трафика (src.replay),
+    чтобы повтор проходил через тот же код. Middleware наблюдения (трейсинг,
+    медленные апдейты, здоровье) регистрируются до вызова. Возвращает очередь
+    апдейтов для метрик.
+    """
+    # Очередь апдейтов по чатам: первой, чтобы ожидание слота не держало соединение.
+    # Предел считается от пула этого процесса (в многопроцессном режиме он меньше)
+    chat_queue = ChatQueueMiddleware(
+        max_in_flight=pool.get_max_size() * UPDATES_PER_CONNECTION,
+        wait_timeout=UPDATE_WAIT_TIMEOUT
+    )
+    dp.update.middleware(chat_queue)
+    # Профиль и уведомления бота, получившего апдейт
+    dp.update.middleware(bot_context)
+    # Одно чтение и одна запись FSM за апдейт; внутри очереди чата, поэтому состояние,
+    # по которому маршрутизируется апдейт, не устарело к моменту обработки.
+    # Внешний FSMContextMiddleware читал бы его ещё до очереди — он заменяется
+    if dp.fsm in dp.update.outer_middleware:
+        dp.update.outer_middleware.unregister(dp.fsm)
+    dp.update.middleware(FSMCacheMiddleware(dp.fsm))
+    # Подключаем middleware для передачи пула
+    dp.update.middleware(DbPoolMiddleware(pool))
+    dp.update.middleware(DbConnectionMiddleware(pool, tracer))
+    dp.update.middleware(ErrorHandlingMiddleware())
+    dp.callback_query.middleware(CallbackAnswerMiddleware())
+
+    dp.include_router(user_router)
+    dp.include_router(admin_router)
+    return chat_queue
@@ -1,4 +1,8 @@
+import asyncio
 import logging
+import re
+from collections import defaultdict
+from datetime import datetime, timedelta
 
 import asyncpg
 from aiogram import Router, F
@@ -6,19 +10,32 @@ from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, Message
 
-from src.config import ADMIN_CHAT_ID
-from src.database import get_all_user_ids, get_statistics, is_admin, get_user_by_id, get_users_by_ids
+from src.config import ADMIN_CHAT_ID, OPTION_NAMES, PROFILE_SECONDS
+from src.broadcasts import BroadcastScheduler, format_broadcast_result, send_broadcast
+from src.database import (
+    ROLLUP_ALL_OPTIONS, create_schedule, delete_schedule, get_active_schedules,
+    get_all_user_ids, get_request, get_request_rollups, get_statistics,
+    get_user_by_id, get_users_by_ids, is_admin
+)
 from src.keyboards import (
     get_admin_menu_keyboard, get_broadcast_confirm_keyboard,
-    get_broadcast_input_keyboard
+    get_broadcast_input_keyboard, get_schedules_keyboard
 )
+from src.health import HealthMonitor
+from src.notifications import RequestNotification, send_request_notification
 from src.states import AdminPanel
-from src.utils.validators import entities_to_html
+from src.utils.cron import next_cron_time
+from src.utils.media_groups import MediaGroupDebouncer
+from src.utils.profiling import SamplingProfiler
 
 
 logger = logging.getLogger(__name__)
 router = Router()
 
+# Предпросмотр рассылки-альбома показывается после последней его части
+broadcast_album_debouncer = MediaGroupDebouncer()
+
+
 
 @router.message(Command("admin"))
 async def cmd_admin(message: Message, conn: asyncpg.Connection):
@@ -37,13 +54,46 @@ async def cmd_admin(message: Message, conn: asyncpg.Connection):
         await message.answer("Ошибка при проверке прав доступа. Попробуйте позже.")
 
 
+@router.message(Command("profile"))
+async def cmd_profile(message: Message, conn: asyncpg.Connection, profiler: SamplingProfiler):
+    """Запуск сэмплирующего профайлера: /profile [секунды]"""
+    if not await is_admin(conn, message.from_user.id):
+        await message.answer("❌ У вас нет доступа к админ-панели.")
+        return
+
+    args = (message.text or "").split()
+    seconds = int(args[1]) if len(args) > 1 and args[1].isdigit() else PROFILE_SECONDS
+    seconds = max(1, min(seconds, 300))
+
+    path = profiler.start(seconds)
+    if path is None:
+        await message.answer("⏳ Профилирование уже идёт, дождитесь его завершения.")
+        return
+    await message.answer(f"🔬 Профилирование запущено на {seconds} с.\nРезультат: `{path}`", parse_mode="Markdown")
+
+
+@router.message(F.text.regexp(r"^/req_(\d+)(@\w+)?$").as_("match"))
+async def cmd_request(message: Message, conn: asyncpg.Connection, match: re.Match):
+    """Полная заявка (с фото) по ссылке /req_<id> из сводки уведомлений"""
+    if not await is_admin(conn, message.from_user.id):
+        await message.answer("❌ У вас нет доступа к админ-панели.")
+        return
+
+    request = await get_request(conn, message.bot.id, int(match.group(1)))
+    if not request:
+        await message.answer("❌ Заявка не найдена.")
+        return
+
+    await send_request_notification(message.bot, message.chat.id, RequestNotification.from_row(request))
+
+
 @router.callback_query(F.data == "admin_stats")
 async def handle_admin_stats(callback: CallbackQuery, conn: asyncpg.Connection):
     """Показ статистики пользователей и заявок"""
     if not await is_admin(conn, callback.from_user.id):
         await callback.answer("❌ Нет доступа.", show_alert=True)
         return
-    users_count, requests_count = await get_statistics(conn)
+    users_count, requests_count = await get_statistics(conn, callback.bot.id)
     await callback.message.edit_text(
         f"📊 *Статистика бота*\n\n👥 Пользователей: {users_count}\n📝 Заявок: {requests_count}",
         parse_mode="Markdown",
@@ -52,6 +102,42 @@ async def handle_admin_stats(callback: CallbackQuery, conn: asyncpg.Connection):
     await callback.answer()
 
 
+@router.callback_query(F.data == "admin_trends")
+async def handle_admin_trends(callback: CallbackQuery, conn: asyncpg.Connection):
+    """Динамика заявок по часам, дням, типам и опциям из почасовой аналитики"""
+    if not await is_admin(conn, callback.from_user.id):
+        await callback.answer("❌ Нет доступа.", show_alert=True)
+        return
+
+    rows = await get_request_rollups(conn, callback.bot.id, days=7)
+    since_24h = datetime.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=23)
+    by_hour, by_day, by_type, by_option = defaultdict(int), defaultdict(int), defaultdict(int), defaultdict(int)
+    for row in rows:
+        if row["option"] != ROLLUP_ALL_OPTIONS:
+            by_option[row["option"]] += row["requests_count"]
+            continue
+        by_day[row["hour"].date()] += row["requests_count"]
+        by_type[row["request_type"]] += row["requests_count"]
+        if row["hour"] >= since_24h:
+            by_hour[row["hour"]] += row["requests_count"]
+
+    lines = ["📈 *Динамика заявок*", "", "*За 24 часа:*"]
+    lines += [f"{hour:%H:00} — {count}" for hour, count in sorted(by_hour.items())] or ["нет заявок"]
+    lines += ["", "*За 7 дней:*"]
+    lines += [f"{day:%d.%m} — {count}" for day, count in sorted(by_day.items())] or ["нет заявок"]
+    lines += ["", "*По типам (7 дней):*"]
+    lines += [f"{request_type} — {count}" for request_type, count in sorted(by_type.items(), key=lambda x: -x[1])]
+    lines += ["", "*По опциям (7 дней):*"]
+    lines += [f"{OPTION_NAMES.get(option, option)} — {count}" for option, count in sorted(by_option.items(), key=lambda x: -x[1])]
+
+    await callback.message.edit_text(
+        "\n".join(lines),
+        parse_mode="Markdown",
+        reply_markup=get_admin_menu_keyboard()
+    )
+    await callback.answer()
+
+
 @router.callback_query(F.data == "admin_broadcast")
 async def handle_admin_broadcast(callback: CallbackQuery, state: FSMContext, conn: asyncpg.Connection):
     """Запуск процесса рассылки"""
@@ -60,10 +146,12 @@ async def handle_admin_broadcast(callback: CallbackQuery, state: FSMContext, con
         return
 
     await callback.message.edit_text(
-        "📢 *Рассылка*\n\nОтправьте сообщение для рассылки (текст, фото или фото с текстом):",
+        "📢 *Рассылка*\n\nОтправьте сообщение для рассылки (текст, фото, видео, документ или альбом):",
         parse_mode="Markdown",
         reply_markup=get_broadcast_input_keyboard()
     )
+    # Подсказку удаляем, когда придёт сообщение для рассылки
+    await state.update_data(broadcast_prompt_id=callback.message.message_id)
     await state.set_state(AdminPanel.waiting_for_broadcast_message)
     await callback.answer()
 
@@ -105,7 +193,7 @@ async def handle_user_info(callback: CallbackQuery, conn: asyncpg.Connection):
         return
 
     user_id = int(callback.data.split(":")[1])
-    user_info = await get_user_by_id(conn, user_id)
+    user_info = await get_user_by_id(conn, callback.bot.id, user_id)
     
     if user_info:
         info_text = (
@@ -147,50 +235,77 @@ async def process_broadcast_message(message: Message, state: FSMContext, conn: a
     if not await is_admin(conn, message.from_user.id):
         return
 
-    if message.message_thread_id is None:
+    state_data = await state.get_data()
+    prompt_id = state_data.get("broadcast_prompt_id")
+    if prompt_id is not None:
         try:
-            await message.bot.delete_message(chat_id=message.chat.id, message_id=message.message_id - 1)
+            await message.bot.delete_message(chat_id=message.chat.id, message_id=prompt_id)
         except Exception as e:
             logger.error(f"Ошибка удаления сообщения: {e}")
 
-    text = message.text or message.caption or ""
-    entities = message.entities or message.caption_entities or []
-    parse_mode = "HTML" if entities else None
-    if entities:
-        text = entities_to_html(text, entities)
-
+    # Храним только ссылку на исходное сообщение: при рассылке оно копируется как есть
     broadcast_data = {
-        "text": text,
-        "photo": message.photo[-1].file_id if message.photo else None,
-        "parse_mode": parse_mode
+        "from_chat_id": message.chat.id,
+        "message_ids": [message.message_id],
+        "media_group_id": message.media_group_id
     }
+    await state.update_data(broadcast_data=broadcast_data, broadcast_prompt_id=None)
+    await state.set_state(AdminPanel.confirming_broadcast)
+
+    if message.media_group_id:
+        # Кнопка подтверждения появится, когда придут все части альбома
+        _schedule_broadcast_preview(message)
+    else:
+        await _send_broadcast_preview(message)
+
+
+@router.message(AdminPanel.confirming_broadcast, F.media_group_id)
+async def process_broadcast_album_part(message: Message, state: FSMContext):
+    """Добавление остальных сообщений альбома к рассылке"""
+    state_data = await state.get_data()
+    broadcast_data = state_data.get("broadcast_data", {})
+    if broadcast_data.get("media_group_id") != message.media_group_id:
+        return
 
+    broadcast_data["message_ids"] = sorted(broadcast_data["message_ids"] + [message.message_id])
     await state.update_data(broadcast_data=broadcast_data)
+    _schedule_broadcast_preview(message)
 
-    preview_text = f"📢 *Предварительный просмотр рассылки:*\n\n"
-    if broadcast_data["photo"]:
-        preview_text += "📷 *Фото:* Да\n"
-    preview_text += f"📝 *Текст:* {broadcast_data['text'][:100]}{'...' if len(broadcast_data['text']) > 100 else ''}"
 
-    if broadcast_data["photo"]:
-        await message.answer_photo(
-            photo=broadcast_data["photo"],
-            caption=preview_text,
+async def _send_broadcast_preview(message: Message):
+    await message.answer(
+        "📢 *Предварительный просмотр рассылки:*\n\n"
+        "Сообщение выше будет отправлено всем пользователям без изменений.",
+        parse_mode="Markdown",
+        reply_markup=get_broadcast_confirm_keyboard()
+    )
+
+
+def _schedule_broadcast_preview(message: Message):
+    """Отложенный предпросмотр рассылки после последней части альбома"""
+    broadcast_album_debouncer.touch(message.media_group_id, lambda: _send_broadcast_preview(message))
+
+
+async def _run_broadcast(callback: CallbackQuery, pool: asyncpg.Pool, broadcast_data: dict, health: HealthMonitor):
+    """Рассылка в фоне; по окончании сообщение с подтверждением меняется на итог"""
+    try:
+        counts, total = await send_broadcast(callback.bot, pool, callback.from_user.id, broadcast_data, health)
+        await callback.message.edit_text(
+            format_broadcast_result(counts, total),
             parse_mode="Markdown",
-            reply_markup=get_broadcast_confirm_keyboard()
+            reply_markup=get_admin_menu_keyboard()
         )
-    else:
-        await message.answer(
-            preview_text,
-            parse_mode="Markdown",
-            reply_markup=get_broadcast_confirm_keyboard()
+    except Exception as e:
+        logger.error(f"Broadcast failed: {e}")
+        await callback.message.edit_text(
+            "❌ Ошибка при отправке рассылки.", 
+            reply_markup=get_admin_menu_keyboard()
         )
 
-    await state.set_state(AdminPanel.confirming_broadcast)
-
 
 @router.callback_query(F.data.startswith("broadcast_"))
-async def broadcast_confirm_handler(callback: CallbackQuery, state: FSMContext, conn: asyncpg.Connection):
+async def broadcast_confirm_handler(callback: CallbackQuery, state: FSMContext, conn: asyncpg.Connection,
+                                    db_pool: asyncpg.Pool, health: HealthMonitor):
     """Подтверждение или отмена рассылки"""
     if not await is_admin(conn, callback.from_user.id):
         await callback.answer("❌ Нет доступа.", show_alert=True)
@@ -198,44 +313,28 @@ async def broadcast_confirm_handler(callback: CallbackQuery, state: FSMContext,
 
     if callback.data == "broadcast_confirm":
         state_data = await state.get_data()
-        broadcast_data = state_data.get("broadcast_data", {})
-        success_count = 0
-
-        try:
-            user_ids = await get_all_user_ids(conn)
-            for user_id in user_ids:
-                try:
-                    if broadcast_data["photo"]:
-                        await callback.bot.send_photo(
-                            chat_id=user_id,
-                            photo=broadcast_data["photo"],
-                            caption=broadcast_data["text"],
-                            parse_mode=broadcast_data.get("parse_mode")
-                        )
-                    else:
-                        await callback.bot.send_message(
-                            chat_id=user_id,
-                            text=broadcast_data["text"],
-                            parse_mode=broadcast_data.get("parse_mode")
-                        )
-                    success_count += 1
-                except Exception as e:
-                    logger.error(f"Broadcast error to {user_id}: {e}")
-                    continue
-
-            await callback.message.edit_text(
-                f"✅ *Рассылка завершена!*\n📤 Отправлено: {success_count}/{len(user_ids)}",
-                parse_mode="Markdown",
-                reply_markup=get_admin_menu_keyboard()
-            )
-        except Exception as e:
-            logger.error(f"Broadcast failed: {e}")
-            await callback.message.edit_text(
-                "❌ Ошибка при отправке рассылки.", 
-                reply_markup=get_admin_menu_keyboard()
-            )
-
+        broadcast_data = state_data.get("broadcast_data")
+        if not broadcast_data:
+            # Повторное нажатие: рассылка уже запущена или отменена
+            await callback.answer("Рассылка уже запущена.")
+            return
         await state.clear()
+        await callback.message.edit_text("📤 Рассылка отправляется…")
+        # В фоне и через пул, как у планировщика: обработчик не держит соединение,
+        # очередь чата админа и слот апдейта, пока идёт рассылка
+        task = asyncio.create_task(_run_broadcast(callback, db_pool, broadcast_data, health))
+        health.register_task(f"broadcast_{callback.from_user.id}", task)
+
+    elif callback.data == "broadcast_schedule":
+        await callback.message.edit_text(
+            "🕒 *Планирование рассылки*\n\n"
+            "Отправьте время разовой рассылки в формате `ДД.ММ.ГГГГ ЧЧ:ММ`\n"
+            "или правило повтора в формате cron: `минута час день месяц день_недели`\n"
+            "(например, `0 10 * * 1` — каждый понедельник в 10:00).",
+            parse_mode="Markdown",
+            reply_markup=get_broadcast_input_keyboard()
+        )
+        await state.set_state(AdminPanel.waiting_for_schedule)
 
     elif callback.data == "broadcast_cancel":
         await callback.message.edit_text("❌ Рассылка отменена.", reply_markup=get_admin_menu_keyboard())
@@ -244,9 +343,83 @@ async def broadcast_confirm_handler(callback: CallbackQuery, state: FSMContext,
     await callback.answer()
 
 
+@router.message(AdminPanel.waiting_for_schedule)
+async def process_broadcast_schedule(message: Message, state: FSMContext, conn: asyncpg.Connection,
+                                     scheduler: BroadcastScheduler):
+    """Сохранение расписания рассылки: дата и время или cron-выражение"""
+    if not await is_admin(conn, message.from_user.id):
+        return
+
+    rule = (message.text or "").strip()
+    cron = None
+    try:
+        if re.match(r"^\d{2}\.\d{2}\.\d{4} \d{2}:\d{2}$", rule):
+            next_run_at = datetime.strptime(rule, "%d.%m.%Y %H:%M")
+            if next_run_at <= datetime.now():
+                await message.answer("❌ Это время уже прошло. Укажите время в будущем.")
+                return
+        else:
+            next_run_at = next_cron_time(rule, datetime.now())
+            cron = rule
+    except ValueError as e:
+        await message.answer(f"❌ Не удалось разобрать время или правило: {e}")
+        return
+
+    state_data = await state.get_data()
+    broadcast_data = state_data.get("broadcast_data", {})
+    schedule_id = await create_schedule(
+        conn, message.bot.id, message.from_user.id, broadcast_data["from_chat_id"], broadcast_data["message_ids"],
+        next_run_at, cron
+    )
+    scheduler.wake()
+
+    repeat_text = f"\n🔁 Повтор: `{cron}`" if cron else ""
+    await message.answer(
+        f"✅ Рассылка №{schedule_id} запланирована на {next_run_at:%d.%m.%Y %H:%M}{repeat_text}",
+        parse_mode="Markdown",
+        reply_markup=get_admin_menu_keyboard()
+    )
+    await state.clear()
+
+
+@router.callback_query(F.data == "admin_schedules")
+async def handle_admin_schedules(callback: CallbackQuery, conn: asyncpg.Connection):
+    """Список запланированных рассылок"""
+    if not await is_admin(conn, callback.from_user.id):
+        await callback.answer("❌ Нет доступа.", show_alert=True)
+        return
+
+    schedules = await get_active_schedules(conn, callback.bot.id)
+    lines = ["🕒 *Запланированные рассылки*", ""]
+    for schedule in schedules:
+        repeat_text = f", повтор `{schedule['cron']}`" if schedule["cron"] else ""
+        lines.append(f"№{schedule['id']}: {schedule['next_run_at']:%d.%m.%Y %H:%M}{repeat_text}")
+    if not schedules:
+        lines.append("Нет запланированных рассылок.")
+
+    await callback.message.edit_text(
+        "\n".join(lines),
+        parse_mode="Markdown",
+        reply_markup=get_schedules_keyboard(schedules)
+    )
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("sched_del:"))
+async def handle_schedule_delete(callback: CallbackQuery, conn: asyncpg.Connection, scheduler: BroadcastScheduler):
+    """Отмена запланированной рассылки"""
+    if not await is_admin(conn, callback.from_user.id):
+        await callback.answer("❌ Нет доступа.", show_alert=True)
+        return
+
+    await delete_schedule(conn, callback.bot.id, int(callback.data.split(":")[1]))
+    scheduler.wake()
+    await handle_admin_schedules(callback, conn)
+
+
 async def show_users_page(message: Message, page: int, state: FSMContext, conn):
     """Показ страницы пользователей с пагинацией"""
-    all_user_ids = await get_all_user_ids(conn)
+    all_user_ids = await get_all_user_ids(conn, message.bot.id)
     total_users = len(all_user_ids)
     users_per_page = 5
     total_pages = (total_users + users_per_page - 1) // users_per_page
@@ -256,7 +429,7 @@ async def show_users_page(message: Message, page: int, state: FSMContext, conn):
     end_idx = start_idx + users_per_page
     current_users = all_user_ids[start_idx:end_idx]
 
-    users_data = await get_users_by_ids(conn, current_users)
+    users_data = await get_users_by_ids(conn, message.bot.id, current_users)
 
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text=user["full_name"], callback_data=f"user_info:{user['user_id']}")]
@@ -1,36 +1,51 @@
 import logging
 import re
-from datetime import datetime
+import uuid
+from datetime import datetime, timedelta
 
 import asyncpg
 from aiogram import Router, F
-from aiogram.filters import Command
+from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.types import (
-    CallbackQuery, FSInputFile, InlineKeyboardButton, 
-    InlineKeyboardMarkup, Message
+    CallbackQuery, FSInputFile, Message
 )
 
-from src.config import ADMIN_CHAT_ID, COMPANY_INFO, CONTACTS_INFO
-from src.database import is_admin, register_user, save_request
+from src.bots import BotProfile
+from src.config import OPTION_NAMES
+from src.database import get_user_requests, is_admin, reactivate_user, register_user, save_request
 from src.keyboards import (
     get_admin_menu_keyboard, get_cancel_keyboard, get_contacts_inline_keyboard,
-    get_main_menu, get_options_inline_keyboard, get_phone_keyboard,
-    get_request_type_keyboard
+    get_main_menu, get_my_requests_keyboard, get_options_inline_keyboard,
+    get_phone_keyboard, get_request_type_keyboard
 )
+from src.notifications import AdminNotifier, RequestNotification
 from src.states import Registration, RequestForm
-from src.utils.validators import entities_to_html, is_valid_date, is_valid_full_name, is_valid_phone
+from src.utils.media_groups import MediaGroupDebouncer
+from src.utils.validators import is_valid_date, is_valid_full_name, is_valid_phone
 
 
 logger = logging.getLogger(__name__)
 router = Router()
 
+MY_REQUESTS_PER_PAGE = 5
+EPOCH = datetime(1970, 1, 1)
+# Альбом скриншотов: сколько ждать следующую часть (секунды) и сколько фото максимум
+MEDIA_GROUP_DEBOUNCE = 1.0
+MAX_SCREENSHOTS = 10
+
+album_debouncer = MediaGroupDebouncer(MEDIA_GROUP_DEBOUNCE)
+
 
 @router.message(Command("start"))
 async def cmd_start(message: Message, state: FSMContext, conn: asyncpg.Connection):
     """Обработчик команды /start - регистрация пользователя"""
     try:
-        user = await conn.fetchrow("SELECT user_id FROM users WHERE user_id=$1", message.from_user.id)
+        user = await conn.fetchrow(
+            "SELECT user_id, is_active FROM users WHERE bot_id=$1 AND user_id=$2", message.bot.id, message.from_user.id
+        )
+        if user and not user["is_active"]:
+            await reactivate_user(conn, message.bot.id, message.from_user.id)
     except Exception as e:
         logger.error(f"DB error on user check: {e}")
         await message.answer("Ошибка при обращении к базе данных. Попробуйте позже.")
@@ -96,7 +111,7 @@ async def process_phone(message: Message, state: FSMContext, conn: asyncpg.Conne
     birth_date_obj = datetime.strptime(birth_date_str, '%d.%m.%Y').date()
 
     try:
-        await register_user(conn, user_id, full_name, birth_date_obj, phone_number)
+        await register_user(conn, message.bot.id, user_id, full_name, birth_date_obj, phone_number)
     except Exception as e:
         logger.error(f"DB error on user registration: {e}")
         await message.answer("Ошибка при регистрации. Попробуйте позже.")
@@ -113,7 +128,9 @@ async def process_phone(message: Message, state: FSMContext, conn: asyncpg.Conne
 async def start_request(message: Message, state: FSMContext, conn: asyncpg.Connection):
     """Начало процесса создания заявки. Проверяем, что пользователь зарегистрирован."""
     try:
-        is_registered = await conn.fetchval("SELECT EXISTS (SELECT 1 FROM users WHERE user_id=$1)", message.from_user.id)
+        is_registered = await conn.fetchval(
+            "SELECT EXISTS (SELECT 1 FROM users WHERE bot_id=$1 AND user_id=$2)", message.bot.id, message.from_user.id
+        )
     except Exception as e:
         logger.error(f"DB error on registration check before request: {e}")
         await message.answer("Ошибка при обращении к базе данных. Попробуйте позже.")
@@ -125,6 +142,8 @@ async def start_request(message: Message, state: FSMContext, conn: asyncpg.Conne
         return
 
     await message.answer("Пожалуйста, выберите тип заявки:", reply_markup=get_request_type_keyboard())
+    # Ключ черновика: повторное подтверждение той же заявки не создаст дубль
+    await state.set_data({"draft_key": uuid.uuid4().hex})
     await state.set_state(RequestForm.choosing_type)
 
 
@@ -157,22 +176,99 @@ async def process_screenshot(message: Message, state: FSMContext):
         await message.answer("Пожалуйста, отправьте фото или нажмите ❌ Отмена.")
         return
 
-    photo_id = message.photo[-1].file_id if message.photo else None
-    await state.update_data(screenshot=photo_id)
-
-    await message.answer("Теперь выберите, что требуется:", reply_markup=get_options_inline_keyboard())
+    screenshots = [message.photo[-1].file_id] if message.photo else []
+    await state.update_data(screenshots=screenshots, media_group_id=message.media_group_id)
     await state.set_state(RequestForm.choosing_options)
 
+    if message.media_group_id:
+        # Клавиатуру показываем один раз, когда придут все части альбома
+        _schedule_options_prompt(message)
+    else:
+        await message.answer("Теперь выберите, что требуется:", reply_markup=get_options_inline_keyboard())
+
+
+@router.message(RequestForm.choosing_options, F.media_group_id, F.photo)
+async def process_screenshot_album_part(message: Message, state: FSMContext):
+    """Остальные фото альбома со скриншотами (первое обработано в process_screenshot)"""
+    state_data = await state.get_data()
+    if message.media_group_id != state_data.get("media_group_id"):
+        return
+
+    screenshots = state_data["screenshots"]
+    if len(screenshots) < MAX_SCREENSHOTS:
+        await state.update_data(screenshots=screenshots + [message.photo[-1].file_id])
+    _schedule_options_prompt(message)
+
+
+def _schedule_options_prompt(message: Message):
+    """Отложенная отправка клавиатуры опций после последней части альбома"""
+    async def prompt():
+        await message.answer("Теперь выберите, что требуется:", reply_markup=get_options_inline_keyboard())
+
+    album_debouncer.touch(message.media_group_id, prompt)
+
+
+@router.message(F.text == "📋 Мои заявки")
+async def handle_my_requests(message: Message, conn: asyncpg.Connection):
+    """Показ первой (самой новой) страницы заявок пользователя"""
+    text, keyboard = await _render_my_requests(conn, message.bot.id, message.from_user.id)
+    await message.answer(text, reply_markup=keyboard)
+
+
+@router.callback_query(F.data.startswith("mr:"))
+async def handle_my_requests_page(callback: CallbackQuery, conn: asyncpg.Connection):
+    """Навигация по заявкам пользователя: mr:n:<курсор> — новее, mr:o:<курсор> — старее"""
+    _, direction, request_id, created_us = callback.data.split(":")
+    cursor = (EPOCH + timedelta(microseconds=int(created_us)), int(request_id))
+    text, keyboard = await _render_my_requests(
+        conn, callback.bot.id, callback.from_user.id, cursor, newer=direction == "n"
+    )
+    await callback.message.edit_text(text, reply_markup=keyboard)
+    await callback.answer()
+
+
+def _encode_cursor(row) -> str:
+    """Курсор страницы для callback_data: id и created_at в микросекундах от эпохи"""
+    return f"{row['id']}:{(row['created_at'] - EPOCH) // timedelta(microseconds=1)}"
+
+
+async def _render_my_requests(conn: asyncpg.Connection, bot_id: int, user_id: int, cursor=None, newer=False):
+    """Текст и клавиатура страницы заявок"""
+    rows = await get_user_requests(conn, bot_id, user_id, MY_REQUESTS_PER_PAGE, cursor, newer)
+    if cursor is not None and (not rows or newer and len(rows) <= MY_REQUESTS_PER_PAGE):
+        # Новее курсора меньше страницы — это начало списка, показываем его полной первой страницей;
+        # пустая страница — заявки курсора удалены по сроку хранения
+        return await _render_my_requests(conn, bot_id, user_id)
+    has_more = len(rows) > MY_REQUESTS_PER_PAGE
+    if newer:
+        rows = rows[-MY_REQUESTS_PER_PAGE:]
+    else:
+        rows = rows[:MY_REQUESTS_PER_PAGE]
+
+    if not rows:
+        return "📋 У вас пока нет заявок.", None
+
+    lines = ["📋 Ваши заявки:\n"]
+    for row in rows:
+        options = ", ".join(OPTION_NAMES.get(opt, opt) for opt in row["options"].split(", "))
+        lines.append(f"№{row['id']} от {row['created_at']:%d.%m.%Y %H:%M}\n{row['request_type']} — {options}\n")
+
+    # Есть ли заявки новее/старее показанных: в направлении листания — по лишней строке,
+    # в обратном — по факту наличия курсора
+    if newer:
+        newer_cursor = _encode_cursor(rows[0]) if has_more else None
+        older_cursor = _encode_cursor(rows[-1])
+    else:
+        newer_cursor = _encode_cursor(rows[0]) if cursor is not None else None
+        older_cursor = _encode_cursor(rows[-1]) if has_more else None
+    return "\n".join(lines), get_my_requests_keyboard(newer_cursor, older_cursor)
+
 
 @router.callback_query(RequestForm.choosing_options)
-async def process_options_callback(callback: CallbackQuery, state: FSMContext, conn: asyncpg.Connection):
+async def process_options_callback(callback: CallbackQuery, state: FSMContext, conn: asyncpg.Connection,
+                                   notifier: AdminNotifier):
     """Обработка выбора опций заявки"""
-    option_map = {
-        "equipment": "Оборудование",
-        "it": "IT-поддержка",
-        "cleaning": "Уборка",
-        "coffee": "Кофе"
-    }
+    option_map = OPTION_NAMES
 
     state_data = await state.get_data()
     selected = set(state_data.get("options", []))
@@ -182,7 +278,7 @@ async def process_options_callback(callback: CallbackQuery, state: FSMContext, c
         return
 
     if callback.data == "confirm":
-        await _handle_request_confirmation(callback, state, selected, option_map, conn)
+        await _handle_request_confirmation(callback, state, selected, option_map, conn, notifier)
 
 
 async def _handle_option_selection(callback: CallbackQuery, state: FSMContext, selected: set, option_map: dict):
@@ -198,24 +294,32 @@ async def _handle_option_selection(callback: CallbackQuery, state: FSMContext, s
     await callback.answer()
 
 
-async def _handle_request_confirmation(callback: CallbackQuery, state: FSMContext, selected: set, option_map: dict, conn: asyncpg.Connection):
+async def _handle_request_confirmation(callback: CallbackQuery, state: FSMContext, selected: set, option_map: dict,
+                                       conn: asyncpg.Connection, notifier: AdminNotifier):
     """Подтверждение и сохранение заявки"""
+    state_data = await state.get_data()
     if not selected:
         await callback.answer("Выберите хотя бы один пункт!", show_alert=True)
         return
 
     try:
         user_id = callback.from_user.id
-        state_data = await state.get_data()
-        user_info = await conn.fetchrow("SELECT full_name, phone_number FROM users WHERE user_id = $1", user_id)
+        user_info = await conn.fetchrow(
+            "SELECT full_name, phone_number FROM users WHERE bot_id = $1 AND user_id = $2", callback.bot.id, user_id
+        )
         if not user_info:
             await callback.message.answer("❌ Вы ещё не зарегистрированы. Отправьте /start, чтобы пройти регистрацию.", reply_markup=get_main_menu())
             await state.clear()
             await callback.answer()
             return
-        request_id = await save_request(
-            conn, user_id, state_data["request_type"], state_data.get("screenshot"), list(selected)
+        request_id, created = await save_request(
+            conn, callback.bot.id, user_id, state_data["request_type"], state_data.get("screenshots", []),
+            list(selected), idempotency_key=state_data.get("draft_key")
         )
+        # Диалог завершён до любых вызовов Bot API: повторное «Подтвердить» (двойное нажатие,
+        # повторная доставка) попадёт в handle_submitted_confirm, даже если ответ ниже не отправится
+        await state.set_state(None)
+        await state.set_data({"submitted_request_id": request_id, "draft_key": state_data.get("draft_key")})
     except Exception as e:
         logger.error(f"Ошибка при сохранении заявки: {e}")
         await callback.message.answer("❌ Ошибка сохранения заявки. Попробуйте позже.", reply_markup=get_main_menu())
@@ -223,49 +327,59 @@ async def _handle_request_confirmation(callback: CallbackQuery, state: FSMContex
         await callback.answer()
         return
 
-    await _send_request_to_admin(callback, state_data, selected, option_map, user_info, request_id)
+    if created:
+        _send_request_to_admin(notifier, callback, state_data, selected, option_map, user_info, request_id)
     await callback.message.edit_reply_markup()
     await callback.message.answer("Ваша заявка отправлена! Спасибо!", reply_markup=get_main_menu())
-    await state.clear()
     await callback.answer()
 
 
-async def _send_request_to_admin(callback: CallbackQuery, state_data: dict, selected: set, option_map: dict, user_info: dict, request_id: int):
-    """Отправка заявки администратору"""
-    caption = f"Заявка №{request_id}\nОт: {user_info['full_name']} ({user_info['phone_number']})\nТип: {state_data['request_type']}\nПредметы: {', '.join([option_map.get(opt, opt) for opt in selected])}"
+@router.callback_query(StateFilter(None), F.data == "confirm")
+async def handle_submitted_confirm(callback: CallbackQuery, state: FSMContext):
+    """«Подтвердить» вне заполнения заявки: повторное нажатие после отправки или устаревшая кнопка"""
+    state_data = await state.get_data()
+    if state_data.get("submitted_request_id") is not None:
+        await callback.answer("Заявка уже отправлена.")
+    else:
+        await callback.answer("Эта заявка уже неактуальна. Нажмите «📝 Оставить заявку», чтобы создать новую.",
+                              show_alert=True)
 
-    kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text='Профиль', url=f'tg://user?id={callback.from_user.id}')]
-    ])
 
-    try:
-        if state_data.get("screenshot"):
-            await callback.bot.send_photo(ADMIN_CHAT_ID, state_data["screenshot"], caption=caption, reply_markup=kb)
-        else:
-            await callback.bot.send_message(ADMIN_CHAT_ID, caption, reply_markup=kb)
-    except Exception as e:
-        logger.error(f"Ошибка отправки админу: {e}")
+def _send_request_to_admin(notifier: AdminNotifier, callback: CallbackQuery, state_data: dict, selected: set, option_map: dict, user_info: dict, request_id: int):
+    """Постановка уведомления о заявке в очередь отправки администраторам"""
+    notifier.notify(RequestNotification(
+        request_id=request_id,
+        user_id=callback.from_user.id,
+        full_name=user_info["full_name"],
+        phone_number=user_info["phone_number"],
+        request_type=state_data["request_type"],
+        options=[option_map.get(opt, opt) for opt in selected],
+        screenshots=state_data.get("screenshots") or [],
+    ))
 
 
 @router.message(F.text == "📞 Контакты")
-async def handle_contacts(message: Message):
+async def handle_contacts(message: Message, bot_profile: BotProfile):
     """Показ контактной информации"""
-    await message.answer(CONTACTS_INFO, parse_mode="Markdown", reply_markup=get_contacts_inline_keyboard())
+    await message.answer(bot_profile.contacts_info, parse_mode="Markdown", reply_markup=get_contacts_inline_keyboard())
 
 
 @router.message(F.text == "ℹ️ Информация о компании")
-async def handle_company_info(message: Message):
+async def handle_company_info(message: Message, bot_profile: BotProfile):
     """Показ информации о компании"""
+    if not bot_profile.logo:
+        await message.answer(bot_profile.company_info, parse_mode="Markdown")
+        return
     # Пытаемся отправить фото с логотипом
     try:
         await message.answer_photo(
-            FSInputFile("images/company_logo2.jpg"), 
-            caption=COMPANY_INFO, 
+            FSInputFile(bot_profile.logo),
+            caption=bot_profile.company_info,
             parse_mode="Markdown"
         )
     except FileNotFoundError:
-        logger.warning("Файл логотипа не найден, отправляем только текст")
-        await message.answer(COMPANY_INFO, parse_mode="Markdown")
+        logger.warning(f"Файл логотипа {bot_profile.logo} не найден, отправляем только текст")
+        await message.answer(bot_profile.company_info, parse_mode="Markdown")
     except Exception as e:
         logger.error(f"Ошибка отправки фото: {e}")
-        await message.answer(COMPANY_INFO, parse_mode="Markdown")
+        await message.answer(bot_profile.company_info, parse_mode="Markdown")
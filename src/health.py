@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, Optional
+
+import asyncpg
+from aiohttp import web
+
+
+logger = logging.getLogger(__name__)
+
+
+class HealthMonitor:
+    """Состояние бота для эндпоинтов /health/live и /health/ready.
+
+    Отметки о работе polling и обработке апдейтов ставят middleware, фоновые
+    задачи и рассылки регистрируются здесь же. Снимок состояния кэшируется
+    на `cache_ttl` секунд, так что частый опрос не нагружает БД.
+
+    Доступность БД проверяется через `probe_pool` — отдельный пул на одно
+    соединение, чтобы проверка не ждала занятый рабочий `pool` и не отнимала
+    у него соединения. Без `probe_pool` БД не проверяется (обработчики
+    многопроцессного режима: готовность определяет процесс приёма).
+    """
+
+    def __init__(self, pool: asyncpg.Pool, polling_stale_after: float = 90.0, cache_ttl: float = 1.0,
+                 probe_pool: Optional[asyncpg.Pool] = None):
+        self.pool = pool
+        self.probe_pool = probe_pool
+        self.polling_stale_after = polling_stale_after
+        self.cache_ttl = cache_ttl
+        self.started_at = time.monotonic()
+        self.last_polling_at: Optional[float] = None
+        self.last_update_at: Optional[float] = None
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.broadcasts: Dict[int, Dict[str, Any]] = {}
+        self.stats_providers: Dict[str, Callable[[], Dict[str, Any]]] = {}
+        self.readiness_checks: Dict[str, Callable[[], bool]] = {}
+        self._snapshot: Optional[Dict[str, Any]] = None
+        self._snapshot_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def mark_polling(self):
+        self.last_polling_at = time.monotonic()
+
+    def mark_update(self):
+        self.last_update_at = time.monotonic()
+
+    def register_task(self, name: str, task: asyncio.Task):
+        self.tasks[name] = task
+
+    def add_stats_provider(self, name: str, provider: Callable[[], Dict[str, Any]]):
+        self.stats_providers[name] = provider
+
+    def add_readiness_check(self, name: str, check: Callable[[], bool]):
+        """Дополнительное условие готовности (например, есть живые обработчики апдейтов)"""
+        self.readiness_checks[name] = check
+
+    def broadcast_progress(self, broadcast_id: int, **progress: Any):
+        self.broadcasts.setdefault(broadcast_id, {}).update(progress)
+
+    def broadcast_finished(self, broadcast_id: int):
+        self.broadcasts.pop(broadcast_id, None)
+
+    @staticmethod
+    def _age(moment: Optional[float], now: float) -> Optional[float]:
+        return round(now - moment, 1) if moment is not None else None
+
+    @staticmethod
+    def _task_status(task: asyncio.Task) -> str:
+        if not task.done():
+            return "running"
+        if task.cancelled():
+            return "cancelled"
+        return "failed" if task.exception() else "finished"
+
+    async def _check_pool(self) -> Optional[bool]:
+        if self.probe_pool is None:
+            return None
+        try:
+            async with self.probe_pool.acquire(timeout=1) as conn:
+                await conn.fetchval("SELECT 1", timeout=1)
+            return True
+        except Exception as e:
+            logger.warning(f"Проверка готовности: БД недоступна: {e}")
+            return False
+
+    async def snapshot(self) -> Dict[str, Any]:
+        """Снимок состояния, не чаще раза в `cache_ttl` секунд"""
+        async with self._lock:
+            now = time.monotonic()
+            if self._snapshot is not None and now - self._snapshot_at < self.cache_ttl:
+                return self._snapshot
+
+            db_ok = await self._check_pool()
+            polling_age = self._age(self.last_polling_at, now)
+            polling_ok = polling_age is not None and polling_age < self.polling_stale_after
+            pool_size, pool_idle = self.pool.get_size(), self.pool.get_idle_size()
+            checks = {name: check() for name, check in self.readiness_checks.items()}
+            self._snapshot = {
+                "ready": db_ok is not False and polling_ok and all(checks.values()),
+                "uptime": round(now - self.started_at),
+                "db": {
+                    "ok": db_ok,
+                    "size": pool_size,
+                    "idle": pool_idle,
+                    "max_size": self.pool.get_max_size(),
+                    "saturation": round((pool_size - pool_idle) / self.pool.get_max_size(), 2),
+                },
+                "polling": {"ok": polling_ok, "last_poll_age": polling_age},
+                **({"checks": checks} if checks else {}),
+                "last_update_age": self._age(self.last_update_at, now),
+                "tasks": {name: self._task_status(task) for name, task in self.tasks.items()},
+                "broadcasts": {broadcast_id: dict(progress) for broadcast_id, progress in self.broadcasts.items()},
+                **{name: provider() for name, provider in self.stats_providers.items()},
+            }
+            self._snapshot_at = time.monotonic()
+            return self._snapshot
+
+    async def handle_live(self, request: web.Request) -> web.Response:
+        return web.json_response({"alive": True})
+
+    async def handle_ready(self, request: web.Request) -> web.Response:
+        snapshot = await self.snapshot()
+        return web.json_response(snapshot, status=200 if snapshot["ready"] else 503)
+
+    async def start_server(self, host: str, port: int) -> web.AppRunner:
+        """Запуск HTTP-сервера с эндпоинтами здоровья"""
+        app = web.Application()
+        app.router.add_get("/health/live", self.handle_live)
+        app.router.add_get("/health/ready", self.handle_ready)
+        app.router.add_get("/health", self.handle_ready)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        logger.info(f"Эндпоинт здоровья запущен на {host}:{port}")
+        return runner
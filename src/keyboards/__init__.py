@@ -5,10 +5,12 @@ from .user import (
     get_request_type_keyboard,
     get_cancel_keyboard,
     get_options_inline_keyboard,
+    get_my_requests_keyboard,
 )
 
 from .admin import (
     get_admin_menu_keyboard,
     get_broadcast_confirm_keyboard,
     get_broadcast_input_keyboard,
+    get_schedules_keyboard,
 )
@@ -5,7 +5,9 @@ def get_admin_menu_keyboard():
     """Главное меню админ-панели"""
     keyboard = [
         [InlineKeyboardButton(text="📊 Статистика", callback_data="admin_stats")],
+        [InlineKeyboardButton(text="📈 Динамика заявок", callback_data="admin_trends")],
         [InlineKeyboardButton(text="📢 Рассылка", callback_data="admin_broadcast")],
+        [InlineKeyboardButton(text="🕒 Запланированные рассылки", callback_data="admin_schedules")],
         [InlineKeyboardButton(text="👥 Пользователи", callback_data="admin_users")],
         [InlineKeyboardButton(text="❌ Отмена", callback_data="admin_cancel")]
     ]
@@ -16,6 +18,7 @@ def get_broadcast_confirm_keyboard():
     """Подтверждение или отмена рассылки"""
     keyboard = [
         [InlineKeyboardButton(text="✅ Отправить", callback_data="broadcast_confirm")],
+        [InlineKeyboardButton(text="🕒 Запланировать", callback_data="broadcast_schedule")],
         [InlineKeyboardButton(text="❌ Отмена", callback_data="broadcast_cancel")]
     ]
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
@@ -26,3 +29,13 @@ def get_broadcast_input_keyboard():
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="❌ Отмена", callback_data="broadcast_cancel")]
     ])
+
+
+def get_schedules_keyboard(schedules):
+    """Список запланированных рассылок с кнопками отмены"""
+    keyboard = [
+        [InlineKeyboardButton(text=f"🗑 Отменить №{schedule['id']}", callback_data=f"sched_del:{schedule['id']}")]
+        for schedule in schedules
+    ]
+    keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="admin_back")])
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
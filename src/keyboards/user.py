@@ -13,8 +13,8 @@ def get_phone_keyboard():
 def get_main_menu():
     """Клавиатура главного меню"""
     buttons = [
-        [KeyboardButton(text="📝 Оставить заявку"), KeyboardButton(text="📞 Контакты")],
-        [KeyboardButton(text="ℹ️ Информация о компании")]
+        [KeyboardButton(text="📝 Оставить заявку"), KeyboardButton(text="📋 Мои заявки")],
+        [KeyboardButton(text="📞 Контакты"), KeyboardButton(text="ℹ️ Информация о компании")]
     ]
     return ReplyKeyboardMarkup(keyboard=buttons, resize_keyboard=True)
 
@@ -57,3 +57,13 @@ def get_options_inline_keyboard(selected=None):
         keyboard.append([InlineKeyboardButton(text=mark + text, callback_data=f"option:{callback}")])
     keyboard.append([InlineKeyboardButton(text="Подтвердить", callback_data="confirm")])
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
+def get_my_requests_keyboard(newer_cursor=None, older_cursor=None):
+    """Навигация по списку заявок пользователя (курсор — id и время крайней заявки)"""
+    buttons = []
+    if newer_cursor is not None:
+        buttons.append(InlineKeyboardButton(text="⬅️ Новее", callback_data=f"mr:n:{newer_cursor}"))
+    if older_cursor is not None:
+        buttons.append(InlineKeyboardButton(text="Старее ➡️", callback_data=f"mr:o:{older_cursor}"))
+    return InlineKeyboardMarkup(inline_keyboard=[buttons] if buttons else [])
@@ -0,0 +1,51 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from src.bots import BotProfile
+from src.notifications import AdminNotifier
+
+
+class BotContextMiddleware(BaseMiddleware):
+    """Данные бота, получившего апдейт, и метрики по каждому боту.
+
+    Передаёт в обработчики `bot_profile` (тексты, чат админов) и `notifier`
+    этого бота. Считает апдейты и время их обработки отдельно по ботам.
+    """
+
+    def __init__(self, profiles: Dict[int, BotProfile], notifiers: Dict[int, AdminNotifier]):
+        super().__init__()
+        self.profiles = profiles
+        self.notifiers = notifiers
+        self._updates = dict.fromkeys(profiles, 0)
+        self._handling_time = dict.fromkeys(profiles, 0.0)
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики по ботам: апдейты, среднее время обработки, очередь уведомлений"""
+        return {
+            str(bot_id): {
+                "updates": self._updates[bot_id],
+                "avg_handling_ms": round(self._handling_time[bot_id] / self._updates[bot_id] * 1000, 1)
+                if self._updates[bot_id] else 0,
+                "notifications": self.notifiers[bot_id].stats(),
+            }
+            for bot_id in self.profiles
+        }
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        bot_id = data["bot"].id
+        data["bot_profile"] = self.profiles[bot_id]
+        data["notifier"] = self.notifiers[bot_id]
+        self._updates[bot_id] += 1
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            self._handling_time[bot_id] += time.perf_counter() - started
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import TelegramObject
+
+
+logger = logging.getLogger(__name__)
+
+
+class ChatQueueMiddleware(BaseMiddleware):
+    """Упорядоченная обработка апдейтов в рамках чата и общее ограничение нагрузки.
+
+    Апдейты одного чата выполняются строго по очереди, разные чаты (и один чат
+    с разными ботами) — параллельно.
+    Число одновременно работающих обработчиков ограничено `max_in_flight`
+    (считается от размера пула соединений). Если за `wait_timeout` секунд
+    апдейт не дождался своей очереди в чате и слота, он отбрасывается и
+    учитывается в метриках, а на нажатие кнопки отправляется ответ.
+
+    Всё, что зарегистрировано после очереди, видит результат предыдущего
+    апдейта чата: FSMCacheMiddleware читает состояние FSM уже здесь.
+    """
+
+    def __init__(self, max_in_flight: int, wait_timeout: float = 5.0):
+        super().__init__()
+        self.max_in_flight = max_in_flight
+        self.wait_timeout = wait_timeout
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        # (bot_id, chat_id) -> [lock, количество ожидающих/работающих апдейтов]
+        self._chats: Dict[Tuple[int, int], list] = {}
+
+        self.in_flight = 0
+        self.waiting = 0
+        self.processed = 0
+        self.shed = 0
+        self.max_wait = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        """Текущие метрики очереди"""
+        return {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "active_chats": len(self._chats),
+            "processed": self.processed,
+            "shed": self.shed,
+            "max_wait_ms": round(self.max_wait * 1000),
+        }
+
+    @staticmethod
+    def _get_chat_key(data: Dict[str, Any]) -> Optional[Tuple[int, int]]:
+        bot_id = data["bot"].id
+        chat = data.get("event_chat")
+        if chat is not None:
+            return bot_id, chat.id
+        user = data.get("event_from_user")
+        return (bot_id, user.id) if user is not None else None
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + self.wait_timeout
+        chat_key = self._get_chat_key(data)
+        if chat_key is None:
+            return await self._run_limited(handler, event, data, started, deadline)
+
+        entry = self._chats.get(chat_key)
+        if entry is None:
+            entry = self._chats[chat_key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            lock = entry[0]
+            if not await self._wait(lock.acquire(), deadline):
+                return await self._shed(event)
+            try:
+                return await self._run_limited(handler, event, data, started, deadline)
+            finally:
+                lock.release()
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._chats[chat_key]
+
+    async def _wait(self, acquire: Awaitable[Any], deadline: float) -> bool:
+        """Ожидание замка или слота до общего для апдейта срока; False — срок вышел"""
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(acquire, timeout=max(deadline - asyncio.get_running_loop().time(), 0))
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.waiting -= 1
+
+    async def _shed(self, event: TelegramObject) -> None:
+        """Отброс апдейта при перегрузке; нажатие кнопки получает ответ, чтобы не висел индикатор"""
+        self.shed += 1
+        logger.warning(
+            f"Перегрузка: апдейт {getattr(event, 'update_id', None)} отброшен "
+            f"после ожидания {self.wait_timeout} с (в работе: {self.in_flight}, "
+            f"в очереди: {self.waiting}, всего отброшено: {self.shed})"
+        )
+        callback = getattr(event, "callback_query", None)
+        if callback is not None:
+            try:
+                await callback.answer("⏳ Бот перегружен, попробуйте ещё раз через несколько секунд.")
+            except TelegramAPIError as e:
+                logger.warning(f"Не удалось ответить на отброшенный callback {callback.id}: {e}")
+        return None
+
+    async def _run_limited(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+        started: float,
+        deadline: float,
+    ) -> Any:
+        if not await self._wait(self._semaphore.acquire(), deadline):
+            return await self._shed(event)
+
+        self.max_wait = max(self.max_wait, asyncio.get_running_loop().time() - started)
+        self.in_flight += 1
+        try:
+            return await handler(event, data)
+        finally:
+            self.in_flight -= 1
+            self.processed += 1
+            self._semaphore.release()
@@ -1,8 +1,10 @@
-from typing import Any, Awaitable, Callable, Dict
+from typing import Any, Awaitable, Callable, Dict, Optional
 
 from aiogram import BaseMiddleware
 from aiogram.types import TelegramObject
 
+from src.utils.tracing import Tracer
+
 
 class DbConnectionMiddleware(BaseMiddleware):
     """Acquires a DB connection from the pool for the lifetime of a single update.
@@ -10,9 +12,10 @@ class DbConnectionMiddleware(BaseMiddleware):
     Injects the connection into handler data as `conn`.
     """
 
-    def __init__(self, pool):
+    def __init__(self, pool, tracer: Optional[Tracer] = None):
         super().__init__()
         self.pool = pool
+        self.tracer = tracer
 
     async def __call__(
         self,
@@ -22,8 +25,15 @@ class DbConnectionMiddleware(BaseMiddleware):
     ) -> Any:
         # prefer pool from data if already injected, otherwise use self.pool
         pool = data.get("db_pool", self.pool)
-        async with pool.acquire() as conn:
+        if self.tracer is None:
+            async with pool.acquire() as conn:
+                data["conn"] = conn
+                return await handler(event, data)
+
+        with self.tracer.span("pool.acquire"):
+            conn = await pool.acquire()
+        try:
             data["conn"] = conn
             return await handler(event, data)
-
-
+        finally:
+            await pool.release(conn)
@@ -0,0 +1,110 @@
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.middleware import FSMContextMiddleware
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.types import TelegramObject
+
+from src.utils.fsm_storage import UNCHANGED, BoundedMemoryStorage
+
+
+_NOT_LOADED = object()
+
+
+class BufferedFSMContext(FSMContext):
+    """FSMContext, который читает хранилище не больше одного раза за апдейт.
+
+    Состояние и данные кэшируются при первом обращении, изменения копятся в
+    памяти и записываются методом `flush()` — только те части, что менялись,
+    в BoundedMemoryStorage одним вызовом.
+    """
+
+    def __init__(self, storage: BaseStorage, key: StorageKey):
+        super().__init__(storage=storage, key=key)
+        self._state: Any = _NOT_LOADED
+        self._data: Any = _NOT_LOADED
+        self._state_dirty = False
+        self._data_dirty = False
+
+    async def get_state(self) -> Optional[str]:
+        if self._state is _NOT_LOADED:
+            self._state = await self.storage.get_state(key=self.key)
+        return self._state
+
+    async def set_state(self, state: StateType = None) -> None:
+        self._state = state.state if isinstance(state, State) else state
+        self._state_dirty = True
+
+    async def get_data(self) -> Dict[str, Any]:
+        if self._data is _NOT_LOADED:
+            self._data = await self.storage.get_data(key=self.key)
+        return self._data.copy()
+
+    async def set_data(self, data: Dict[str, Any]) -> None:
+        self._data = data.copy()
+        self._data_dirty = True
+
+    async def update_data(self, data: Optional[Dict[str, Any]] = None, **kwargs: Any) -> Dict[str, Any]:
+        if data:
+            kwargs.update(data)
+        current_data = await self.get_data()
+        current_data.update(kwargs)
+        self._data = current_data
+        self._data_dirty = True
+        return current_data.copy()
+
+    async def clear(self) -> None:
+        await self.set_state(None)
+        await self.set_data({})
+
+    async def flush(self) -> None:
+        """Запись накопленных изменений в хранилище одним шагом"""
+        if not (self._state_dirty or self._data_dirty):
+            return
+        state = self._state if self._state_dirty else UNCHANGED
+        data = self._data if self._data_dirty else UNCHANGED
+        if isinstance(self.storage, BoundedMemoryStorage):
+            await self.storage.set_record(self.key, state=state, data=data)
+        else:
+            if state is not UNCHANGED:
+                await self.storage.set_state(key=self.key, state=state)
+            if data is not UNCHANGED:
+                await self.storage.set_data(key=self.key, data=data)
+        self._state_dirty = self._data_dirty = False
+
+
+class FSMCacheMiddleware(BaseMiddleware):
+    """Вместо FSMContextMiddleware диспетчера: `state` — BufferedFSMContext.
+
+    Регистрируется внутри очереди чата (после ChatQueueMiddleware), а внешний
+    FSMContextMiddleware снимается (см. setup_dispatcher): состояние, по
+    которому идёт маршрутизация (`raw_state`), читается один раз и уже после
+    предыдущего апдейта чата. Изменения записываются в хранилище после
+    обработчика (в том числе при ошибке, как и при обычном FSMContext); если
+    ничего не менялось, запись пропускается.
+    """
+
+    def __init__(self, fsm: FSMContextMiddleware):
+        self.fsm = fsm
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        data["fsm_storage"] = self.fsm.storage
+        context = self.fsm.resolve_event_context(data["bot"], data)
+        if context is None:
+            return await handler(event, data)
+
+        buffered = BufferedFSMContext(context.storage, context.key)
+        async with self.fsm.events_isolation.lock(key=context.key):
+            data["state"] = buffered
+            data["raw_state"] = await buffered.get_state()
+            try:
+                return await handler(event, data)
+            finally:
+                await buffered.flush()
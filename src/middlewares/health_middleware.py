@@ -0,0 +1,38 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.methods import GetUpdates
+from aiogram.types import TelegramObject
+
+from src.health import HealthMonitor
+
+
+class HealthMiddleware(BaseMiddleware):
+    """Отмечает время последнего полученного апдейта"""
+
+    def __init__(self, health: HealthMonitor):
+        super().__init__()
+        self.health = health
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        self.health.mark_update()
+        return await handler(event, data)
+
+
+class HealthRequestMiddleware(BaseRequestMiddleware):
+    """Отмечает каждый успешный getUpdates — признак того, что polling жив"""
+
+    def __init__(self, health: HealthMonitor):
+        self.health = health
+
+    async def __call__(self, make_request, bot, method):
+        response = await make_request(bot, method)
+        if isinstance(method, GetUpdates):
+            self.health.mark_polling()
+        return response
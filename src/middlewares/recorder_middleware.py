@@ -0,0 +1,53 @@
+import logging
+from typing import Any, Awaitable, Callable, Dict, Set
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from src.utils.recording import UpdateRecorder
+
+
+logger = logging.getLogger(__name__)
+
+
+class RecorderMiddleware(BaseMiddleware):
+    """Запись входящих апдейтов в журнал для последующего повтора.
+
+    Регистрируется первой на update, чтобы в журнал попадали и апдейты,
+    отброшенные очередью при перегрузке. Апдейты админов (`admin_ids` —
+    ADMIN_IDS или таблица admins, см. get_admin_ids) помечаются, чтобы при
+    повторе их псевдонимы получили права админа. Ошибка записи не мешает
+    обработке апдейта.
+    """
+
+    def __init__(self, recorder: UpdateRecorder, admin_ids: Set[int]):
+        super().__init__()
+        self.recorder = recorder
+        self.admin_ids = admin_ids
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if isinstance(event, Update):
+            user = data.get("event_from_user")
+            try:
+                self.recorder.write(
+                    event.model_dump(mode="json", exclude_none=True, by_alias=True),
+                    is_admin=user is not None and user.id in self.admin_ids
+                )
+            except Exception as e:
+                logger.error(f"Ошибка записи апдейта {event.update_id}: {e}")
+        return await handler(event, data)
+
+
+def record_raw_update(recorder: UpdateRecorder, update: Dict[str, Any], admin_ids: Set[int]):
+    """Запись сырого апдейта из getUpdates (процесс приёма в многопроцессном режиме)"""
+    payload = next((value for key, value in update.items() if key != "update_id"), None)
+    user = payload.get("from") if isinstance(payload, dict) else None
+    try:
+        recorder.write(update, is_admin=user is not None and user["id"] in admin_ids)
+    except Exception as e:
+        logger.error(f"Ошибка записи апдейта {update.get('update_id')}: {e}")
@@ -0,0 +1,83 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import TelegramObject, Update
+
+from src.utils.profiling import UpdateRecord, current_record, finish_record, start_record
+
+
+logger = logging.getLogger(__name__)
+
+
+class SlowUpdateMiddleware(BaseMiddleware):
+    """Логирует полный контекст апдейтов, обработка которых дольше `threshold` секунд.
+
+    Один экземпляр регистрируется на update (замер времени) и на события
+    message/callback_query (имя выбранного обработчика). SQL-запросы попадают
+    в запись через логгер запросов asyncpg, вызовы Bot API — через
+    SlowUpdateRequestMiddleware. Пока апдейт быстрый, работа сводится к
+    добавлению пары кортежей в список.
+    """
+
+    def __init__(self, threshold: float):
+        super().__init__()
+        self.threshold = threshold
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, Update):
+            record = current_record()
+            handler_object = data.get("handler")
+            if record is not None and handler_object is not None:
+                record.handler = getattr(handler_object.callback, "__qualname__", repr(handler_object.callback))
+            return await handler(event, data)
+
+        record, token = start_record()
+        started = time.monotonic()
+        try:
+            return await handler(event, data)
+        finally:
+            elapsed = time.monotonic() - started
+            finish_record(token)
+            if elapsed >= self.threshold:
+                # Логгер запросов asyncpg вызывается через call_soon — даём ему отработать
+                asyncio.get_running_loop().call_soon(
+                    self._report, event, data.get("raw_state"), record, elapsed
+                )
+
+    @staticmethod
+    def _report(event: Update, raw_state, record: UpdateRecord, elapsed: float):
+        lines = [
+            f"Медленный апдейт id={event.update_id} ({event.event_type}): {elapsed * 1000:.0f} мс, "
+            f"обработчик: {record.handler or '—'}, состояние: {raw_state or '—'}"
+        ]
+        sql_total = sum(duration for _, duration in record.queries)
+        lines.append(f"SQL: {len(record.queries)} запрос(ов), {sql_total * 1000:.0f} мс")
+        lines.extend(f"  {duration * 1000:7.1f} мс  {query}" for query, duration in record.queries)
+        api_total = sum(duration for _, duration in record.api_calls)
+        lines.append(f"Telegram: {len(record.api_calls)} вызов(ов), {api_total * 1000:.0f} мс")
+        lines.extend(f"  {duration * 1000:7.1f} мс  {method}" for method, duration in record.api_calls)
+        logger.warning("\n".join(lines))
+
+
+class SlowUpdateRequestMiddleware(BaseRequestMiddleware):
+    """Замер вызовов Bot API для SlowUpdateMiddleware"""
+
+    async def __call__(self, make_request, bot, method):
+        record = current_record()
+        if record is None:
+            return await make_request(bot, method)
+
+        started = time.monotonic()
+        try:
+            return await make_request(bot, method)
+        finally:
+            record.api_calls.append((type(method).__name__, time.monotonic() - started))
@@ -0,0 +1,65 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import TelegramObject, Update
+
+from src.utils.tracing import SPAN_KIND_CLIENT, Tracer
+
+
+class TracingMiddleware(BaseMiddleware):
+    """Открывает корневой отрезок трейса на каждый апдейт"""
+
+    def __init__(self, tracer: Tracer):
+        super().__init__()
+        self.tracer = tracer
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        update_type = event.event_type if isinstance(event, Update) else type(event).__name__
+        with self.tracer.root_span(f"update {update_type}", **{"update.type": update_type}) as span:
+            if span is not None and isinstance(event, Update):
+                span.set_attribute("update.id", event.update_id)
+            return await handler(event, data)
+
+
+class TracingHandlerMiddleware(BaseMiddleware):
+    """Добавляет имя выбранного обработчика к корневому отрезку.
+
+    Регистрируется как внутренний middleware событий (message, callback_query),
+    где aiogram уже положил найденный обработчик в data["handler"].
+    """
+
+    def __init__(self, tracer: Tracer):
+        super().__init__()
+        self.tracer = tracer
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        span = self.tracer.current_span()
+        handler_object = data.get("handler")
+        if span is not None and handler_object is not None:
+            name = getattr(handler_object.callback, "__qualname__", repr(handler_object.callback))
+            span.set_attribute("handler.name", name)
+            span.name = f"{span.name} {name}"
+        return await handler(event, data)
+
+
+class TracingRequestMiddleware(BaseRequestMiddleware):
+    """Отрезок на каждый запрос к Bot API"""
+
+    def __init__(self, tracer: Tracer):
+        self.tracer = tracer
+
+    async def __call__(self, make_request, bot, method):
+        method_name = type(method).__name__
+        with self.tracer.span(f"telegram {method_name}", kind=SPAN_KIND_CLIENT, **{"telegram.method": method_name}):
+            return await make_request(bot, method)
@@ -0,0 +1,305 @@
+import asyncio
+import html
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Set
+
+import asyncpg
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest, TelegramForbiddenError, TelegramNotFound, TelegramRetryAfter, TelegramUnauthorizedError
+)
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto
+
+from src.config import OPTION_NAMES
+from src.database import get_unnotified_requests, mark_requests_notified
+
+
+logger = logging.getLogger(__name__)
+
+# Предел длины сообщения Telegram
+MESSAGE_LIMIT = 4096
+# Ошибки, которые повтором не исправить: бот исключён из чата, чат не найден, неверный запрос
+PERMANENT_ERRORS = (TelegramBadRequest, TelegramForbiddenError, TelegramNotFound, TelegramUnauthorizedError)
+# Попыток отправки при временных ошибках (сеть, 5xx) — около четырёх минут
+MAX_ATTEMPTS = 8
+# Как часто повторять отложенные уведомления и искать в БД неотправленные
+RESCAN_INTERVAL = 300
+# Заявки моложе этого ещё могут быть между сохранением и постановкой в очередь
+RESCAN_MIN_AGE = 60
+
+
+class RequestNotification:
+    """Уведомление админов о новой заявке"""
+
+    __slots__ = ("request_id", "user_id", "full_name", "phone_number", "request_type", "options", "screenshots")
+
+    def __init__(self, request_id: int, user_id: int, full_name: str, phone_number: str,
+                 request_type: str, options: List[str], screenshots: List[str]):
+        self.request_id = request_id
+        self.user_id = user_id
+        self.full_name = full_name
+        self.phone_number = phone_number
+        self.request_type = request_type
+        self.options = options
+        self.screenshots = screenshots
+
+    @classmethod
+    def from_row(cls, request: asyncpg.Record) -> "RequestNotification":
+        """Уведомление по заявке из БД (get_request, get_unnotified_requests)"""
+        return cls(
+            request_id=request["id"],
+            user_id=request["user_id"],
+            full_name=request["full_name"] or "—",
+            phone_number=request["phone_number"] or "—",
+            request_type=request["request_type"],
+            options=[OPTION_NAMES.get(option, option) for option in request["options"].split(", ")],
+            screenshots=list(request["screenshots"]),
+        )
+
+    def caption(self) -> str:
+        return (
+            f"Заявка №{self.request_id}\nОт: {self.full_name} ({self.phone_number})\n"
+            f"Тип: {self.request_type}\nПредметы: {', '.join(self.options)}"
+        )
+
+    def digest_line(self) -> str:
+        """Строка сводки (HTML): /req_<id> открывает заявку целиком, имя — профиль пользователя"""
+        photos = f" · 📎 {len(self.screenshots)}" if self.screenshots else ""
+        return (
+            f"/req_{self.request_id} · <a href=\"tg://user?id={self.user_id}\">{html.escape(self.full_name)}</a> "
+            f"({html.escape(self.phone_number)}) · {html.escape(self.request_type)} · "
+            f"{html.escape(', '.join(self.options))}{photos}"
+        )
+
+
+async def send_request_notification(bot: Bot, chat_id: int, notification: RequestNotification):
+    """Полное уведомление о заявке: фото, альбом (одним send_media_group) или текст"""
+    caption = notification.caption()
+    kb = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text='Профиль', url=f'tg://user?id={notification.user_id}')]
+    ])
+    screenshots = notification.screenshots
+    if len(screenshots) > 1:
+        # У альбома не бывает кнопок, поэтому ссылка на профиль — в подписи первого фото
+        album_caption = f'{html.escape(caption)}\n<a href="tg://user?id={notification.user_id}">Профиль</a>'
+        media = [InputMediaPhoto(media=screenshots[0], caption=album_caption, parse_mode="HTML")]
+        media += [InputMediaPhoto(media=file_id) for file_id in screenshots[1:]]
+        await bot.send_media_group(chat_id, media)
+    elif screenshots:
+        await bot.send_photo(chat_id, screenshots[0], caption=caption, reply_markup=kb)
+    else:
+        await bot.send_message(chat_id, caption, reply_markup=kb)
+
+
+class AdminNotifier:
+    """Отправка уведомлений о заявках в чат админов с учётом лимитов Telegram.
+
+    Пока за последнюю минуту отправлено меньше `rate_limit` сообщений,
+    каждая заявка уходит отдельным сообщением. Выше порога (или после 429)
+    уведомления копятся `digest_interval` секунд и уходят сводками по
+    `digest_size` заявок, со ссылками /req_<id> на полные заявки.
+
+    На 429 ждём retry_after, временные ошибки повторяем с растущей паузой не
+    больше MAX_ATTEMPTS раз. Постоянные ошибки (PERMANENT_ERRORS) и исчерпанные
+    попытки не держат очередь: уведомление откладывается и раз в
+    `rescan_interval` секунд возвращается в очередь, сколько бы ему ни было.
+
+    С `pool` отправка отмечается в requests.notified_at. `restore` при запуске
+    и затем каждые `rescan_interval` секунд находит в БД неотправленные
+    уведомления за последние дни, которых нет в памяти (потерянные при
+    падении процесса). Каждый процесс отвечает за заявки своих чатов:
+    `shard`/`shards` — как раздаёт апдейты WorkerPool.
+    """
+
+    def __init__(self, bot: Bot, chat_id: Optional[int], rate_limit: int = 15,
+                 digest_interval: float = 30, digest_size: int = 20, pool: Optional[asyncpg.Pool] = None,
+                 shard: int = 0, shards: int = 1, rescan_interval: float = RESCAN_INTERVAL):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.pool = pool
+        self.shard = shard
+        self.shards = shards
+        self.rescan_interval = rescan_interval
+        self.rate_limit = rate_limit
+        self.digest_interval = digest_interval
+        self.digest_size = digest_size
+        self._queue: Deque[RequestNotification] = deque()
+        self._pending = asyncio.Event()
+        self._sent_at: Deque[float] = deque()
+        self._throttled_until = 0.0
+        # Уведомления в очереди, в отправке и отложенные: повторный поиск в БД их пропускает
+        self._tracked: Set[int] = set()
+        self._parked: List[RequestNotification] = []
+
+        self.sent = 0
+        self.digests = 0
+        self.retries = 0
+        self.dropped = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики уведомлений"""
+        return {
+            "queued": len(self._queue),
+            "sent": self.sent,
+            "digests": self.digests,
+            "retries": self.retries,
+            "dropped": self.dropped,
+            "parked": len(self._parked),
+            "digest_mode": self._is_busy(),
+        }
+
+    def notify(self, notification: RequestNotification):
+        if self.chat_id is None:
+            logger.warning(f"ADMIN_CHAT_ID не задан, уведомление о заявке {notification.request_id} не отправлено")
+            return
+        self._tracked.add(notification.request_id)
+        self._queue.append(notification)
+        self._pending.set()
+
+    async def restore(self, min_age: float = 0) -> int:
+        """Постановка в очередь неотправленных уведомлений из БД, которых нет в памяти"""
+        if self.pool is None or self.chat_id is None:
+            return 0
+        async with self.pool.acquire() as conn:
+            requests = await get_unnotified_requests(conn, self.bot.id, self.shard, self.shards, min_age)
+        restored = 0
+        for request in requests:
+            if request["id"] not in self._tracked:
+                self.notify(RequestNotification.from_row(request))
+                restored += 1
+        if restored:
+            logger.info(f"Бот {self.bot.id}: в очередь возвращены уведомления о заявках: {restored}")
+        return restored
+
+    async def rescan(self):
+        """Фоновая задача: повтор отложенных уведомлений и поиск потерянных в БД"""
+        while True:
+            await asyncio.sleep(self.rescan_interval)
+            parked, self._parked = self._parked, []
+            for notification in parked:
+                self.notify(notification)
+            try:
+                await self.restore(RESCAN_MIN_AGE)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Бот {self.bot.id}: ошибка поиска неотправленных уведомлений: {e}")
+
+    def _recent_sent(self) -> int:
+        now = time.monotonic()
+        while self._sent_at and self._sent_at[0] <= now - 60:
+            self._sent_at.popleft()
+        return len(self._sent_at)
+
+    def _is_busy(self) -> bool:
+        return time.monotonic() < self._throttled_until or self._recent_sent() + len(self._queue) > self.rate_limit
+
+    async def run(self):
+        while True:
+            await self._pending.wait()
+            if self._is_busy():
+                # Даём уведомлениям накопиться, чтобы отправить их одной сводкой
+                await asyncio.sleep(self.digest_interval)
+                batch = [self._queue.popleft() for _ in range(min(self.digest_size, len(self._queue)))]
+                await self._deliver(batch)
+            else:
+                await self._deliver([self._queue.popleft()])
+            if not self._queue:
+                self._pending.clear()
+
+    async def flush(self):
+        """Отправка всего, что осталось в очереди (при остановке бота), сводками"""
+        while self._queue:
+            batch = [self._queue.popleft() for _ in range(min(self.digest_size, len(self._queue)))]
+            try:
+                await self._send_digest(batch)
+                self.sent += len(batch)
+            except Exception as e:
+                self._park(batch, e)
+                continue
+            await self._mark_notified(batch)
+
+    async def _deliver(self, batch: List[RequestNotification]):
+        """Отправка с повторами временных ошибок; неотправленное откладывается в БД"""
+        attempt = 0
+        while True:
+            try:
+                if len(batch) == 1:
+                    await self._send_single(batch[0])
+                else:
+                    await self._send_digest(batch)
+                self.sent += len(batch)
+                break
+            except TelegramRetryAfter as e:
+                self.retries += 1
+                # После 429 какое-то время шлём только сводки
+                self._throttled_until = time.monotonic() + e.retry_after + 60
+                logger.warning(f"Лимит Telegram для чата админов, повтор через {e.retry_after} с")
+                await asyncio.sleep(e.retry_after)
+            except asyncio.CancelledError:
+                self._queue.extendleft(reversed(batch))
+                raise
+            except PERMANENT_ERRORS as e:
+                if isinstance(e, TelegramBadRequest) and len(batch) > 1 and "chat not found" not in e.message:
+                    # Сводку не принял Telegram: делим её, чтобы отложить только проблемную заявку
+                    middle = len(batch) // 2
+                    await self._deliver(batch[:middle])
+                    await self._deliver(batch[middle:])
+                    return
+                self._park(batch, e)
+                return
+            except Exception as e:
+                attempt += 1
+                if attempt >= MAX_ATTEMPTS:
+                    self._park(batch, e)
+                    return
+                self.retries += 1
+                logger.error(f"Ошибка отправки уведомления о заявках {[n.request_id for n in batch]}: {e}")
+                await asyncio.sleep(min(2 ** attempt, 60))
+        await self._mark_notified(batch)
+
+    def _park(self, batch: List[RequestNotification], error: Exception):
+        """Уведомление снимается с очереди до следующего rescan; notified_at остаётся пустым"""
+        self.dropped += len(batch)
+        self._parked.extend(batch)
+        logger.error(
+            f"Уведомления о заявках {[n.request_id for n in batch]} отложены на {self.rescan_interval:.0f} с: {error}"
+        )
+
+    async def _mark_notified(self, batch: List[RequestNotification]):
+        self._tracked.difference_update(notification.request_id for notification in batch)
+        if self.pool is None:
+            return
+        try:
+            async with self.pool.acquire() as conn:
+                await mark_requests_notified(conn, self.bot.id, [notification.request_id for notification in batch])
+        except Exception as e:
+            # Худший случай — повторное уведомление после перезапуска
+            logger.error(f"Не удалось отметить отправку уведомлений о заявках {[n.request_id for n in batch]}: {e}")
+
+    async def _send_single(self, notification: RequestNotification):
+        try:
+            await send_request_notification(self.bot, self.chat_id, notification)
+        except TelegramBadRequest as e:
+            # Например, фото больше недоступно — отправляем заявку строкой сводки
+            logger.warning(f"Заявка {notification.request_id} отправлена без фото: {e}")
+            await self._send_digest([notification])
+            return
+        self._sent_at.append(time.monotonic())
+
+    async def _send_digest(self, batch: List[RequestNotification]):
+        lines = [f"📬 Новые заявки: {len(batch)}", ""]
+        lines += [notification.digest_line() for notification in batch]
+        text = "\n".join(lines)
+        # Сводку, не влезающую в сообщение, делим пополам
+        if len(text) > MESSAGE_LIMIT and len(batch) > 1:
+            middle = len(batch) // 2
+            await self._send_digest(batch[:middle])
+            await self._send_digest(batch[middle:])
+            return
+        await self.bot.send_message(self.chat_id, text, parse_mode="HTML", disable_web_page_preview=True)
+        self._sent_at.append(time.monotonic())
+        if len(batch) > 1:
+            self.digests += 1
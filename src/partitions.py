@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import re
+from datetime import date, datetime
+from typing import List, Optional, Tuple
+
+import asyncpg
+from asyncpg import Connection
+
+from src.database import create_index_concurrently, create_requests_table, purge_orphan_screenshots, purge_request_keys
+
+
+logger = logging.getLogger(__name__)
+
+# Общий advisory lock, чтобы миграцию и обслуживание партиций не выполняли две копии бота сразу
+PARTITIONS_LOCK_KEY = 0x7265717073  # "reqps"
+LEGACY_PARTITION = "requests_legacy"
+
+_BOUND_RE = re.compile(r"FROM \((.+?)\) TO \((.+?)\)")
+
+
+def _month_start(day: date, shift: int = 0) -> date:
+    """Первое число месяца, отстоящего от `day` на `shift` месяцев"""
+    month_index = day.year * 12 + day.month - 1 + shift
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def _parse_bound(value: str) -> Optional[datetime]:
+    if value in ("MINVALUE", "MAXVALUE"):
+        return None
+    return datetime.fromisoformat(value.strip("'"))
+
+
+async def _get_partitions(conn: Connection) -> List[Tuple[str, Optional[datetime], Optional[datetime]]]:
+    """Партиции requests: (имя, нижняя граница, верхняя граница)"""
+    rows = await conn.fetch('''
+        SELECT c.relname AS name, pg_get_expr(c.relpartbound, c.oid) AS bound
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'requests'::regclass
+    ''')
+    partitions = []
+    for row in rows:
+        match = _BOUND_RE.search(row["bound"])
+        if match:
+            partitions.append((row["name"], _parse_bound(match.group(1)), _parse_bound(match.group(2))))
+    return partitions
+
+
+async def _get_pending_detach(conn: Connection) -> List[str]:
+    """Партиции, отсоединение которых (DETACH ... CONCURRENTLY) было прервано"""
+    rows = await conn.fetch('''
+        SELECT c.relname AS name
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'requests'::regclass AND i.inhdetachpending
+    ''')
+    return [row["name"] for row in rows]
+
+
+async def migrate_requests_to_partitions(conn: Connection):
+    """Онлайн-перевод обычной таблицы requests на помесячные партиции.
+
+    Существующая таблица целиком становится партицией `requests_legacy` с
+    диапазоном до начала следующего месяца, новые данные попадают в
+    помесячные партиции. Всё, что ATTACH иначе проверял бы или строил под
+    ACCESS EXCLUSIVE, готовится заранее: CHECK на диапазон проверяется
+    VALIDATE CONSTRAINT, NOT NULL доказывается этим CHECK без сканирования,
+    первичный ключ (id, created_at) ставится на индекс, построенный
+    CONCURRENTLY. Финальная транзакция меняет только метаданные. Прерванную
+    миграцию можно запустить повторно.
+    """
+    relkind = await conn.fetchval("SELECT relkind FROM pg_class WHERE oid = to_regclass('requests')")
+    if relkind != "r":
+        return
+
+    cutover = _month_start(date.today(), 1)
+    logger.info(f"Перевод requests на партиции, граница старых данных: {cutover}")
+
+    await conn.execute("UPDATE requests SET created_at = 'epoch' WHERE created_at IS NULL")
+    bounds = await conn.fetchval(
+        "SELECT pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = 'requests'::regclass AND conname = 'requests_legacy_bounds'"
+    )
+    if bounds is not None and str(cutover) not in bounds:
+        # Прерванная в прошлом месяце миграция: граница должна совпасть с диапазоном партиции
+        await conn.execute("ALTER TABLE requests DROP CONSTRAINT requests_legacy_bounds")
+        bounds = None
+    if bounds is None:
+        await conn.execute(f'''
+            ALTER TABLE requests ADD CONSTRAINT requests_legacy_bounds
+            CHECK (created_at IS NOT NULL AND created_at < '{cutover}') NOT VALID
+        ''')
+    await conn.execute("ALTER TABLE requests VALIDATE CONSTRAINT requests_legacy_bounds")
+    await conn.execute("ALTER TABLE requests ALTER COLUMN created_at SET NOT NULL")
+
+    primary_key = await conn.fetchval(
+        "SELECT pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = 'requests'::regclass AND contype = 'p'"
+    )
+    if primary_key != "PRIMARY KEY (id, created_at)":
+        await create_index_concurrently(conn, f"{LEGACY_PARTITION}_pkey", "requests", "(id, created_at)", unique=True)
+        await conn.execute(f'''
+            ALTER TABLE requests DROP CONSTRAINT IF EXISTS requests_pkey,
+            ADD CONSTRAINT {LEGACY_PARTITION}_pkey PRIMARY KEY USING INDEX {LEGACY_PARTITION}_pkey
+        ''')
+    # Индекс из прежней версии миграции больше не нужен
+    await conn.execute("DROP INDEX CONCURRENTLY IF EXISTS requests_id_created_at_key")
+
+    async with conn.transaction():
+        await conn.execute(f"ALTER TABLE requests RENAME TO {LEGACY_PARTITION}")
+        await conn.execute(f"ALTER INDEX IF EXISTS requests_bot_user_created_idx RENAME TO {LEGACY_PARTITION}_bot_user_created_idx")
+        await create_requests_table(conn)
+        await conn.execute(
+            f"ALTER TABLE requests ATTACH PARTITION {LEGACY_PARTITION} FOR VALUES FROM (MINVALUE) TO ('{cutover}')"
+        )
+    logger.info("Таблица requests переведена на партиции")
+
+
+async def maintain_request_partitions(conn: Connection, months_ahead: int, retention_months: int, drop_expired: bool):
+    """Создание партиций на `months_ahead` месяцев вперёд и отключение устаревших.
+
+    Партиции, целиком старше `retention_months` полных месяцев, отсоединяются
+    без блокировки запросов (DETACH ... CONCURRENTLY, поэтому вызывать вне
+    транзакции) и удаляются при `drop_expired`. `retention_months = 0` —
+    хранить всё.
+    """
+    today = date.today()
+    partitions = await _get_partitions(conn)
+    pending_detach = set(await _get_pending_detach(conn))
+    covered_until = max((upper.date() for _, _, upper in partitions if upper), default=None)
+
+    month = covered_until or _month_start(today)
+    last_month = _month_start(today, months_ahead)
+    while month <= last_month:
+        next_month = _month_start(month, 1)
+        name = f"requests_p{month:%Y%m}"
+        await conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF requests FOR VALUES FROM ('{month}') TO ('{next_month}')"
+        )
+        logger.info(f"Создана партиция {name}")
+        month = next_month
+
+    if retention_months <= 0:
+        return
+    cutoff = datetime.combine(_month_start(today, -retention_months), datetime.min.time())
+    for name, _, upper in partitions:
+        if upper is None or upper > cutoff:
+            continue
+        # CONCURRENTLY не блокирует запросы к requests; прерванное отсоединение завершает FINALIZE
+        if name in pending_detach:
+            await conn.execute(f"ALTER TABLE requests DETACH PARTITION {name} FINALIZE")
+        else:
+            await conn.execute(f"ALTER TABLE requests DETACH PARTITION {name} CONCURRENTLY")
+        if drop_expired:
+            await conn.execute(f"DROP TABLE {name}")
+            logger.info(f"Партиция {name} удалена по сроку хранения")
+        else:
+            logger.info(f"Партиция {name} отсоединена по сроку хранения")
+
+
+async def setup_request_partitions(conn: Connection, months_ahead: int, retention_months: int, drop_expired: bool):
+    """Миграция и обслуживание партиций под advisory lock"""
+    await conn.execute("SELECT pg_advisory_lock($1)", PARTITIONS_LOCK_KEY)
+    try:
+        await migrate_requests_to_partitions(conn)
+        await maintain_request_partitions(conn, months_ahead, retention_months, drop_expired)
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1)", PARTITIONS_LOCK_KEY)
+
+
+async def run_partition_maintenance(pool: asyncpg.Pool, months_ahead: int, retention_months: int,
+                                    drop_expired: bool, interval: float = 24 * 3600):
+    """Фоновая задача: раз в сутки досоздаёт партиции, применяет срок хранения
+    (вместе с фото альбомов ушедших заявок) и удаляет устаревшие ключи
+    идемпотентности заявок"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with pool.acquire() as conn:
+                await setup_request_partitions(conn, months_ahead, retention_months, drop_expired)
+                # У request_screenshots нет внешнего ключа на requests, каскада при DETACH/DROP не будет
+                await purge_orphan_screenshots(conn)
+                await purge_request_keys(conn)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка обслуживания партиций requests: {e}")
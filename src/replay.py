@@ -0,0 +1,314 @@
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import multiprocessing
+import queue
+import time
+import typing
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+import asyncpg
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+from aiogram.types import Chat, Message, MessageId, Update, User
+
+from src.bots import BotProfile
+from src.broadcasts import BroadcastScheduler
+from src.config import (
+    ADMIN_CHAT_ID, ADMIN_IDS, COMPANY_INFO, COMPANY_LOGO, CONTACTS_INFO, DB_CONFIG, DB_POOL_MAX_SIZE,
+    DB_POOL_MIN_SIZE, NOTIFY_DIGEST_INTERVAL, NOTIFY_RATE_LIMIT, PROFILE_DIR, REQUESTS_PARTITIONS_AHEAD
+)
+from src.database import init_db
+from src.dispatcher import setup_dispatcher
+from src.health import HealthMonitor
+from src.middlewares.bot_context_middleware import BotContextMiddleware
+from src.notifications import AdminNotifier
+from src.partitions import setup_request_partitions
+from src.utils.fsm_storage import BoundedMemoryStorage
+from src.utils.profiling import SamplingProfiler
+from src.utils.recording import read_updates
+from src.workers import merge_stats, route_update, worker_pool_size
+
+REPLAY_BOT_TOKEN = "42:replay"
+
+# spawn, как у процессов-обработчиков бота (src.workers)
+_mp = multiprocessing.get_context("spawn")
+
+
+class FakeSession(BaseSession):
+    """Сессия Bot API без сети: считает вызовы и отвечает правдоподобными объектами.
+
+    `latency` — искусственная задержка каждого вызова в секундах, чтобы
+    повтор учитывал время ответа Telegram.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self._message_ids = itertools.count(1)
+
+    def _fake_message(self, bot: Bot, method: TelegramMethod) -> Message:
+        chat_id = getattr(method, "chat_id", None)
+        return Message(
+            message_id=next(self._message_ids),
+            date=datetime.now(),
+            chat=Chat(id=chat_id if isinstance(chat_id, int) else 0, type="private"),
+        ).as_(bot)
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None) -> Any:
+        self.calls[type(method).__name__] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        returning = method.__returning__
+        if typing.get_origin(returning) is typing.Union:
+            returning = typing.get_args(returning)[0]
+        if typing.get_origin(returning) in (list, List):
+            item_type = typing.get_args(returning)[0]
+            count = len(getattr(method, "message_ids", None) or getattr(method, "media", None) or [])
+            if item_type is MessageId:
+                return [MessageId(message_id=next(self._message_ids)) for _ in range(count)]
+            if item_type is Message:
+                return [self._fake_message(bot, method) for _ in range(count)]
+            return []
+        if returning is Message:
+            return self._fake_message(bot, method)
+        if returning is MessageId:
+            return MessageId(message_id=next(self._message_ids))
+        if returning is User:
+            return User(id=bot.id, is_bot=True, first_name="Replay")
+        if returning is bool:
+            return True
+        return None
+
+    async def close(self) -> None:
+        pass
+
+    async def stream_content(self, url: str, headers=None, timeout: int = 30, chunk_size: int = 65536,
+                             raise_for_status: bool = True):
+        yield b""
+
+
+class _ErrorCounter(logging.Handler):
+    """Подсчёт ошибок, которые обработчики и ErrorHandlingMiddleware пишут в лог"""
+
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+        self.count = 0
+
+    def emit(self, record: logging.LogRecord):
+        self.count += 1
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, round(percent / 100 * len(values)) - 1))
+    return values[index]
+
+
+async def _replay_part(records: List[Any], speed: float, max_in_flight: int, api_latency: float,
+                       pool_max_size: int, profile: BotProfile, admin_ids: Set[int],
+                       start_barrier: Any = None) -> Dict[str, Any]:
+    """Прогон части журнала в текущем процессе; `start_barrier` выравнивает старт процессов"""
+    session = FakeSession(api_latency)
+    bot = Bot(token=profile.token, session=session)
+    dp = Dispatcher(storage=BoundedMemoryStorage())
+    error_counter = _ErrorCounter()
+    logging.getLogger().addHandler(error_counter)
+    if ADMIN_IDS:
+        ADMIN_IDS.update(admin_ids)
+
+    pool = await asyncpg.create_pool(
+        **DB_CONFIG, min_size=min(DB_POOL_MIN_SIZE, pool_max_size), max_size=pool_max_size
+    )
+    try:
+        health = HealthMonitor(pool)
+        dp["health"] = health
+        dp["scheduler"] = BroadcastScheduler([bot], pool, health)
+        dp["profiler"] = SamplingProfiler(PROFILE_DIR)
+        notifier = AdminNotifier(bot, profile.admin_chat_id, NOTIFY_RATE_LIMIT, NOTIFY_DIGEST_INTERVAL)
+        notifier_task = asyncio.create_task(notifier.run())
+        bot_context = BotContextMiddleware({bot.id: profile}, {bot.id: notifier})
+        chat_queue = setup_dispatcher(dp, pool, bot_context)
+
+        latencies: List[float] = []
+        limiter = asyncio.Semaphore(max_in_flight)
+
+        async def process(update: Update, due: float):
+            try:
+                await dp.feed_update(bot, update)
+            finally:
+                latencies.append(time.monotonic() - due)
+                limiter.release()
+
+        if start_barrier is not None:
+            await asyncio.get_running_loop().run_in_executor(None, start_barrier.wait)
+        tasks = []
+        started = time.monotonic()
+        for offset, raw_update, _ in records:
+            if speed > 0:
+                due = started + offset / speed
+                if due > time.monotonic():
+                    await asyncio.sleep(due - time.monotonic())
+            await limiter.acquire()
+            if speed <= 0:
+                due = time.monotonic()
+            update = Update.model_validate(raw_update, context={"bot": bot})
+            tasks.append(asyncio.create_task(process(update, due)))
+        await asyncio.gather(*tasks)
+        duration = time.monotonic() - started
+    finally:
+        if 'notifier_task' in locals():
+            notifier_task.cancel()
+            await asyncio.gather(notifier_task, return_exceptions=True)
+            await notifier.flush()
+        logging.getLogger().removeHandler(error_counter)
+        await pool.close()
+        await bot.session.close()
+
+    return {
+        "duration": duration,
+        "latencies": latencies,
+        "errors": error_counter.count,
+        "updates_queue": chat_queue.stats(),
+        "notifications": notifier.stats(),
+        "bot_api_calls": dict(session.calls),
+    }
+
+
+def _replay_process(records: List[Any], speed: float, max_in_flight: int, api_latency: float,
+                    pool_max_size: int, profile: BotProfile, admin_ids: Set[int], start_barrier: Any,
+                    results: Any):
+    """Процесс повтора при --workers: результат или текст ошибки уходит в `results`"""
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    try:
+        results.put(asyncio.run(_replay_part(
+            records, speed, max_in_flight, api_latency, pool_max_size, profile, admin_ids, start_barrier
+        )))
+    except Exception as e:
+        # Остальные процессы не ждут у барьера упавший
+        start_barrier.abort()
+        results.put({"error": repr(e)})
+
+
+def _run_processes(records: List[Any], workers: int, speed: float, max_in_flight: int, api_latency: float,
+                   profile: BotProfile, admin_ids: Set[int]) -> List[Dict[str, Any]]:
+    """Повтор в `workers` процессах с разбиением апдейтов по chat_id, как в многопроцессном режиме бота"""
+    shares: List[List[Any]] = [[] for _ in range(workers)]
+    for record in records:
+        shares[route_update(record[1], workers)].append(record)
+    start_barrier = _mp.Barrier(workers)
+    results = _mp.Queue()
+    processes = [
+        _mp.Process(target=_replay_process, args=(
+            share, speed, max(1, max_in_flight // workers), api_latency,
+            worker_pool_size(DB_POOL_MAX_SIZE, workers), profile, admin_ids, start_barrier, results
+        ))
+        for share in shares
+    ]
+    for process in processes:
+        process.start()
+    parts = []
+    try:
+        while len(parts) < workers:
+            try:
+                parts.append(results.get(timeout=1))
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes):
+                    raise RuntimeError("процесс повтора завершился без результата")
+    finally:
+        for process in processes:
+            process.join(1)
+            if process.is_alive():
+                process.terminate()
+    errors = [part["error"] for part in parts if "error" in part]
+    if errors:
+        raise RuntimeError(f"ошибка в процессе повтора: {errors[0]}")
+    return parts
+
+
+async def replay(path: str, speed: float, max_in_flight: int, api_latency: float,
+                 workers: int = 1) -> Dict[str, Any]:
+    """Прогон журнала апдейтов через настоящие роутеры и middleware.
+
+    speed=1 — с исходными интервалами между апдейтами, speed=N — в N раз
+    быстрее, speed=0 — так быстро, как получится (не более `max_in_flight`
+    апдейтов одновременно). Задержка апдейта считается от момента, когда он
+    пришёл бы по расписанию, до конца обработки. При `workers` > 1 апдейты
+    делятся по chat_id между процессами (пул БД и `max_in_flight` — поровну),
+    и пропускная способность сравнима с многопроцессным режимом бота (WORKERS).
+    """
+    records = list(read_updates(path))
+    admin_ids = {update.get("message", update.get("callback_query", {})).get("from", {}).get("id")
+                 for _, update, is_admin in records if is_admin} - {None}
+    profile = BotProfile(REPLAY_BOT_TOKEN, ADMIN_CHAT_ID or 0, COMPANY_INFO, CONTACTS_INFO, COMPANY_LOGO)
+
+    conn = await asyncpg.connect(**DB_CONFIG)
+    try:
+        await init_db(conn, profile.bot_id)
+        # Без удаления старых партиций: локальная БД может хранить прогоны для сравнения
+        await setup_request_partitions(conn, REQUESTS_PARTITIONS_AHEAD, 0, False)
+        await conn.executemany(
+            "INSERT INTO admins (user_id) VALUES ($1) ON CONFLICT (user_id) DO NOTHING",
+            [(admin_id,) for admin_id in admin_ids]
+        )
+    finally:
+        await conn.close()
+
+    if workers > 1:
+        parts = await asyncio.get_running_loop().run_in_executor(
+            None, _run_processes, records, workers, speed, max_in_flight, api_latency, profile, admin_ids
+        )
+    else:
+        parts = [await _replay_part(
+            records, speed, max_in_flight, api_latency, DB_POOL_MAX_SIZE, profile, admin_ids
+        )]
+
+    # Процессы стартуют одновременно, поэтому время прогона — время самого долгого из них
+    duration = max(part["duration"] for part in parts)
+    latencies = sorted(latency for part in parts for latency in part["latencies"])
+    bot_api_calls: Counter = Counter()
+    for part in parts:
+        bot_api_calls.update(part["bot_api_calls"])
+    return {
+        "log": path,
+        "updates": len(records),
+        "speed": speed or "max",
+        "workers": workers,
+        "duration_s": round(duration, 3),
+        "throughput_ups": round(len(records) / duration, 1) if duration else None,
+        "latency_ms": {
+            name: round(_percentile(latencies, percent) * 1000, 1)
+            for name, percent in (("p50", 50), ("p90", 90), ("p99", 99), ("max", 100))
+        },
+        "errors": sum(part["errors"] for part in parts),
+        "updates_queue": merge_stats([part["updates_queue"] for part in parts]),
+        "notifications": merge_stats([part["notifications"] for part in parts]),
+        "bot_api_calls": dict(bot_api_calls.most_common()),
+    }
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(
+        description="Повтор записанных апдейтов на локальной БД (DB_* из .env) без обращений к Telegram"
+    )
+    parser.add_argument("log", help="журнал, записанный при RECORD_UPDATES_FILE")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="множитель скорости относительно записи; 0 — максимально быстро")
+    parser.add_argument("--max-in-flight", type=int, default=1000,
+                        help="предел одновременно обрабатываемых апдейтов")
+    parser.add_argument("--api-latency", type=float, default=0.0,
+                        help="задержка ответа Bot API в секундах")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="число процессов; апдейты делятся по chat_id, как при WORKERS")
+    args = parser.parse_args()
+    result = asyncio.run(replay(args.log, args.speed, args.max_in_flight, args.api_latency, args.workers))
+    print(json.dumps(result, ensure_ascii=False, indent=2))
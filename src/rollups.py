@@ -0,0 +1,53 @@
+import argparse
+import asyncio
+import logging
+
+import asyncpg
+
+from src.bots import load_bot_profiles
+from src.config import DB_CONFIG
+from src.database import init_db, reset_request_rollups, update_request_rollups
+
+
+logger = logging.getLogger(__name__)
+
+
+async def run_rollups(pool: asyncpg.Pool, interval: float):
+    """Фоновая задача: периодически догоняет аналитику заявок до свежих данных"""
+    while True:
+        try:
+            async with pool.acquire() as conn:
+                while await update_request_rollups(conn):
+                    pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка фонового обновления аналитики: {e}")
+        await asyncio.sleep(interval)
+
+
+async def backfill(batch_size: int):
+    """Пересчёт аналитики по всей истории заявок"""
+    conn = await asyncpg.connect(**DB_CONFIG)
+    try:
+        await init_db(conn, load_bot_profiles()[0].bot_id)
+        await reset_request_rollups(conn)
+        total = 0
+        while processed := await update_request_rollups(conn, batch_size):
+            total += processed
+            logger.info(f"Обработано id заявок: {total}")
+        logger.info("Пересчёт аналитики завершён")
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Почасовая аналитика заявок")
+    parser.add_argument("--backfill", action="store_true", help="пересчитать аналитику по всей истории")
+    parser.add_argument("--batch-size", type=int, default=50000)
+    args = parser.parse_args()
+    if args.backfill:
+        asyncio.run(backfill(args.batch_size))
+    else:
+        parser.print_help()
@@ -17,3 +17,4 @@ class RequestForm(StatesGroup):
 class AdminPanel(StatesGroup):
     waiting_for_broadcast_message = State()
     confirming_broadcast = State()
+    waiting_for_schedule = State()
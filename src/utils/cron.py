@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+from typing import List, Set, Tuple
+
+
+# (минимум, максимум) для полей: минута, час, день месяца, месяц, день недели (0 и 7 — воскресенье)
+_FIELD_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+
+def _parse_field(field: str, low: int, high: int) -> Set[int]:
+    values = set()
+    for part in field.split(","):
+        step = 1
+        if "/" in part:
+            part, step_str = part.split("/", 1)
+            step = int(step_str)
+            if step < 1:
+                raise ValueError(f"Некорректный шаг: {step_str}")
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start_str, end_str = part.split("-", 1)
+            start, end = int(start_str), int(end_str)
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        if start < low or end > high or start > end:
+            raise ValueError(f"Значение вне диапазона {low}-{high}: {part}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+def parse_cron(expression: str) -> Tuple[List[Set[int]], bool, bool]:
+    """Разбор cron-выражения из 5 полей: минута час день месяц день_недели.
+
+    Возвращает множества допустимых значений и признаки ограниченности
+    дня месяца и дня недели (нужны для стандартной логики «или» между ними).
+    """
+    fields = expression.split()
+    if len(fields) != 5:
+        raise ValueError("Cron-выражение должно состоять из 5 полей")
+    parsed = [_parse_field(field, low, high) for field, (low, high) in zip(fields, _FIELD_RANGES)]
+    # 7 в поле дня недели — тоже воскресенье, в том числе внутри диапазонов (1-7, 5-7)
+    if 7 in parsed[4]:
+        parsed[4] = (parsed[4] - {7}) | {0}
+    return parsed, _is_restricted(fields[2], parsed[2], 31), _is_restricted(fields[4], parsed[4], 7)
+
+
+def _is_restricted(field: str, values: Set[int], count: int) -> bool:
+    """Ограничивает ли поле дня выбор дней.
+
+    Как в cron: поле со звёздочки (`*`, `*/2`) не ограничивает, как и
+    перечисление всех значений (`1-31`, `0-6`); `*/2` в дне месяца при
+    заданном дне недели сужает выбор («и»), а не добавляет дни («или»).
+    """
+    return not field.startswith("*") and len(values) < count
+
+
+def next_cron_time(expression: str, after: datetime) -> datetime:
+    """Ближайший момент после `after`, подходящий под cron-выражение"""
+    (minutes, hours, days, months, weekdays), dom_restricted, dow_restricted = parse_cron(expression)
+    moment = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    limit = after + timedelta(days=366 * 5)
+
+    while moment <= limit:
+        if moment.month not in months:
+            year, month = (moment.year + 1, 1) if moment.month == 12 else (moment.year, moment.month + 1)
+            moment = moment.replace(year=year, month=month, day=1, hour=0, minute=0)
+            continue
+
+        day_ok = moment.day in days
+        weekday_ok = (moment.isoweekday() % 7) in weekdays
+        if dom_restricted and dow_restricted:
+            matches_day = day_ok or weekday_ok
+        else:
+            matches_day = day_ok and weekday_ok
+        if not matches_day:
+            moment = (moment + timedelta(days=1)).replace(hour=0, minute=0)
+            continue
+
+        if moment.hour not in hours:
+            moment = (moment + timedelta(hours=1)).replace(minute=0)
+            continue
+        if moment.minute not in minutes:
+            moment += timedelta(minutes=1)
+            continue
+        return moment
+
+    raise ValueError(f"Cron-выражение никогда не срабатывает: {expression}")
@@ -0,0 +1,35 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Hashable
+
+
+logger = logging.getLogger(__name__)
+
+
+class MediaGroupDebouncer:
+    """Действие после последней части альбома.
+
+    Telegram присылает альбом отдельными апдейтами без признака последнего.
+    Каждая часть вызывает `touch`, который переносит отложенный вызов
+    `callback` ещё на `delay` секунд; срабатывает он один раз, когда части
+    перестали приходить. Ожидание идёт вне обработчика апдейта, поэтому не
+    задерживает очередь чата.
+    """
+
+    def __init__(self, delay: float = 1.0):
+        self.delay = delay
+        self._pending: Dict[Hashable, asyncio.Task] = {}
+
+    def touch(self, key: Hashable, callback: Callable[[], Awaitable]):
+        task = self._pending.get(key)
+        if task is not None:
+            task.cancel()
+        self._pending[key] = asyncio.create_task(self._fire(key, callback))
+
+    async def _fire(self, key: Hashable, callback: Callable[[], Awaitable]):
+        await asyncio.sleep(self.delay)
+        del self._pending[key]
+        try:
+            await callback()
+        except Exception as e:
+            logger.error(f"Ошибка обработки альбома {key}: {e}")
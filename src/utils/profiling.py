@@ -0,0 +1,103 @@
+import contextvars
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+_current_record: contextvars.ContextVar[Optional["UpdateRecord"]] = contextvars.ContextVar("update_record", default=None)
+
+
+class UpdateRecord:
+    """Что успел сделать апдейт: обработчик, SQL-запросы и вызовы Bot API"""
+
+    __slots__ = ("handler", "queries", "api_calls")
+
+    def __init__(self):
+        self.handler: Optional[str] = None
+        self.queries: List[Tuple[str, float]] = []
+        self.api_calls: List[Tuple[str, float]] = []
+
+
+def start_record() -> Tuple[UpdateRecord, contextvars.Token]:
+    record = UpdateRecord()
+    return record, _current_record.set(record)
+
+
+def finish_record(token: contextvars.Token):
+    _current_record.reset(token)
+
+
+def current_record() -> Optional[UpdateRecord]:
+    return _current_record.get()
+
+
+def record_query(logged_query):
+    """Логгер запросов asyncpg: запоминает запрос в записи текущего апдейта"""
+    record = _current_record.get()
+    if record is not None:
+        record.queries.append((" ".join(logged_query.query.split()), logged_query.elapsed))
+
+
+class SamplingProfiler:
+    """Сэмплирующий профайлер потока event loop.
+
+    Раз в `interval` секунд снимает стек целевого потока из отдельного потока
+    и по окончании пишет стеки в свёрнутом формате (`func;func;func count`),
+    который понимают flamegraph.pl, speedscope и inferno.
+    """
+
+    def __init__(self, output_dir: str, interval: float = 0.005):
+        self.output_dir = output_dir
+        self.interval = interval
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: float) -> Optional[str]:
+        """Запуск профилирования текущего потока; возвращает путь к будущему файлу"""
+        if self.running:
+            return None
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"profile-{datetime.now():%Y%m%d-%H%M%S}.folded")
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(threading.get_ident(), seconds, path),
+            name="sampling-profiler",
+            daemon=True
+        )
+        self._thread.start()
+        logger.info(f"Профилирование запущено на {seconds} с, результат: {path}")
+        return path
+
+    def _run(self, target_thread_id: int, seconds: float, path: str):
+        stacks: Counter = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(target_thread_id)
+            if frame is None:
+                break
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stacks[";".join(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            logger.info(f"Профилирование завершено: {sum(stacks.values())} сэмплов записано в {path}")
+        except OSError as e:
+            logger.error(f"Ошибка записи профиля в {path}: {e}")
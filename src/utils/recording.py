@@ -0,0 +1,134 @@
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import re
+import time
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from src.keyboards import get_cancel_keyboard, get_main_menu, get_phone_keyboard, get_request_type_keyboard
+
+
+# Тексты кнопок управляют маршрутизацией, поэтому при анонимизации сохраняются как есть
+KEEP_TEXTS = frozenset(
+    button.text
+    for keyboard in (get_main_menu(), get_request_type_keyboard(), get_cancel_keyboard(), get_phone_keyboard())
+    for row in keyboard.keyboard
+    for button in row
+)
+
+# Объекты (и списки объектов), у которых "id" — ID пользователя или чата
+_ID_PARENTS = frozenset({
+    "from", "chat", "user", "sender_chat", "sender_user", "forward_from", "forward_from_chat",
+    "new_chat_members", "left_chat_member", "via_bot",
+})
+_NAME_KEYS = frozenset({"first_name", "last_name", "username", "title", "vcard"})
+_TEXT_KEYS = frozenset({"text", "caption"})
+_DATE_RE = re.compile(r"^\d{2}\.\d{2}\.\d{4}$")
+_LETTER_RE = re.compile(r"[a-zA-Zа-яА-ЯёЁ]")
+_DIGIT_RE = re.compile(r"\d")
+# Callback-данные, содержащие ID пользователя
+_USER_ID_DATA_RE = re.compile(r"^(user_info:)(-?\d+)$")
+
+
+class Anonymizer:
+    """Обезличивание апдейтов с сохранением их структуры.
+
+    ID пользователей и чатов заменяются стабильными псевдонимами (HMAC с солью
+    записи), тексты — строками той же длины и формы, кроме команд и текстов
+    кнопок, от которых зависит выбор обработчика. Даты остаются датами, ФИО —
+    словами, чтобы повтор шёл по тем же веткам валидации.
+    """
+
+    def __init__(self, salt: Optional[bytes] = None):
+        self.salt = salt or os.urandom(16)
+
+    def map_id(self, value: int) -> int:
+        digest = hmac.new(self.salt, str(value).encode(), hashlib.sha256).digest()
+        pseudonym = int.from_bytes(digest[:6], "big") % 9_000_000_000 + 1_000_000_000
+        return -pseudonym if value < 0 else pseudonym
+
+    def anonymize_text(self, text: str) -> str:
+        if text in KEEP_TEXTS or text.startswith("/"):
+            return text
+        if _DATE_RE.match(text):
+            return "01.01.1990"
+        return _DIGIT_RE.sub("0", _LETTER_RE.sub("x", text))
+
+    def anonymize(self, value: Any, parent_key: Optional[str] = None) -> Any:
+        # Элементы списка анонимизируются как объекты его ключа (new_chat_members -> участник)
+        if isinstance(value, list):
+            return [self.anonymize(item, parent_key) for item in value]
+        if not isinstance(value, dict):
+            return value
+
+        result = {}
+        for key, item in value.items():
+            if key == "id" and parent_key in _ID_PARENTS and isinstance(item, int):
+                result[key] = self.map_id(item)
+            elif key == "user_id" and isinstance(item, int):
+                result[key] = self.map_id(item)
+            elif key in _NAME_KEYS and isinstance(item, str):
+                result[key] = _LETTER_RE.sub("x", item)
+            elif key in _TEXT_KEYS and isinstance(item, str):
+                result[key] = self.anonymize_text(item)
+            elif key == "phone_number" and isinstance(item, str):
+                result[key] = "+7" + "0" * 10
+            elif key == "data" and parent_key == "callback_query" and isinstance(item, str):
+                result[key] = _USER_ID_DATA_RE.sub(lambda m: m.group(1) + str(self.map_id(int(m.group(2)))), item)
+            else:
+                result[key] = self.anonymize(item, key)
+        return result
+
+
+def rotated_path(path: str, moment: float) -> str:
+    """Имя для журнала прошлого запуска: updates.jsonl.gz -> updates.20260101-120000.jsonl.gz"""
+    root, ext = os.path.splitext(path)
+    if ext == ".gz":
+        root, inner_ext = os.path.splitext(root)
+        ext = inner_ext + ext
+    return f"{root}.{time.strftime('%Y%m%d-%H%M%S', time.localtime(moment))}{ext}"
+
+
+class UpdateRecorder:
+    """Запись апдейтов в сжатый журнал.
+
+    Одна строка JSON на апдейт: {"t": смещение от начала записи в секундах,
+    "u": обезличенный апдейт, "a": 1 — только для апдейтов админов}.
+    Смещения и псевдонимы (соль) действуют в пределах одного запуска, поэтому
+    журнал прошлого запуска переименовывается (rotated_path), а запись
+    начинается в новый файл.
+    """
+
+    def __init__(self, path: str, flush_every: int = 100):
+        self.path = path
+        self.flush_every = flush_every
+        self.anonymizer = Anonymizer()
+        self._started = time.monotonic()
+        self._pending = 0
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            os.replace(path, rotated_path(path, os.path.getmtime(path)))
+        self._file = gzip.open(path, "wt", encoding="utf-8")
+
+    def write(self, update: Dict[str, Any], is_admin: bool = False):
+        record = {"t": round(time.monotonic() - self._started, 3), "u": self.anonymizer.anonymize(update)}
+        if is_admin:
+            record["a"] = 1
+        self._file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self._pending += 1
+        if self._pending >= self.flush_every:
+            self._file.flush()
+            self._pending = 0
+
+    def close(self):
+        self._file.close()
+
+
+def read_updates(path: str) -> Iterator[Tuple[float, Dict[str, Any], bool]]:
+    """Чтение журнала: (смещение в секундах, апдейт, признак апдейта админа)"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                yield record["t"], record["u"], bool(record.get("a"))
@@ -0,0 +1,187 @@
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import random
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """Отрезок трейса в терминах OpenTelemetry"""
+
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace: "_Trace", name: str, kind: int, parent_id: Optional[str], start_ns: int):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = start_ns
+        self.end_ns = 0
+        self.attributes: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 0},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class _Trace:
+    __slots__ = ("trace_id", "spans")
+
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.spans: List[Span] = []
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class Tracer:
+    """Лёгкий трейсер с head-сэмплированием.
+
+    Решение о записи принимается при открытии корневого отрезка; для
+    неотобранных апдейтов дочерние отрезки не создаются вовсе. Завершённые
+    трейсы пишутся в файл по строке на трейс в формате OTLP/JSON.
+    """
+
+    def __init__(self, path: Optional[str], sample_rate: float = 0.1, service_name: str = "holiday-bot"):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.service_name = service_name
+        self._file = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path) and self.sample_rate > 0
+
+    @contextmanager
+    def root_span(self, name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+        """Корневой отрезок апдейта; None, если апдейт не попал в выборку"""
+        if not self.enabled or random.random() >= self.sample_rate:
+            yield None
+            return
+
+        span = Span(_Trace(), name, SPAN_KIND_SERVER, None, time.time_ns())
+        span.attributes.update(attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = repr(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            self._finish(span)
+            # Колбэки логгера запросов asyncpg выполняются через call_soon,
+            # поэтому выгрузка ставится в ту же очередь после них
+            asyncio.get_running_loop().call_soon(self._export, span.trace)
+
+    @contextmanager
+    def span(self, name: str, kind: int = SPAN_KIND_INTERNAL, **attributes: Any) -> Iterator[Optional[Span]]:
+        """Дочерний отрезок текущего трейса; ничего не делает вне отобранного апдейта"""
+        parent = _current_span.get()
+        if parent is None:
+            yield None
+            return
+
+        span = Span(parent.trace, name, kind, parent.span_id, time.time_ns())
+        span.attributes.update(attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = repr(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            self._finish(span)
+
+    def record_span(self, name: str, duration: float, kind: int = SPAN_KIND_INTERNAL,
+                    error: Optional[str] = None, **attributes: Any):
+        """Запись уже завершившейся операции длительностью `duration` секунд"""
+        parent = _current_span.get()
+        if parent is None:
+            return
+        end_ns = time.time_ns()
+        span = Span(parent.trace, name, kind, parent.span_id, end_ns - int(duration * 1e9))
+        span.attributes.update(attributes)
+        span.error = error
+        span.end_ns = end_ns
+        parent.trace.spans.append(span)
+
+    @staticmethod
+    def current_span() -> Optional[Span]:
+        return _current_span.get()
+
+    @staticmethod
+    def _finish(span: Span):
+        span.end_ns = time.time_ns()
+        span.trace.spans.append(span)
+
+    def _export(self, trace: _Trace):
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", self.service_name)]},
+                "scopeSpans": [{
+                    "scope": {"name": "src.utils.tracing"},
+                    "spans": [span.to_otlp() for span in trace.spans],
+                }],
+            }]
+        }
+        try:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(json.dumps(payload, ensure_ascii=False) + "\n")
+            self._file.flush()
+        except OSError as e:
+            logger.error(f"Ошибка записи трейса в {self.path}: {e}")
+
+    def query_logger(self, record):
+        """Логгер запросов asyncpg: превращает каждый SQL-запрос в отрезок"""
+        self.record_span(
+            "sql",
+            record.elapsed,
+            kind=SPAN_KIND_CLIENT,
+            error=repr(record.exception) if record.exception else None,
+            **{"db.system": "postgresql", "db.statement": " ".join(record.query.split())}
+        )
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
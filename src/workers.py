@@ -0,0 +1,376 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from multiprocessing.connection import Connection
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+import aiohttp
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+
+logger = logging.getLogger(__name__)
+
+# spawn: дочерний процесс не наследует цикл событий, соединения и сессии родителя
+_mp = multiprocessing.get_context("spawn")
+
+# Процесс, проработавший дольше, перезапускается сразу; частые падения — с растущей паузой
+WORKER_STABLE_AFTER = 60.0
+# Сколько апдейтов передавать процессу за одну запись в канал
+SEND_BATCH_SIZE = 100
+# Как часто обработчик присылает процессу приёма свои метрики; более старые отчёты в сводку не входят
+STATS_REPORT_INTERVAL = 5.0
+STATS_STALE_AFTER = 3 * STATS_REPORT_INTERVAL
+# Разделы /health обработчиков, которые процесс приёма показывает суммарно
+MERGED_SECTIONS = ("bots", "updates", "fsm", "broadcasts")
+
+
+def update_chat_id(update: Dict[str, Any]) -> Optional[int]:
+    """ID чата сырого апдейта; для апдейтов без чата — ID пользователя (как в ChatQueueMiddleware)"""
+    for key, payload in update.items():
+        if key == "update_id" or not isinstance(payload, dict):
+            continue
+        chat = payload.get("chat") or (payload.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+        user = payload.get("from") or payload.get("user")
+        return user["id"] if user else None
+    return None
+
+
+def route_update(update: Dict[str, Any], workers: int) -> int:
+    """Номер процесса для апдейта: все апдейты одного чата попадают в один процесс"""
+    chat_id = update_chat_id(update)
+    return (chat_id if chat_id is not None else update["update_id"]) % workers
+
+
+def worker_pool_size(max_size: int, workers: int) -> int:
+    """Пул соединений процесса: общий предел `max_size` делится поровну, но не меньше 2"""
+    return max(2, max_size // workers)
+
+
+def merge_stats(parts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Сводка метрик нескольких процессов: счётчики складываются, средние усредняются,
+    максимумы и флаги объединяются, вложенные разделы сводятся так же"""
+    merged: Dict[str, Any] = {}
+    for key in dict.fromkeys(key for part in parts for key in part):
+        values = [part[key] for part in parts if key in part]
+        if isinstance(values[0], dict):
+            merged[key] = merge_stats(values)
+        elif isinstance(values[0], bool):
+            merged[key] = any(values)
+        elif key.startswith("max_wait"):
+            merged[key] = max(values)
+        elif key.startswith("avg_"):
+            merged[key] = round(sum(values) / len(values), 1)
+        elif isinstance(values[0], (int, float)):
+            merged[key] = sum(values)
+        else:
+            merged[key] = values[0]
+    return merged
+
+
+def worker_path(path: Optional[str], index: int) -> Optional[str]:
+    """Отдельный файл для процесса-обработчика: trace.jsonl -> trace.1.jsonl"""
+    if not path:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{index}{ext}"
+
+
+class WorkerPool:
+    """Процессы-обработчики апдейтов под присмотром процесса приёма.
+
+    `target(index, connection, reports, *args)` запускается в отдельном
+    процессе и читает пачки `[(bot_id, апдейт), ...]` из `connection` (None —
+    сигнал остановки), а в `reports` пишет снимки своего /health (см.
+    report_stats): процесс приёма сводит их в `merged_section`. Апдейт уходит процессу `route_update`, то есть все апдейты
+    чата обрабатывает один процесс в порядке поступления, а внутри процесса их
+    упорядочивает ChatQueueMiddleware. Пачка удаляется из буфера только после
+    записи в канал, поэтому при падении процесса неотправленные апдейты
+    достаются перезапущенному. Буфер процесса ограничен `queue_size`: если
+    процесс не успевает, `submit` ждёт и приём апдейтов притормаживает.
+    """
+
+    def __init__(self, workers: int, target: Callable, args: Tuple = (), queue_size: int = 1000):
+        self.workers = workers
+        self.target = target
+        self.args = args
+        self.queue_size = queue_size
+        self._buffers: List[Deque[Tuple[int, Dict[str, Any]]]] = [deque() for _ in range(workers)]
+        self._has_items = [asyncio.Event() for _ in range(workers)]
+        self._has_room = [asyncio.Event() for _ in range(workers)]
+        self._processes: List[Any] = [None] * workers
+        self._connections: List[Optional[Connection]] = [None] * workers
+        self._started_at = [0.0] * workers
+        self._crashes = [0] * workers
+        self._restart_at: List[Optional[float]] = [None] * workers
+        self._sending = [False] * workers
+        self._report_connections: List[Optional[Connection]] = [None] * workers
+        self._reports: List[Optional[Tuple[float, Dict[str, Any]]]] = [None] * workers
+        self._feeders: List[asyncio.Task] = []
+        self._stopping = False
+
+        self.submitted = [0] * workers
+        self.restarts = 0
+
+    def alive(self) -> int:
+        return sum(1 for process in self._processes if process is not None and process.is_alive())
+
+    def _fresh_reports(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        return [entry[1] for entry in self._reports if entry is not None and now - entry[0] < STATS_STALE_AFTER]
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики процессов-обработчиков и их фоновых задач (по последним отчётам)"""
+        now = time.monotonic()
+        return {
+            "workers": self.workers,
+            "alive": self.alive(),
+            "restarts": self.restarts,
+            "submitted": self.submitted,
+            "buffered": [len(buffer) for buffer in self._buffers],
+            "report_age": [round(now - entry[0], 1) if entry else None for entry in self._reports],
+            "tasks": [entry[1].get("tasks") if entry else None for entry in self._reports],
+        }
+
+    def merged_section(self, name: str) -> Dict[str, Any]:
+        """Раздел /health, сведённый по свежим отчётам обработчиков (например, bots или broadcasts)"""
+        parts = [report[name] for report in self._fresh_reports() if name in report]
+        return merge_stats(parts) if parts else {}
+
+    def _receive_reports(self, index: int, connection: Connection):
+        """Чтение отчётов обработчика, когда в канале есть данные (add_reader)"""
+        try:
+            while connection.poll():
+                self._reports[index] = (time.monotonic(), connection.recv())
+        except (EOFError, OSError):
+            # Процесс завершился: отчёт остаётся до устаревания, канал больше не читаем
+            self._close_reports(index)
+
+    def _close_reports(self, index: int):
+        connection = self._report_connections[index]
+        if connection is None:
+            return
+        asyncio.get_running_loop().remove_reader(connection.fileno())
+        connection.close()
+        self._report_connections[index] = None
+
+    def _start(self, index: int):
+        reader, writer = _mp.Pipe(duplex=False)
+        report_reader, report_writer = _mp.Pipe(duplex=False)
+        process = _mp.Process(
+            target=self.target, args=(index, reader, report_writer, *self.args), name=f"worker-{index}"
+        )
+        process.start()
+        # Копии концов процесса в родителе не нужны: иначе запись в канал умершего процесса не упадёт,
+        # а чтение отчётов не получит EOF
+        reader.close()
+        report_writer.close()
+        if self._connections[index] is not None:
+            self._connections[index].close()
+        self._close_reports(index)
+        self._processes[index] = process
+        self._connections[index] = writer
+        self._report_connections[index] = report_reader
+        asyncio.get_running_loop().add_reader(report_reader.fileno(), self._receive_reports, index, report_reader)
+        self._started_at[index] = time.monotonic()
+        logger.info(f"Запущен обработчик апдейтов {index} (pid {process.pid})")
+
+    def start(self):
+        for index in range(self.workers):
+            self._start(index)
+            self._has_room[index].set()
+            self._feeders.append(asyncio.create_task(self._feed(index)))
+
+    async def submit(self, bot_id: int, update: Dict[str, Any]):
+        """Передача апдейта процессу его чата; ждёт, пока в буфере процесса не появится место"""
+        index = route_update(update, self.workers)
+        while len(self._buffers[index]) >= self.queue_size:
+            self._has_room[index].clear()
+            await self._has_room[index].wait()
+        self._buffers[index].append((bot_id, update))
+        self._has_items[index].set()
+        self.submitted[index] += 1
+
+    async def _feed(self, index: int):
+        """Передача буфера процессу пачками; запись идёт в потоке, чтобы не блокировать цикл событий"""
+        loop = asyncio.get_running_loop()
+        buffer = self._buffers[index]
+        while True:
+            if not buffer:
+                self._has_items[index].clear()
+                await self._has_items[index].wait()
+            connection = self._connections[index]
+            batch = [buffer[i] for i in range(min(SEND_BATCH_SIZE, len(buffer)))]
+            self._sending[index] = True
+            try:
+                await loop.run_in_executor(None, connection.send, batch)
+            except (OSError, ValueError):
+                # Процесс упал: пачка остаётся в буфере до перезапуска
+                while self._connections[index] is connection:
+                    await asyncio.sleep(0.1)
+                continue
+            finally:
+                self._sending[index] = False
+            for _ in batch:
+                buffer.popleft()
+            self._has_room[index].set()
+
+    def signal(self, signum: int):
+        """Пересылка сигнала (например, SIGUSR1 для профилирования) всем процессам"""
+        for process in self._processes:
+            if process is not None and process.is_alive():
+                os.kill(process.pid, signum)
+
+    async def supervise(self, interval: float = 1.0):
+        """Фоновая задача: перезапуск упавших процессов (частые падения — с паузой до минуты)"""
+        while not self._stopping:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for index, process in enumerate(self._processes):
+                if self._stopping or process.is_alive():
+                    continue
+                if self._restart_at[index] is None:
+                    if now - self._started_at[index] >= WORKER_STABLE_AFTER:
+                        self._crashes[index] = 0
+                    delay = min(2 ** self._crashes[index], 60) if self._crashes[index] else 0
+                    self._crashes[index] += 1
+                    self._restart_at[index] = now + delay
+                    logger.error(
+                        f"Обработчик апдейтов {index} завершился с кодом {process.exitcode}, "
+                        f"перезапуск через {delay} с, в буфере {len(self._buffers[index])} апдейтов"
+                    )
+                if now >= self._restart_at[index]:
+                    self._restart_at[index] = None
+                    self._start(index)
+                    self.restarts += 1
+
+    async def stop(self, timeout: float = 30):
+        """Передача оставшихся апдейтов, сигнал остановки и ожидание завершения процессов"""
+        self._stopping = True
+        deadline = time.monotonic() + timeout
+        while (any(self._buffers) or any(self._sending)) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        for feeder in self._feeders:
+            feeder.cancel()
+        await asyncio.gather(*self._feeders, return_exceptions=True)
+
+        loop = asyncio.get_running_loop()
+        for index, connection in enumerate(self._connections):
+            # Канал, запись в который не закончилась, не трогаем: процесс будет остановлен по таймауту
+            if self._sending[index]:
+                continue
+            try:
+                connection.send(None)
+            except (OSError, ValueError):
+                pass
+        for index, process in enumerate(self._processes):
+            await loop.run_in_executor(None, process.join, max(deadline - time.monotonic(), 1))
+            if process.is_alive():
+                logger.warning(f"Обработчик апдейтов {index} не завершился вовремя и будет остановлен")
+                process.kill()
+                await loop.run_in_executor(None, process.join)
+            self._connections[index].close()
+            self._close_reports(index)
+        lost = sum(len(buffer) for buffer in self._buffers)
+        if lost:
+            logger.error(f"При остановке не переданы обработчикам апдейтов: {lost}")
+
+
+def run_bot_worker(index: int, connection: Connection, reports: Connection):
+    """Точка входа процесса-обработчика бота.
+
+    Лежит здесь, а не в src/__main__.py: при запуске через `python -m src`
+    spawn не находит функции модуля __main__ в дочернем процессе.
+    """
+    from src.__main__ import run_worker
+    run_worker(index, connection, reports)
+
+
+async def report_stats(snapshot: Callable[[], Awaitable[Dict[str, Any]]], connection: Connection,
+                       interval: float = STATS_REPORT_INTERVAL):
+    """Фоновая задача обработчика: снимок его /health раз в `interval` секунд уходит процессу приёма"""
+    while True:
+        try:
+            connection.send(await snapshot())
+        except (OSError, ValueError):
+            logger.warning("Процесс приёма апдейтов не принимает метрики, отправка остановлена")
+            return
+        await asyncio.sleep(interval)
+
+
+async def poll_updates(bot: Bot, workers: WorkerPool, allowed_updates: List[str],
+                       on_update: Optional[Callable[[Dict[str, Any]], None]] = None,
+                       on_poll: Optional[Callable[[], None]] = None, timeout: int = 30):
+    """Long polling без разбора апдейтов: сырые апдейты сразу уходят процессам-обработчикам.
+
+    Разбор в модели aiogram и вся обработка выполняются в обработчиках, процесс
+    приёма только читает JSON и выбирает процесс по chat_id. `offset`
+    сдвигается после передачи апдейта в WorkerPool.
+    """
+    session = await bot.session.create_session()
+    url = bot.session.api.api_url(bot.token, "getUpdates")
+    request_timeout = aiohttp.ClientTimeout(total=timeout + 10)
+    offset = None
+    backoff = 1.0
+    while True:
+        params: Dict[str, Any] = {"timeout": timeout, "allowed_updates": allowed_updates}
+        if offset is not None:
+            params["offset"] = offset
+        try:
+            async with session.post(url, json=params, timeout=request_timeout) as response:
+                result = await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            logger.warning(f"Ошибка getUpdates бота {bot.id}: {e}, повтор через {backoff:.0f} с")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+            continue
+        if not result.get("ok"):
+            retry_after = result.get("parameters", {}).get("retry_after")
+            delay = retry_after or backoff
+            logger.warning(
+                f"getUpdates бота {bot.id}: {result.get('error_code')} {result.get('description')}, "
+                f"повтор через {delay:.0f} с"
+            )
+            await asyncio.sleep(delay)
+            backoff = min(backoff * 2, 30)
+            continue
+
+        backoff = 1.0
+        if on_poll:
+            on_poll()
+        for update in result["result"]:
+            if on_update:
+                on_update(update)
+            await workers.submit(bot.id, update)
+            offset = update["update_id"] + 1
+
+
+async def consume_updates(dp: Dispatcher, bots: Dict[int, Bot], connection: Connection):
+    """Обработка апдейтов, присланных WorkerPool, до сигнала остановки.
+
+    Каждый апдейт обрабатывается отдельной задачей, как при обычном polling;
+    порядок внутри чата обеспечивает ChatQueueMiddleware.
+    """
+    loop = asyncio.get_running_loop()
+    tasks = set()
+    while True:
+        try:
+            batch = await loop.run_in_executor(None, connection.recv)
+        except EOFError:
+            logger.warning("Процесс приёма апдейтов завершился, обработчик останавливается")
+            break
+        if batch is None:
+            break
+        for bot_id, raw_update in batch:
+            bot = bots[bot_id]
+            update = Update.model_validate(raw_update, context={"bot": bot})
+            task = asyncio.create_task(dp.feed_update(bot, update))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
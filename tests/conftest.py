@@ -0,0 +1,134 @@
+import asyncio
+import os
+from typing import Any, Dict, List
+
+import pytest
+
+# src.config требует параметры БД и токен при импорте; тесты к БД не подключаются
+os.environ.setdefault("BOT_TOKEN", "42:test")
+os.environ.setdefault("DB_NAME", "test")
+os.environ.setdefault("DB_USER", "test")
+os.environ.setdefault("DB_PASSWORD", "test")
+
+from aiogram import Bot, Dispatcher  # noqa: E402
+from aiogram.fsm.storage.base import StorageKey  # noqa: E402
+from aiogram.types import Update  # noqa: E402
+
+from src.bots import BotProfile  # noqa: E402
+from src.dispatcher import setup_dispatcher  # noqa: E402
+from src.handlers.admin_handlers import router as admin_router  # noqa: E402
+from src.handlers.user_handlers import router as user_router  # noqa: E402
+from src.middlewares.bot_context_middleware import BotContextMiddleware  # noqa: E402
+from src.replay import FakeSession  # noqa: E402
+from src.utils.fsm_storage import BoundedMemoryStorage  # noqa: E402
+
+TEST_BOT_TOKEN = "42:test"
+USER_ID = 1001
+
+
+class FakeConnection:
+    """Соединение без БД: ответы на запросы обработчиков задаются в тесте"""
+
+    def __init__(self):
+        self.user = {"full_name": "Иванов Иван Иванович", "phone_number": "+79990000000"}
+
+    async def fetchrow(self, query: str, *args: Any):
+        return self.user
+
+    async def fetchval(self, query: str, *args: Any):
+        return True
+
+    async def fetch(self, query: str, *args: Any):
+        return []
+
+    async def execute(self, query: str, *args: Any):
+        return "OK"
+
+
+class _Acquire:
+    def __init__(self, conn: FakeConnection):
+        self.conn = conn
+
+    async def __aenter__(self) -> FakeConnection:
+        return self.conn
+
+    async def __aexit__(self, *exc: Any):
+        return None
+
+
+class FakePool:
+    def __init__(self, conn: FakeConnection):
+        self.conn = conn
+
+    def get_max_size(self) -> int:
+        return 10
+
+    def acquire(self) -> _Acquire:
+        return _Acquire(self.conn)
+
+
+class FakeNotifier:
+    """Вместо AdminNotifier: запоминает уведомления о заявках"""
+
+    def __init__(self):
+        self.notifications: List[Any] = []
+
+    def notify(self, notification: Any):
+        self.notifications.append(notification)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"queued": 0}
+
+
+class BotHarness:
+    """Диспетчер с настоящими роутерами и middleware, Bot API — заглушка из src.replay"""
+
+    def __init__(self):
+        self.session = FakeSession()
+        self.bot = Bot(token=TEST_BOT_TOKEN, session=self.session)
+        self.storage = BoundedMemoryStorage()
+        self.dp = Dispatcher(storage=self.storage)
+        self.conn = FakeConnection()
+        self.notifier = FakeNotifier()
+        profile = BotProfile(TEST_BOT_TOKEN, -100, "О нас", "Контакты", None)
+        bot_context = BotContextMiddleware({self.bot.id: profile}, {self.bot.id: self.notifier})
+        self.pool = FakePool(self.conn)
+        self.chat_queue = setup_dispatcher(self.dp, self.pool, bot_context)
+        self._update_ids = iter(range(1, 1_000_000))
+
+    def key(self, user_id: int = USER_ID) -> StorageKey:
+        return StorageKey(bot_id=self.bot.id, chat_id=user_id, user_id=user_id)
+
+    def _update(self, **payload: Any) -> Update:
+        return Update.model_validate({"update_id": next(self._update_ids), **payload}, context={"bot": self.bot})
+
+    def message(self, user_id: int = USER_ID, **fields: Any) -> Update:
+        return self._update(message={
+            "message_id": next(self._update_ids), "date": 0,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Иван"},
+            **fields,
+        })
+
+    def callback(self, data: str, user_id: int = USER_ID, message_id: int = 1) -> Update:
+        return self._update(callback_query={
+            "id": str(next(self._update_ids)), "chat_instance": "1", "data": data,
+            "from": {"id": user_id, "is_bot": False, "first_name": "Иван"},
+            "message": {
+                "message_id": message_id, "date": 1, "chat": {"id": user_id, "type": "private"}, "text": "..."
+            },
+        })
+
+    async def feed(self, *updates: Update):
+        """Апдейты обрабатываются параллельными задачами в порядке поступления, как при polling"""
+        tasks = [asyncio.create_task(self.dp.feed_update(self.bot, update)) for update in updates]
+        await asyncio.gather(*tasks)
+
+
+@pytest.fixture
+def harness():
+    harness = BotHarness()
+    yield harness
+    # Роутеры — модульные объекты: отцепляем их, чтобы следующий тест собрал свой диспетчер
+    for router in (user_router, admin_router):
+        router._parent_router = None
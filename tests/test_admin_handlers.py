@@ -0,0 +1,65 @@
+import asyncio
+
+from src.handlers import admin_handlers
+from src.health import HealthMonitor
+from src.states import AdminPanel
+from tests.conftest import USER_ID, FakePool
+
+
+def _photo(file_id: str) -> list:
+    return [{"file_id": file_id, "file_unique_id": f"u-{file_id}", "width": 100, "height": 100}]
+
+
+def test_broadcast_album_preview_after_last_part(harness, monkeypatch):
+    monkeypatch.setattr(admin_handlers.broadcast_album_debouncer, "delay", 0.02)
+
+    async def scenario():
+        await harness.feed(harness.callback("admin_broadcast", message_id=500))
+        await harness.feed(*[
+            harness.message(media_group_id="broadcast", photo=_photo(f"b{index}")) for index in range(3)
+        ])
+        # До последней части предпросмотра с кнопкой подтверждения ещё нет
+        assert harness.session.calls["SendMessage"] == 0
+        await asyncio.sleep(0.1)
+        return (
+            await harness.storage.get_state(harness.key()),
+            await harness.storage.get_data(harness.key()),
+        )
+
+    state, data = asyncio.run(scenario())
+    assert state == AdminPanel.confirming_broadcast.state
+    assert len(data["broadcast_data"]["message_ids"]) == 3
+    assert harness.session.calls["SendMessage"] == 1
+    # Удаляется только подсказка, сообщения альбома остаются
+    assert harness.session.calls["DeleteMessage"] == 1
+
+
+def test_confirmed_broadcast_runs_in_background_with_pool(harness, monkeypatch):
+    health = HealthMonitor(FakePool(harness.conn))
+    harness.dp["health"] = health
+    release = asyncio.Event()
+    calls = []
+
+    async def send_broadcast(bot, conn, admin_id, broadcast_data, health=None):
+        calls.append((conn, admin_id, broadcast_data))
+        await release.wait()
+        return {"delivered": 1, "blocked": 0, "failed": 0}, 1
+
+    monkeypatch.setattr(admin_handlers, "send_broadcast", send_broadcast)
+
+    async def scenario():
+        await harness.storage.set_state(harness.key(), AdminPanel.confirming_broadcast)
+        await harness.storage.set_data(harness.key(), {"broadcast_data": {"text": "Новости"}})
+        # Обработчик завершается, не дожидаясь рассылки
+        await harness.feed(harness.callback("broadcast_confirm"))
+        await asyncio.sleep(0)
+        running = health.tasks[f"broadcast_{USER_ID}"]
+        assert not running.done()
+        assert await harness.storage.get_state(harness.key()) is None
+        release.set()
+        await running
+
+    asyncio.run(scenario())
+    assert calls == [(harness.pool, USER_ID, {"text": "Новости"})]
+    # «Отправляется…» и итог рассылки
+    assert harness.session.calls["EditMessageText"] == 2
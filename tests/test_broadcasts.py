@@ -0,0 +1,53 @@
+import asyncio
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import CopyMessage
+
+from src import broadcasts
+from src.broadcasts import _deliver_broadcast
+
+BROADCAST = {"from_chat_id": 1, "message_ids": [10]}
+
+
+class RateLimitedBot:
+    """Бот, первые `limited` отправок которого получают 429"""
+
+    def __init__(self, limited: int):
+        self.limited = limited
+        self.copied = []
+
+    async def copy_message(self, chat_id: int, from_chat_id: int, message_id: int):
+        if self.limited:
+            self.limited -= 1
+            method = CopyMessage(chat_id=chat_id, from_chat_id=from_chat_id, message_id=message_id)
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=3)
+        self.copied.append(chat_id)
+
+
+def _no_sleep(monkeypatch):
+    delays = []
+
+    async def sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(broadcasts.asyncio, "sleep", sleep)
+    return delays
+
+
+def test_recipient_is_retried_after_429(monkeypatch):
+    delays = _no_sleep(monkeypatch)
+    bot = RateLimitedBot(limited=1)
+
+    assert asyncio.run(_deliver_broadcast(bot, 1001, BROADCAST)) == ("delivered", None)
+    assert bot.copied == [1001]
+    assert delays == [3]
+
+
+def test_persistent_429_is_recorded_as_failure(monkeypatch):
+    _no_sleep(monkeypatch)
+    bot = RateLimitedBot(limited=broadcasts.RETRY_AFTER_ATTEMPTS)
+
+    status, error = asyncio.run(_deliver_broadcast(bot, 1001, BROADCAST))
+
+    assert status == "failed"
+    assert bot.copied == []
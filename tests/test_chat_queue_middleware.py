@@ -0,0 +1,107 @@
+import asyncio
+from types import SimpleNamespace
+
+from src.middlewares.chat_queue_middleware import ChatQueueMiddleware
+
+BOT = SimpleNamespace(id=42)
+
+
+def _data(chat_id: int) -> dict:
+    return {"bot": BOT, "event_chat": SimpleNamespace(id=chat_id)}
+
+
+class FakeCallback:
+    id = "1"
+
+    def __init__(self):
+        self.answers = []
+
+    async def answer(self, text: str):
+        self.answers.append(text)
+
+
+def test_updates_of_one_chat_run_in_order_and_chats_in_parallel():
+    queue = ChatQueueMiddleware(max_in_flight=10)
+    log = []
+
+    def handler(name: str, delay: float):
+        async def handle(event, data):
+            log.append(f"{name} start")
+            await asyncio.sleep(delay)
+            log.append(f"{name} end")
+        return handle
+
+    async def scenario():
+        await asyncio.gather(
+            queue(handler("a1", 0.02), object(), _data(1)),
+            queue(handler("a2", 0), object(), _data(1)),
+            queue(handler("b1", 0), object(), _data(2)),
+        )
+
+    asyncio.run(scenario())
+    # a2 ждёт медленный a1, другой чат — нет
+    assert log.index("a2 start") > log.index("a1 end")
+    assert log.index("b1 end") < log.index("a1 end")
+    assert queue.stats()["processed"] == 3
+
+
+def test_update_is_shed_after_wait_timeout_and_callback_answered():
+    queue = ChatQueueMiddleware(max_in_flight=10, wait_timeout=0.01)
+    release = asyncio.Event()
+    handled = []
+    callback = FakeCallback()
+
+    async def slow(event, data):
+        await release.wait()
+
+    async def fast(event, data):
+        handled.append(event)
+
+    async def scenario():
+        first = asyncio.create_task(queue(slow, object(), _data(1)))
+        await asyncio.sleep(0)
+        result = await queue(fast, SimpleNamespace(update_id=2, callback_query=callback), _data(1))
+        release.set()
+        await first
+        return result
+
+    assert asyncio.run(scenario()) is None
+    assert handled == []
+    assert callback.answers == ["⏳ Бот перегружен, попробуйте ещё раз через несколько секунд."]
+    assert queue.stats()["shed"] == 1
+
+
+def test_in_flight_handlers_are_capped():
+    queue = ChatQueueMiddleware(max_in_flight=2)
+    running = []
+    peak = []
+
+    async def handle(event, data):
+        running.append(event)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.remove(event)
+
+    async def scenario():
+        await asyncio.gather(*(queue(handle, object(), _data(chat_id)) for chat_id in range(5)))
+
+    asyncio.run(scenario())
+    assert max(peak) == 2
+    assert queue.stats()["processed"] == 5
+    assert queue.stats()["shed"] == 0
+
+
+def test_chat_entry_is_removed_when_chat_goes_idle():
+    queue = ChatQueueMiddleware(max_in_flight=10)
+    active = []
+
+    async def handle(event, data):
+        active.append(queue.stats()["active_chats"])
+
+    async def scenario():
+        await asyncio.gather(queue(handle, object(), _data(1)), queue(handle, object(), _data(1)))
+
+    asyncio.run(scenario())
+    assert active == [1, 1]
+    assert queue.stats()["active_chats"] == 0
+    assert queue._chats == {}
@@ -0,0 +1,38 @@
+from datetime import datetime
+
+import pytest
+
+from src.utils.cron import next_cron_time, parse_cron
+
+
+@pytest.mark.parametrize("field, weekdays", [
+    ("7", {0}),
+    ("1-7", {0, 1, 2, 3, 4, 5, 6}),
+    ("5-7", {5, 6, 0}),
+    ("0,7", {0}),
+])
+def test_sunday_can_be_written_as_7(field, weekdays):
+    (_, _, _, _, parsed), _, _ = parse_cron(f"0 10 * * {field}")
+    assert parsed == weekdays
+
+
+def test_weekend_range_ending_with_7_fires_on_sunday():
+    # 2026-10-17 — суббота
+    assert next_cron_time("0 10 * * 6-7", datetime(2026, 10, 17, 11, 0)) == datetime(2026, 10, 18, 10, 0)
+
+
+@pytest.mark.parametrize("expression, restricted", [
+    ("0 9 * * *", (False, False)),
+    ("0 9 */2 * 1", (False, True)),
+    ("0 9 1-31 * 0-6", (False, False)),
+    ("0 9 1-7 * 1-7", (True, False)),
+    ("0 9 1,15 * 1", (True, True)),
+])
+def test_day_fields_restrict_only_when_narrower_than_star(expression, restricted):
+    _, dom_restricted, dow_restricted = parse_cron(expression)
+    assert (dom_restricted, dow_restricted) == restricted
+
+
+def test_step_day_of_month_narrows_weekday_instead_of_adding_days():
+    # */2 — нечётные дни: понедельники 26 октября и 2 ноября пропускаются, следующий после 19-го — 9 ноября
+    assert next_cron_time("0 9 */2 * 1", datetime(2026, 10, 19, 10, 0)) == datetime(2026, 11, 9, 9, 0)
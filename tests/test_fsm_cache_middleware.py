@@ -0,0 +1,53 @@
+import asyncio
+from types import SimpleNamespace
+
+from aiogram.fsm.middleware import FSMContextMiddleware
+from aiogram.fsm.storage.memory import DisabledEventIsolation
+
+from src.middlewares.fsm_cache_middleware import FSMCacheMiddleware
+from src.utils.fsm_storage import BoundedMemoryStorage
+
+USER_ID = 1001
+
+
+class CountingStorage(BoundedMemoryStorage):
+    def __init__(self):
+        super().__init__()
+        self.reads = 0
+        self.writes = 0
+
+    async def get_state(self, key):
+        self.reads += 1
+        return await super().get_state(key)
+
+    async def get_data(self, key):
+        self.reads += 1
+        return await super().get_data(key)
+
+    async def set_record(self, key, *args, **kwargs):
+        self.writes += 1
+        await super().set_record(key, *args, **kwargs)
+
+
+def test_update_is_read_once_and_written_once():
+    storage = CountingStorage()
+    middleware = FSMCacheMiddleware(FSMContextMiddleware(storage, DisabledEventIsolation()))
+    user = SimpleNamespace(id=USER_ID)
+    data = {"bot": SimpleNamespace(id=42), "event_from_user": user, "event_chat": user}
+
+    async def handler(event, data):
+        state = data["state"]
+        assert data["raw_state"] is None
+        await state.update_data(request_type="🏢 Офис")
+        await state.update_data(options=["desk"])
+        await state.update_data(screenshots=[])
+        await state.set_state("RequestForm:choosing_options")
+        return await state.get_state()
+
+    assert asyncio.run(middleware(handler, object(), data)) == "RequestForm:choosing_options"
+    # Чтение состояния для маршрутизации и данных для update_data; одна запись после обработчика
+    assert storage.reads == 2
+    assert storage.writes == 1
+
+    key = data["state"].key
+    assert asyncio.run(storage.get_data(key)) == {"request_type": "🏢 Офис", "options": ["desk"], "screenshots": []}
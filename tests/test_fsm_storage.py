@@ -0,0 +1,62 @@
+import asyncio
+
+from aiogram.fsm.storage.base import StorageKey
+
+from src.utils import fsm_storage
+from src.utils.fsm_storage import BoundedMemoryStorage
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+def _key(chat_id: int) -> StorageKey:
+    return StorageKey(bot_id=42, chat_id=chat_id, user_id=chat_id)
+
+
+def test_data_round_trip():
+    storage = BoundedMemoryStorage()
+    data = {"request_type": "🏢 Офис", "options": ["desk"], "screenshots": [], "step": 3}
+
+    async def scenario():
+        await storage.set_data(_key(1), data)
+        return await storage.get_data(_key(1))
+
+    assert asyncio.run(scenario()) == data
+
+
+def test_entry_expires_after_ttl_since_last_access(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(fsm_storage, "time", clock)
+    storage = BoundedMemoryStorage(ttl=60)
+
+    async def scenario():
+        await storage.set_state(_key(1), "Form:phone")
+        clock.now += 50
+        # Обращение продлевает срок жизни
+        assert await storage.get_state(_key(1)) == "Form:phone"
+        clock.now += 50
+        assert await storage.get_state(_key(1)) == "Form:phone"
+        clock.now += 61
+        return await storage.get_state(_key(1))
+
+    assert asyncio.run(scenario()) is None
+    assert storage.stats() == {"entries": 0, "evictions": 0, "expirations": 1}
+
+
+def test_least_recently_used_entry_is_evicted_at_max_entries():
+    storage = BoundedMemoryStorage(max_entries=2)
+
+    async def scenario():
+        await storage.set_state(_key(1), "Form:name")
+        await storage.set_state(_key(2), "Form:name")
+        await storage.get_state(_key(1))
+        await storage.set_state(_key(3), "Form:name")
+        return [await storage.get_state(_key(chat_id)) for chat_id in (1, 2, 3)]
+
+    assert asyncio.run(scenario()) == ["Form:name", None, "Form:name"]
+    assert storage.stats() == {"entries": 2, "evictions": 1, "expirations": 0}
@@ -0,0 +1,122 @@
+import asyncio
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError
+from aiogram.methods import SendMessage
+
+from src import notifications
+from src.notifications import AdminNotifier, RequestNotification
+from tests.conftest import FakeConnection, FakePool
+
+ADMIN_CHAT_ID = -100
+
+
+class FlakyBot:
+    """Бот, первые отправки которого завершаются заданными ошибками"""
+
+    id = 42
+
+    def __init__(self, *errors: Exception):
+        self.errors = list(errors)
+        self.sent = []
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append(text)
+
+
+def _error(error_type, message: str) -> Exception:
+    return error_type(method=SendMessage(chat_id=ADMIN_CHAT_ID, text="-"), message=message)
+
+
+def _notification(request_id: int) -> RequestNotification:
+    return RequestNotification(request_id, 1001, "Иванов Иван", "+79990000000", "🏢 Офис", ["Стол"], [])
+
+
+def test_permanent_error_is_not_retried():
+    bot = FlakyBot(_error(TelegramForbiddenError, "bot was kicked from the group chat"))
+    notifier = AdminNotifier(bot, ADMIN_CHAT_ID)
+
+    asyncio.run(notifier._deliver([_notification(1)]))
+
+    assert notifier.dropped == 1
+    assert notifier.retries == 0
+    assert bot.sent == []
+
+
+def test_rejected_digest_is_split_to_isolate_the_bad_request():
+    bot = FlakyBot(_error(TelegramBadRequest, "can't parse entities"))
+    notifier = AdminNotifier(bot, ADMIN_CHAT_ID)
+
+    asyncio.run(notifier._deliver([_notification(1), _notification(2)]))
+
+    assert notifier.sent == 2
+    assert notifier.dropped == 0
+    assert len(bot.sent) == 2
+
+
+def test_transient_errors_have_bounded_attempts(monkeypatch):
+    async def no_sleep(delay):
+        pass
+
+    monkeypatch.setattr(notifications.asyncio, "sleep", no_sleep)
+    bot = FlakyBot(*[_error(TelegramNetworkError, "timeout") for _ in range(notifications.MAX_ATTEMPTS)])
+    notifier = AdminNotifier(bot, ADMIN_CHAT_ID)
+
+    asyncio.run(notifier._deliver([_notification(1)]))
+
+    assert notifier.dropped == 1
+    assert notifier.retries == notifications.MAX_ATTEMPTS - 1
+    assert bot.sent == []
+
+
+def _request_row(request_id: int) -> dict:
+    return {
+        "id": request_id, "user_id": 1001, "full_name": "Иванов Иван", "phone_number": "+79990000000",
+        "request_type": "🏢 Офис", "options": "Стол", "screenshots": [],
+    }
+
+
+def _run_one_rescan(monkeypatch, notifier: AdminNotifier):
+    """Один проход фоновой задачи rescan: вторая пауза её останавливает"""
+    sleeps = []
+
+    async def sleep(delay):
+        sleeps.append(delay)
+        if len(sleeps) > 1:
+            raise asyncio.CancelledError
+
+    monkeypatch.setattr(notifications.asyncio, "sleep", sleep)
+    try:
+        asyncio.run(notifier.rescan())
+    except asyncio.CancelledError:
+        pass
+
+
+def test_rescan_requeues_parked_notifications(monkeypatch):
+    bot = FlakyBot(_error(TelegramForbiddenError, "bot was kicked from the group chat"))
+    notifier = AdminNotifier(bot, ADMIN_CHAT_ID)
+    asyncio.run(notifier._deliver([_notification(1)]))
+    assert notifier.stats()["parked"] == 1
+
+    _run_one_rescan(monkeypatch, notifier)
+
+    assert [n.request_id for n in notifier._queue] == [1]
+    assert notifier.stats()["parked"] == 0
+
+
+def test_rescan_skips_requests_the_notifier_already_tracks(monkeypatch):
+    calls = []
+
+    async def get_unnotified_requests(conn, bot_id, shard, shards, min_age):
+        calls.append((bot_id, shard, shards, min_age))
+        return [_request_row(1), _request_row(2)]
+
+    monkeypatch.setattr(notifications, "get_unnotified_requests", get_unnotified_requests)
+    notifier = AdminNotifier(FlakyBot(), ADMIN_CHAT_ID, pool=FakePool(FakeConnection()), shard=1, shards=3)
+    notifier.notify(_notification(1))
+
+    _run_one_rescan(monkeypatch, notifier)
+
+    assert calls == [(FlakyBot.id, 1, 3, notifications.RESCAN_MIN_AGE)]
+    assert [n.request_id for n in notifier._queue] == [1, 2]
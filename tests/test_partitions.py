@@ -0,0 +1,42 @@
+import asyncio
+from typing import Any
+
+from src import partitions
+from tests.conftest import FakeConnection, FakePool
+
+
+class RecordingConnection(FakeConnection):
+    def __init__(self):
+        super().__init__()
+        self.executed = []
+
+    async def execute(self, query: str, *args: Any):
+        self.executed.append(" ".join(query.split()))
+        return "OK"
+
+
+def test_maintenance_purges_screenshots_of_expired_requests(monkeypatch):
+    maintained = []
+    sleeps = []
+
+    async def setup_request_partitions(conn, *settings):
+        maintained.append(settings)
+
+    async def sleep(delay):
+        # Второй сон — конец первого прохода
+        sleeps.append(delay)
+        if len(sleeps) > 1:
+            raise asyncio.CancelledError
+
+    monkeypatch.setattr(partitions, "setup_request_partitions", setup_request_partitions)
+    monkeypatch.setattr(partitions.asyncio, "sleep", sleep)
+    conn = RecordingConnection()
+
+    try:
+        asyncio.run(partitions.run_partition_maintenance(FakePool(conn), 3, 12, True))
+    except asyncio.CancelledError:
+        pass
+
+    assert maintained == [(3, 12, True)]
+    purges = [query for query in conn.executed if query.startswith("DELETE FROM request_screenshots")]
+    assert purges == ["DELETE FROM request_screenshots WHERE request_id < (SELECT MIN(id) FROM requests)"]
@@ -0,0 +1,58 @@
+import os
+
+from src.utils.recording import Anonymizer, UpdateRecorder, read_updates
+
+
+def test_each_run_starts_a_new_journal(tmp_path):
+    path = str(tmp_path / "updates.log.gz")
+    first = UpdateRecorder(path)
+    first.write({"update_id": 1})
+    first.close()
+
+    second = UpdateRecorder(path)
+    second.write({"update_id": 2}, is_admin=True)
+    second.close()
+
+    rotated = [name for name in os.listdir(tmp_path) if name != "updates.log.gz"]
+    assert len(rotated) == 1 and rotated[0].endswith(".log.gz")
+    assert [update["update_id"] for _, update, _ in read_updates(str(tmp_path / rotated[0]))] == [1]
+    assert [(update["update_id"], is_admin) for _, update, is_admin in read_updates(path)] == [(2, True)]
+
+
+def _ints(value):
+    if isinstance(value, dict):
+        for item in value.values():
+            yield from _ints(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _ints(item)
+    elif isinstance(value, int) and not isinstance(value, bool):
+        yield value
+
+
+def test_no_user_or_chat_id_survives_anonymization():
+    real_ids = {111111111, 222222222, 333333333, 444444444, 555555555, 666666666, -1001234567890}
+    update = {
+        "update_id": 1,
+        "message": {
+            "message_id": 7,
+            "date": 1,
+            "chat": {"id": -1001234567890, "type": "supergroup", "title": "Группа"},
+            "from": {"id": 111111111, "is_bot": False, "first_name": "Иван"},
+            "forward_origin": {
+                "type": "user", "date": 1,
+                "sender_user": {"id": 222222222, "is_bot": False, "first_name": "Пётр"},
+            },
+            "new_chat_members": [
+                {"id": 333333333, "is_bot": False, "first_name": "Анна"},
+                {"id": 444444444, "is_bot": False, "first_name": "Олег"},
+            ],
+            "left_chat_member": {"id": 555555555, "is_bot": False, "first_name": "Мария"},
+            "via_bot": {"id": 666666666, "is_bot": True, "first_name": "bot", "username": "some_bot"},
+        },
+    }
+
+    anonymized = Anonymizer().anonymize(update)
+
+    assert not real_ids & set(_ints(anonymized))
+    assert anonymized["message"]["message_id"] == 7
@@ -0,0 +1,97 @@
+import asyncio
+from datetime import datetime
+
+from src.handlers import user_handlers
+from src.states import RequestForm
+
+
+def _photo(file_id: str) -> list:
+    return [{"file_id": file_id, "file_unique_id": f"u-{file_id}", "width": 100, "height": 100}]
+
+
+def test_screenshot_album_is_collected_in_order(harness, monkeypatch):
+    monkeypatch.setattr(user_handlers.album_debouncer, "delay", 0.02)
+
+    async def scenario():
+        await harness.storage.set_state(harness.key(), RequestForm.attaching_screenshot)
+        await harness.storage.set_data(harness.key(), {"request_type": "🏢 Офис", "draft_key": "draft"})
+        # Части альбома приходят одной пачкой getUpdates и обрабатываются параллельными задачами
+        await harness.feed(*[
+            harness.message(media_group_id="album", photo=_photo(f"f{index}")) for index in range(3)
+        ])
+        await asyncio.sleep(0.1)
+        return (
+            await harness.storage.get_state(harness.key()),
+            await harness.storage.get_data(harness.key()),
+        )
+
+    state, data = asyncio.run(scenario())
+    assert state == RequestForm.choosing_options.state
+    assert data["screenshots"] == ["f0", "f1", "f2"]
+    # Клавиатура опций — одна на весь альбом
+    assert harness.session.calls["SendMessage"] == 1
+
+
+def test_double_confirm_saves_and_notifies_once(harness, monkeypatch):
+    saved = {}
+    save_calls = []
+
+    async def fake_save_request(conn, bot_id, user_id, request_type, screenshots, options, idempotency_key=None):
+        save_calls.append(idempotency_key)
+        if idempotency_key in saved:
+            return saved[idempotency_key], False
+        saved[idempotency_key] = len(saved) + 1
+        return saved[idempotency_key], True
+
+    monkeypatch.setattr(user_handlers, "save_request", fake_save_request)
+
+    async def scenario():
+        await harness.storage.set_state(harness.key(), RequestForm.choosing_options)
+        await harness.storage.set_data(harness.key(), {
+            "request_type": "🏢 Офис", "draft_key": "draft", "screenshots": [], "options": ["transport"],
+        })
+        # Двойное нажатие: оба callback приходят одной пачкой
+        await harness.feed(harness.callback("confirm"), harness.callback("confirm"))
+        return (
+            await harness.storage.get_state(harness.key()),
+            await harness.storage.get_data(harness.key()),
+        )
+
+    state, data = asyncio.run(scenario())
+    assert len(saved) == 1
+    assert save_calls == ["draft"]
+    assert len(harness.notifier.notifications) == 1
+    assert state is None
+    assert data["submitted_request_id"] == 1
+
+
+def _requests_page(count: int, newest_id: int) -> list:
+    return [
+        {"id": request_id, "request_type": "🏢 Офис", "options": "a", "created_at": datetime(2026, 10, 1, 12, request_id)}
+        for request_id in range(newest_id, newest_id - count, -1)
+    ]
+
+
+def test_short_newer_page_falls_back_to_first_page(monkeypatch):
+    calls = []
+
+    async def get_user_requests(conn, bot_id, user_id, limit, cursor=None, newer=False):
+        calls.append((cursor, newer))
+        # Новее курсора всего две заявки; первая страница — полная
+        return _requests_page(2, 20) if cursor else _requests_page(limit + 1, 20)
+
+    monkeypatch.setattr(user_handlers, "get_user_requests", get_user_requests)
+    text, _ = asyncio.run(user_handlers._render_my_requests(None, 42, 1001, (datetime(2026, 10, 1), 18), newer=True))
+
+    assert calls[-1] == (None, False)
+    assert text.count("№") == user_handlers.MY_REQUESTS_PER_PAGE
+
+
+def test_empty_cursor_page_falls_back_to_first_page(monkeypatch):
+    async def get_user_requests(conn, bot_id, user_id, limit, cursor=None, newer=False):
+        return [] if cursor else _requests_page(3, 3)
+
+    monkeypatch.setattr(user_handlers, "get_user_requests", get_user_requests)
+    text, _ = asyncio.run(user_handlers._render_my_requests(None, 42, 1001, (datetime(2020, 1, 1), 1)))
+
+    assert text.count("№") == 3
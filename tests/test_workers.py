@@ -0,0 +1,23 @@
+from src.workers import merge_stats, route_update
+
+
+def test_merge_stats_sums_counters_and_unions_sections():
+    merged = merge_stats([
+        {"bots": {"42": {"updates": 3, "avg_handling_ms": 2.0}}, "max_wait_ms": 10, "broadcasts": {1: {"sent": 5}}},
+        {"bots": {"42": {"updates": 1, "avg_handling_ms": 4.0}}, "max_wait_ms": 30, "broadcasts": {2: {"sent": 7}}},
+    ])
+
+    assert merged == {
+        "bots": {"42": {"updates": 4, "avg_handling_ms": 3.0}},
+        "max_wait_ms": 30,
+        "broadcasts": {1: {"sent": 5}, 2: {"sent": 7}},
+    }
+
+
+def test_updates_of_one_chat_go_to_one_worker():
+    updates = [
+        {"update_id": 1, "message": {"chat": {"id": 1001}, "from": {"id": 1001}}},
+        {"update_id": 2, "callback_query": {"from": {"id": 1001}, "message": {"chat": {"id": 1001}}}},
+    ]
+
+    assert {route_update(update, 4) for update in updates} == {1001 % 4}